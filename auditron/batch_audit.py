@@ -0,0 +1,75 @@
+# batch_audit.py
+"""
+Runs audits for many tenants from the command line, e.g. for nightly fleet audits.
+
+The input file holds one {"user_id": ..., "controls": [...]} object per line (or a JSON array of them).
+Results are written as NDJSON, one line per (user_id, provider), as soon as each one finishes.
+
+    python batch_audit.py tenants.jsonl -o results.ndjson
+"""
+import argparse
+import asyncio
+import json
+import sys
+from dotenv import load_dotenv
+
+from models import AuditOptions, BatchAuditItem
+from services.batch_service import (
+    stream_batch_ndjson,
+    BATCH_CONCURRENCY,
+    BATCH_TENANT_CONCURRENCY,
+    BATCH_ACCOUNT_CONCURRENCY,
+)
+
+
+def load_items(path: str):
+    with open(path) as f:
+        content = f.read().strip()
+    if content.startswith("["):
+        records = json.loads(content)
+    else:
+        records = [json.loads(line) for line in content.splitlines() if line.strip()]
+    return [BatchAuditItem(**record) for record in records]
+
+
+async def run(args):
+    items = load_items(args.input)
+    # Evidence ids would point into this process's evidence store, gone once it exits, so findings are written in full.
+    options = AuditOptions(max_concurrency=args.max_concurrency, force_refresh=args.force_refresh, full_evidence=True)
+    # Lines come already encoded as UTF-8 JSON.
+    output = open(args.output, "wb") if args.output else sys.stdout.buffer
+    written = 0
+    try:
+        async for line in stream_batch_ndjson(
+            items,
+            options,
+            concurrency=args.concurrency,
+            tenant_concurrency=args.tenant_concurrency,
+            account_concurrency=args.account_concurrency,
+        ):
+            output.write(line)
+            output.flush()
+            written += 1
+    finally:
+        if output is not sys.stdout.buffer:
+            output.close()
+    print(f"Audited {len(items)} tenant request(s), wrote {written} result line(s).", file=sys.stderr)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Audit many tenants with fair scheduling and write NDJSON results.")
+    parser.add_argument("input", help="JSONL file (or JSON array) of {user_id, controls} objects")
+    parser.add_argument("-o", "--output", help="NDJSON output file (default: stdout)")
+    parser.add_argument("--concurrency", type=int, default=BATCH_CONCURRENCY, help="Provider audits running at once across the batch")
+    parser.add_argument("--tenant-concurrency", type=int, default=BATCH_TENANT_CONCURRENCY, help="Provider audits running at once per tenant")
+    parser.add_argument("--account-concurrency", type=int, default=BATCH_ACCOUNT_CONCURRENCY, help="Provider audits running at once per cloud account")
+    parser.add_argument("--max-concurrency", type=int, default=None, help="Controls running at once within one provider audit")
+    parser.add_argument("--force-refresh", action="store_true", help="Ignore cached results")
+    args = parser.parse_args()
+
+    load_dotenv()
+    asyncio.run(run(args))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,7 @@
+"""
+Offline benchmarks for Auditron. They run against in-process fake cloud clients, so no
+credentials or network access are needed. Run them from the auditron/ directory, e.g.
+
+    python -m benchmarks.control_benchmark --sizes 10 1000 50000 --latency-ms 5
+    python -m benchmarks.import_benchmark --budget-ms 800
+"""
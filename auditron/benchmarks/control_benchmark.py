@@ -0,0 +1,169 @@
+# benchmarks/control_benchmark.py
+"""
+Runs every control in SUPPORTED_CONTROLS against synthetic accounts of increasing size and reports,
+per control: wall time, fake API calls, peak Python memory and the size of the serialized result.
+One "<provider>:audit" row per provider runs all of its controls together through run_audit(),
+which measures concurrency and shared-inventory gains as well.
+
+    python -m benchmarks.control_benchmark --sizes 10 1000 --latency-ms 2
+    python -m benchmarks.control_benchmark --json baseline.json
+    python -m benchmarks.control_benchmark --baseline baseline.json   # exits 1 on regressions
+
+Wall time is measured without tracemalloc. Peak memory comes from a second, traced run
+(use --no-memory to skip it).
+"""
+import argparse
+import asyncio
+import fnmatch
+import json
+import os
+import sys
+import time
+import tracemalloc
+from typing import Dict, List, Optional
+
+# The real token buckets run for every fake call. Unless the environment sets a rate, they never
+# pace the calls, so the timings measure the checks rather than the configured request rate.
+os.environ.setdefault("AUDITRON_RATE_LIMIT_RPS", "1e9")
+os.environ.setdefault("AUDITRON_RATE_LIMIT_BURST", "1e9")
+
+from benchmarks.fakes import CallRecorder, SyntheticAccount, fake_clouds
+from controls import SUPPORTED_CONTROLS
+from models import AuditOptions
+from services.audit_service_new import _execute_control, control_provider, provider_credentials, run_audit
+from services.inventory_service import ResourceInventory
+
+DEFAULT_SIZES = [10, 1000, 50000]
+# Deadlines are lifted so large synthetic accounts finish instead of returning TIMEOUT.
+NO_DEADLINE = 7 * 24 * 3600
+
+CREDENTIALS_DATA = {
+    "aws_credentials": {"access_key_id": "benchmark", "secret_access_key": "benchmark", "region": "us-east-1"},
+    "azure_credentials": {"tenant_id": "benchmark", "client_id": "benchmark", "client_secret": "benchmark", "subscription_id": "bench"},
+    "gcp_credentials": {"service_account_json": {"project_id": "bench-project", "client_email": "benchmark@bench-project.iam"}},
+}
+
+
+def _measure(run, recorder: CallRecorder, trace_memory: bool) -> dict:
+    """Runs `run` once for wall time and API calls, then once more under tracemalloc for peak memory."""
+    calls_before = recorder.total
+    started = time.perf_counter()
+    response = run()
+    wall = time.perf_counter() - started
+    calls = recorder.total - calls_before
+
+    peak = None
+    if trace_memory:
+        tracemalloc.start()
+        try:
+            run()
+            peak = tracemalloc.get_traced_memory()[1]
+        finally:
+            tracemalloc.stop()
+
+    return {
+        "wall_seconds": round(wall, 4),
+        "api_calls": calls,
+        "peak_memory_bytes": peak,
+        "response_bytes": len(response.model_dump_json()),
+        "status": getattr(response, "status", None),
+    }
+
+
+def benchmark_size(size: int, control_ids: List[str], latency: float, trace_memory: bool, audits: bool) -> List[dict]:
+    account = SyntheticAccount(size)
+    recorder = CallRecorder(latency)
+    rows = []
+    with fake_clouds(account, recorder):
+        for control_id in control_ids:
+            provider = control_provider(control_id)
+            credentials = provider_credentials(provider, CREDENTIALS_DATA)
+            run = lambda: asyncio.run(_execute_control(provider, control_id, credentials, ResourceInventory(), None, NO_DEADLINE))
+            rows.append({"size": size, "control_id": control_id, **_measure(run, recorder, trace_memory)})
+
+        if audits:
+            options = AuditOptions(force_refresh=True, control_timeout=NO_DEADLINE, audit_timeout=NO_DEADLINE)
+            providers: Dict[str, List[str]] = {}
+            for control_id in control_ids:
+                providers.setdefault(control_provider(control_id), []).append(control_id)
+            for provider, ids in providers.items():
+                run = lambda: asyncio.run(run_audit(provider, ids, "benchmark", options, CREDENTIALS_DATA))
+                rows.append({"size": size, "control_id": f"{provider}:audit", **_measure(run, recorder, trace_memory)})
+    return rows
+
+
+def print_table(rows: List[dict], out=sys.stdout):
+    header = f"{'size':>7}  {'control':<36} {'status':<8} {'wall s':>9} {'api calls':>10} {'peak MiB':>9} {'resp KiB':>9}"
+    print(header, file=out)
+    print("-" * len(header), file=out)
+    for row in rows:
+        peak = "-" if row["peak_memory_bytes"] is None else f"{row['peak_memory_bytes'] / 2**20:.2f}"
+        print(f"{row['size']:>7}  {row['control_id']:<36} {row['status'] or '':<8} {row['wall_seconds']:>9.3f} "
+              f"{row['api_calls']:>10} {peak:>9} {row['response_bytes'] / 1024:>9.1f}", file=out)
+
+
+def compare(rows: List[dict], baseline_rows: List[dict], tolerance: float, min_seconds: float) -> List[str]:
+    """
+    Regressions against a baseline run: more API calls at all, or wall time / peak memory above
+    baseline * tolerance. Wall times under min_seconds are ignored as noise.
+    """
+    baseline = {(row["size"], row["control_id"]): row for row in baseline_rows}
+    regressions = []
+    for row in rows:
+        before = baseline.get((row["size"], row["control_id"]))
+        if before is None:
+            continue
+        name = f"{row['control_id']} @ {row['size']}"
+        if row["api_calls"] > before["api_calls"]:
+            regressions.append(f"{name}: api calls {before['api_calls']} -> {row['api_calls']}")
+        if row["wall_seconds"] > max(before["wall_seconds"] * tolerance, min_seconds):
+            regressions.append(f"{name}: wall time {before['wall_seconds']:.3f}s -> {row['wall_seconds']:.3f}s")
+        if row["peak_memory_bytes"] and before.get("peak_memory_bytes") and \
+                row["peak_memory_bytes"] > before["peak_memory_bytes"] * tolerance:
+            regressions.append(f"{name}: peak memory {before['peak_memory_bytes']} -> {row['peak_memory_bytes']} bytes")
+    return regressions
+
+
+def select_controls(patterns: Optional[List[str]]) -> List[str]:
+    if not patterns:
+        return list(SUPPORTED_CONTROLS)
+    return [control_id for control_id in SUPPORTED_CONTROLS if any(fnmatch.fnmatch(control_id, p) for p in patterns)]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark every control against synthetic accounts.")
+    parser.add_argument("--sizes", type=int, nargs="+", default=DEFAULT_SIZES, help="Resources of each kind per synthetic account.")
+    parser.add_argument("--controls", nargs="+", help="Control IDs or glob patterns, e.g. 'AWS-*' (default: all).")
+    parser.add_argument("--latency-ms", type=float, default=0.0, help="Latency added to every fake API call.")
+    parser.add_argument("--no-memory", action="store_true", help="Skip the tracemalloc run for peak memory.")
+    parser.add_argument("--no-audit", action="store_true", help="Skip the per-provider run_audit() rows.")
+    parser.add_argument("--json", dest="json_path", help="Also write the results to this JSON file.")
+    parser.add_argument("--baseline", help="JSON results of an earlier run to check for regressions.")
+    parser.add_argument("--tolerance", type=float, default=1.25, help="Allowed slowdown/memory growth factor vs the baseline.")
+    parser.add_argument("--min-seconds", type=float, default=0.05, help="Wall times below this never count as regressions.")
+    args = parser.parse_args()
+
+    control_ids = select_controls(args.controls)
+    if not control_ids:
+        parser.error("No controls match --controls.")
+
+    rows = []
+    for size in args.sizes:
+        rows.extend(benchmark_size(size, control_ids, args.latency_ms / 1000, not args.no_memory, not args.no_audit))
+    print_table(rows)
+
+    if args.json_path:
+        with open(args.json_path, "w") as f:
+            json.dump({"latency_ms": args.latency_ms, "results": rows}, f, indent=2)
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            regressions = compare(rows, json.load(f)["results"], args.tolerance, args.min_seconds)
+        for regression in regressions:
+            print(f"REGRESSION {regression}", file=sys.stderr)
+        if regressions:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
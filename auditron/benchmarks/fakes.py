@@ -0,0 +1,473 @@
+# benchmarks/fakes.py
+"""
+In-process stand-ins for the AWS, Azure and GCP APIs the checks use, backed by a synthetic
+account of a given size. Every fake API call (and every page of a paginated list) is counted
+and can be slowed down by a fixed latency to model network round trips.
+"""
+import csv
+import io
+import threading
+import time
+from collections import Counter
+from contextlib import ExitStack, contextmanager
+from functools import cached_property, lru_cache
+from types import SimpleNamespace
+from typing import Optional
+from unittest import mock
+import botocore.handlers
+import botocore.session
+from botocore import xform_name
+from botocore.awsrequest import AWSResponse
+from botocore.exceptions import ClientError
+from botocore.httpsession import URLLib3Session
+
+# Items per page for the AWS operations the fake truncates, matching the service defaults. Other
+# operations answer with every item, as the checks call some paginated operations directly.
+AWS_PAGE_SIZES = {
+    "describe_volumes": 500,
+    "describe_snapshots": 1000,
+    "describe_security_groups": 1000,
+    "describe_db_instances": 100,
+    "list_users": 100,
+    "list_tables": 100,
+    "list_keys": 100,
+    "list_secrets": 100,
+}
+AZURE_PAGE_SIZE = 1000
+GCP_PAGE_SIZE = 1000
+
+
+class CallRecorder:
+    """Counts fake API calls per "service.operation" and applies the per-call latency."""
+
+    def __init__(self, latency: float = 0.0):
+        self.latency = latency
+        self.calls = Counter()
+        self._lock = threading.Lock()
+
+    def record(self, service: str, operation: str):
+        with self._lock:
+            self.calls[f"{service}.{operation}"] += 1
+        if self.latency:
+            time.sleep(self.latency)
+
+    @property
+    def total(self) -> int:
+        with self._lock:
+            return sum(self.calls.values())
+
+
+def _client_error(code: str, operation: str):
+    return ClientError({"Error": {"Code": code, "Message": code}}, operation)
+
+
+def _index(name: str) -> int:
+    """The synthetic index embedded at the end of a generated resource name."""
+    return int(name.rsplit("-", 1)[-1])
+
+
+class SyntheticAccount:
+    """
+    A fake cloud account with `size` resources of every kind. One in `non_compliant_every`
+    resources fails its control, so both evidence lists are exercised.
+    """
+
+    def __init__(self, size: int, non_compliant_every: int = 10):
+        self.size = size
+        self.every = non_compliant_every
+
+    def _bad(self, index: int) -> bool:
+        return index % self.every == 0
+
+    # --- AWS ---
+
+    @cached_property
+    def buckets(self):
+        return [{"Name": f"bucket-{i}"} for i in range(self.size)]
+
+    @cached_property
+    def volumes(self):
+        return [{"VolumeId": f"vol-{i}", "Encrypted": not self._bad(i)} for i in range(self.size)]
+
+    @cached_property
+    def snapshots(self):
+        return [{"SnapshotId": f"snap-{i}"} for i in range(self.size)]
+
+    @cached_property
+    def security_groups(self):
+        groups = []
+        for i in range(self.size):
+            cidr = "0.0.0.0/0" if self._bad(i) else "10.0.0.0/8"
+            groups.append({
+                "GroupId": f"sg-{i}",
+                "GroupName": f"group-{i}",
+                "IpPermissions": [{"IpProtocol": "tcp", "FromPort": 22, "ToPort": 22, "IpRanges": [{"CidrIp": cidr}]}],
+            })
+        return groups
+
+    @cached_property
+    def db_instances(self):
+        return [
+            {"DBInstanceIdentifier": f"db-{i}", "PubliclyAccessible": self._bad(i), "StorageEncrypted": not self._bad(i)}
+            for i in range(self.size)
+        ]
+
+    @cached_property
+    def iam_users(self):
+        return [{"UserName": f"user-{i}", "Arn": f"arn:aws:iam::000000000000:user/user-{i}"} for i in range(self.size)]
+
+    @cached_property
+    def credential_report(self) -> bytes:
+        out = io.StringIO()
+        writer = csv.writer(out)
+        writer.writerow(["user", "arn", "password_enabled", "password_last_used", "mfa_active",
+                         "access_key_1_active", "access_key_2_active"])
+        writer.writerow(["<root_account>", "arn:aws:iam::000000000000:root", "not_supported", "N/A", "true", "false", "false"])
+        for i, user in enumerate(self.iam_users):
+            writer.writerow([user["UserName"], user["Arn"], "true" if i % 2 == 0 else "false", "N/A",
+                             "false" if self._bad(i) else "true", "true", "false"])
+        return out.getvalue().encode()
+
+    def aws_s3_list_buckets(self, **kwargs):
+        return {"Buckets": self.buckets}
+
+    def aws_s3_get_public_access_block(self, Bucket, **kwargs):
+        if self._bad(_index(Bucket)):
+            raise _client_error("NoSuchPublicAccessBlockConfiguration", "GetPublicAccessBlock")
+        return {"PublicAccessBlockConfiguration": {
+            "BlockPublicAcls": True, "IgnorePublicAcls": True, "BlockPublicPolicy": True, "RestrictPublicBuckets": True,
+        }}
+
+    def aws_ec2_describe_regions(self, **kwargs):
+        return {"Regions": [{"RegionName": "us-east-1"}]}
+
+    def aws_ec2_describe_volumes(self, **kwargs):
+        return {"Volumes": self.volumes}
+
+    def aws_ec2_describe_snapshots(self, RestorableByUserIds=None, **kwargs):
+        if RestorableByUserIds:
+            return {"Snapshots": [s for s in self.snapshots if self._bad(_index(s["SnapshotId"]))]}
+        return {"Snapshots": self.snapshots}
+
+    def aws_ec2_describe_snapshot_attribute(self, SnapshotId, **kwargs):
+        permissions = [{"Group": "all"}] if self._bad(_index(SnapshotId)) else []
+        return {"SnapshotId": SnapshotId, "CreateVolumePermissions": permissions}
+
+    def aws_ec2_describe_security_groups(self, **kwargs):
+        return {"SecurityGroups": self.security_groups}
+
+    def aws_efs_describe_file_systems(self, **kwargs):
+        return {"FileSystems": [{"FileSystemId": f"fs-{i}"} for i in range(self.size)]}
+
+    def aws_efs_describe_file_system_policy(self, FileSystemId, **kwargs):
+        if self._bad(_index(FileSystemId)):
+            raise _client_error("PolicyNotFound", "DescribeFileSystemPolicy")
+        return {"Policy": '{"Statement": [{"Effect": "Deny", "Condition": {"Bool": {"aws:SecureTransport": "false"}}}]}'}
+
+    def aws_rds_describe_db_instances(self, **kwargs):
+        return {"DBInstances": self.db_instances}
+
+    def aws_dynamodb_list_tables(self, **kwargs):
+        return {"TableNames": [f"table-{i}" for i in range(self.size)]}
+
+    def aws_dynamodb_describe_continuous_backups(self, TableName, **kwargs):
+        status = "DISABLED" if self._bad(_index(TableName)) else "ENABLED"
+        return {"ContinuousBackupsDescription": {"PointInTimeRecoveryDescription": {"PointInTimeRecoveryStatus": status}}}
+
+    def aws_iam_list_users(self, **kwargs):
+        return {"Users": self.iam_users}
+
+    def aws_iam_generate_credential_report(self, **kwargs):
+        return {"State": "COMPLETE"}
+
+    def aws_iam_get_credential_report(self, **kwargs):
+        return {"Content": self.credential_report, "ReportFormat": "text/csv"}
+
+    def aws_iam_get_login_profile(self, UserName, **kwargs):
+        if _index(UserName) % 2:
+            raise _client_error("NoSuchEntity", "GetLoginProfile")
+        return {"LoginProfile": {"UserName": UserName}}
+
+    def aws_iam_list_mfa_devices(self, UserName, **kwargs):
+        return {"MFADevices": [] if self._bad(_index(UserName)) else [{"SerialNumber": f"mfa-{UserName}"}]}
+
+    def aws_iam_get_account_summary(self, **kwargs):
+        return {"SummaryMap": {"AccountMFAEnabled": 1}}
+
+    def aws_kms_list_keys(self, **kwargs):
+        return {"Keys": [{"KeyId": f"key-{i}"} for i in range(self.size)]}
+
+    def aws_kms_describe_key(self, KeyId, **kwargs):
+        # One key in five is AWS managed and skipped by the check.
+        manager = "AWS" if _index(KeyId) % 5 == 4 else "CUSTOMER"
+        return {"KeyMetadata": {"KeyId": KeyId, "Arn": f"arn:aws:kms:us-east-1:000000000000:key/{KeyId}", "KeyManager": manager}}
+
+    def aws_kms_get_key_rotation_status(self, KeyId, **kwargs):
+        return {"KeyRotationEnabled": not self._bad(_index(KeyId))}
+
+    def aws_cloudtrail_describe_trails(self, **kwargs):
+        # CloudTrail allows only a handful of trails per region, whatever the account size.
+        return {"trailList": [{"TrailARN": f"arn:aws:cloudtrail:us-east-1:000000000000:trail/trail-{i}",
+                               "IsMultiRegionTrail": True} for i in range(min(self.size, 5))]}
+
+    def aws_cloudtrail_get_trail_status(self, Name, **kwargs):
+        return {"IsLogging": not self._bad(_index(Name))}
+
+    def aws_config_describe_configuration_recorders(self, **kwargs):
+        return {"ConfigurationRecorders": [{"name": "default", "recordingGroup": {"allSupported": True}}]}
+
+    def aws_guardduty_list_detectors(self, **kwargs):
+        return {"DetectorIds": ["detector-0"]}
+
+    def aws_secretsmanager_list_secrets(self, **kwargs):
+        return {"SecretList": [{"ARN": f"arn:aws:secretsmanager:us-east-1:000000000000:secret:secret-{i}"} for i in range(self.size)]}
+
+    def aws_secretsmanager_describe_secret(self, SecretId, **kwargs):
+        return {"ARN": SecretId, "RotationEnabled": not self._bad(_index(SecretId))}
+
+    # --- Azure ---
+
+    def _resource_id(self, provider: str, kind: str, name: str, index: int) -> str:
+        return f"/subscriptions/bench/resourceGroups/rg-{index % 20}/providers/{provider}/{kind}/{name}"
+
+    @cached_property
+    def sql_servers(self):
+        count = max(1, self.size // 50)
+        return [SimpleNamespace(name=f"sqlserver-{i}", id=self._resource_id("Microsoft.Sql", "servers", f"sqlserver-{i}", i))
+                for i in range(count)]
+
+    def azure_storage_accounts_list(self):
+        return [
+            SimpleNamespace(name=f"account-{i}", enable_https_traffic_only=not self._bad(i),
+                            id=self._resource_id("Microsoft.Storage", "storageAccounts", f"account-{i}", i))
+            for i in range(self.size)
+        ]
+
+    def azure_blob_containers_list(self, resource_group_name, account_name):
+        public = self._bad(_index(account_name))
+        return [SimpleNamespace(name="logs", public_access="Blob" if public else "None"),
+                SimpleNamespace(name="data", public_access="None")]
+
+    def azure_servers_list(self):
+        return self.sql_servers
+
+    def azure_databases_list_by_server(self, resource_group_name, server_name):
+        servers = len(self.sql_servers)
+        server = _index(server_name)
+        return [SimpleNamespace(name=f"db-{i}") for i in range(server, self.size, servers)]
+
+    def azure_transparent_data_encryptions_get(self, resource_group_name, server_name, database_name, name):
+        return SimpleNamespace(status="Disabled" if self._bad(_index(database_name)) else "Enabled")
+
+    def azure_network_security_groups_list_all(self):
+        groups = []
+        for i in range(self.size):
+            source = "*" if self._bad(i) else "10.0.0.0/8"
+            rule = SimpleNamespace(name="rdp", direction="Inbound", protocol="TCP", destination_port_range="3389",
+                                   source_address_prefix=source)
+            groups.append(SimpleNamespace(name=f"nsg-{i}", security_rules=[rule]))
+        return groups
+
+    def azure_diagnostic_settings_list(self, resource_uri):
+        logs = [SimpleNamespace(category=c, enabled=True) for c in ("Administrative", "Security", "Policy", "Alert")]
+        return [SimpleNamespace(name="activity-log", logs=logs, storage_account_id="storage", workspace_id=None)]
+
+    def azure_pricings_list(self, scope):
+        return [SimpleNamespace(name="VirtualMachines", pricing_tier="Standard")]
+
+    # --- GCP ---
+
+    def gcp_buckets(self):
+        return [f"gcs-bucket-{i}" for i in range(self.size)]
+
+    def gcp_bucket_policy(self, bucket_name):
+        members = ["allUsers"] if self._bad(_index(bucket_name)) else ["projectViewer:bench-project"]
+        return SimpleNamespace(bindings=[{"role": "roles/storage.objectViewer", "members": members}])
+
+
+# --- Fake Clients ---
+
+class _Body:
+    """The raw stream of a fake HTTP response."""
+
+    def __init__(self, content: bytes):
+        self._content = content
+
+    def stream(self, **kwargs):
+        yield self._content
+
+
+@lru_cache(maxsize=None)
+def _paginator_config(service_name: str, operation_name: str) -> dict:
+    return _botocore_session().get_paginator_model(service_name).get_paginator(operation_name)
+
+
+@lru_cache(maxsize=1)
+def _botocore_session():
+    return botocore.session.get_session()
+
+
+class FakeAWSService:
+    """
+    Answers AWS API calls from a SyntheticAccount (methods named aws_<service>_<operation>) behind
+    botocore's HTTP session, so real pooled clients, their retry handling and every event hook
+    (rate control, metrics, tracing) run for each call. Operations in AWS_PAGE_SIZES are truncated
+    to pages with the pagination tokens from botocore's paginator model.
+    """
+
+    def __init__(self, account: SyntheticAccount, recorder: CallRecorder):
+        self._account = account
+        self._recorder = recorder
+
+    def answer(self, model, params: dict):
+        """The HTTP status and parsed response for one attempt of an API call."""
+        service, operation = model.service_model.service_name, xform_name(model.name)
+        handler = getattr(self._account, f"aws_{service}_{operation}", None)
+        if handler is None:
+            raise NotImplementedError(f"The benchmark account does not implement {service}.{operation}.")
+        self._recorder.record(service, operation)
+        try:
+            response = handler(**params)
+        except ClientError as error:
+            return 400, error.response
+        if operation in AWS_PAGE_SIZES:
+            response = self._page(model, params, response, AWS_PAGE_SIZES[operation])
+        return 200, response
+
+    @staticmethod
+    def _page(model, params: dict, response: dict, page_size: int) -> dict:
+        config = _paginator_config(model.service_model.service_name, model.name)
+        token = params.get(config["input_token"])
+        start = _index(token) if token else 0
+        end = start + (params.get(config.get("limit_key")) or page_size)
+        items = response[config["result_key"]]
+        page = {**response, config["result_key"]: items[start:end]}
+        if end < len(items):
+            page[config["output_token"]] = f"token-{end}"
+            if "more_results" in config:
+                page[config["more_results"]] = True
+        return page
+
+
+# The call being made on each worker thread: its operation and parameters, then its parsed answer.
+_aws_calls = threading.local()
+_aws_service: Optional[FakeAWSService] = None
+
+
+def _stash_call(params, model, **kwargs):
+    # Pooled clients outlive a fake_clouds() block, so the handlers look up the active fake per call.
+    _aws_calls.call = (model, dict(params))
+
+
+def _wire_body(model, status: int) -> bytes:
+    """The smallest body botocore's parser accepts for the protocol; the answer is merged in after parsing."""
+    protocol = model.service_model.protocol
+    if protocol in ("json", "rest-json"):
+        return b""
+    if protocol == "query" and status == 200:
+        return f"<{model.name}Response><{model.name}Result/></{model.name}Response>".encode()
+    return b"<Response/>"
+
+
+def _send(http_session, request):
+    model, params = _aws_calls.call
+    status, _aws_calls.parsed = _aws_service.answer(model, params)
+    return AWSResponse(request.url, status, {}, _Body(_wire_body(model, status)))
+
+
+def _merge_answer(customized_response_dict, **kwargs):
+    parsed = getattr(_aws_calls, "parsed", None)
+    if parsed is not None:
+        _aws_calls.parsed = None
+        customized_response_dict.update(parsed)
+
+
+class _FakeAzureOperations:
+    def __init__(self, group: str, account: SyntheticAccount, recorder: CallRecorder):
+        self._group = group
+        self._account = account
+        self._recorder = recorder
+
+    def __getattr__(self, operation: str):
+        if operation.startswith("_"):
+            raise AttributeError(operation)
+        handler = getattr(self._account, f"azure_{self._group}_{operation}")
+        recorder, group = self._recorder, self._group
+
+        if operation.startswith("list"):
+            def list_pages(*args, **kwargs):
+                # Paged like azure.core's ItemPaged: one request per page, fetched as it is iterated.
+                items = handler(*args, **kwargs)
+                for start in range(0, max(len(items), 1), AZURE_PAGE_SIZE):
+                    recorder.record(group, operation)
+                    yield from items[start:start + AZURE_PAGE_SIZE]
+            return list_pages
+
+        def call(*args, **kwargs):
+            recorder.record(group, operation)
+            return handler(*args, **kwargs)
+        return call
+
+
+class FakeAzureClient:
+    """Stands in for any azure-mgmt client; operation groups resolve to azure_<group>_<operation>."""
+
+    def __init__(self, account: SyntheticAccount, recorder: CallRecorder):
+        self._account = account
+        self._recorder = recorder
+
+    def __getattr__(self, group: str):
+        if group.startswith("_"):
+            raise AttributeError(group)
+        return _FakeAzureOperations(group, self._account, self._recorder)
+
+
+class FakeGCPBucket:
+    def __init__(self, name: str, account: SyntheticAccount, recorder: CallRecorder):
+        self.name = name
+        self._account = account
+        self._recorder = recorder
+
+    def get_iam_policy(self, requested_policy_version=None):
+        self._recorder.record("storage", "get_iam_policy")
+        return self._account.gcp_bucket_policy(self.name)
+
+
+class FakeGCPClient:
+    project = "bench-project"
+
+    def __init__(self, account: SyntheticAccount, recorder: CallRecorder):
+        self._account = account
+        self._recorder = recorder
+
+    def list_buckets(self):
+        names = self._account.gcp_buckets()
+        for start in range(0, max(len(names), 1), GCP_PAGE_SIZE):
+            self._recorder.record("storage", "list_buckets")
+            for name in names[start:start + GCP_PAGE_SIZE]:
+                yield FakeGCPBucket(name, self._account, self._recorder)
+
+
+@contextmanager
+def fake_clouds(account: SyntheticAccount, recorder: CallRecorder):
+    """
+    Serves every provider from `account` while active. AWS is faked at botocore's HTTP session, so the
+    real client pool and token buckets are measured; the Azure and GCP fakes replace their clients.
+    """
+    from services import azure_service, gcp_service
+
+    with ExitStack() as stack:
+        stack.enter_context(mock.patch(f"{__name__}._aws_service", FakeAWSService(account, recorder)))
+        stack.enter_context(mock.patch.object(URLLib3Session, "send", _send))
+        # Registered on every botocore session built meanwhile, and so on the clients pooled from it.
+        stack.enter_context(mock.patch.object(botocore.handlers, "BUILTIN_HANDLERS", botocore.handlers.BUILTIN_HANDLERS + [
+            ("before-parameter-build", _stash_call),
+            ("before-parse", _merge_answer),
+        ]))
+        stack.enter_context(mock.patch.object(
+            azure_service, "get_azure_credentials", lambda azure_credentials=None: ("fake-credential", "bench")))
+        stack.enter_context(mock.patch.object(
+            azure_service, "get_azure_client", lambda client_class, azure_credentials=None: FakeAzureClient(account, recorder)))
+        stack.enter_context(mock.patch.object(
+            gcp_service, "get_gcp_client", lambda gcp_credentials=None: FakeGCPClient(account, recorder)))
+        yield
@@ -0,0 +1,71 @@
+# benchmarks/import_benchmark.py
+"""
+Measures how long a fresh interpreter takes to import the API (main.py) and checks that no
+cloud SDK is imported on the way: provider modules are loaded only when one of their controls runs.
+
+    python -m benchmarks.import_benchmark
+    python -m benchmarks.import_benchmark --repeat 10 --budget-ms 800   # exits 1 over budget
+
+Each run is a separate process, so nothing is served from an already-populated sys.modules.
+"""
+import argparse
+import json
+import statistics
+import subprocess
+import sys
+from typing import List
+
+# Top-level packages that must not be imported until a control needs them.
+LAZY_PACKAGES = ("boto3", "botocore", "azure", "google", "supabase")
+
+_PROBE = """
+import json, sys, time
+started = time.perf_counter()
+import {module}
+elapsed = time.perf_counter() - started
+from controls import SUPPORTED_CONTROLS
+eager = sorted({{name.split(".")[0] for name in sys.modules}} & set({lazy!r}))
+print(json.dumps({{"seconds": elapsed, "controls": len(SUPPORTED_CONTROLS), "eager_packages": eager}}))
+"""
+
+
+def measure_import(module: str = "main") -> dict:
+    """Imports module in a fresh interpreter and returns its import time and any SDKs it pulled in."""
+    probe = _PROBE.format(module=module, lazy=LAZY_PACKAGES)
+    completed = subprocess.run([sys.executable, "-c", probe], capture_output=True, text=True, check=True)
+    return json.loads(completed.stdout.strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the API's cold import time.")
+    parser.add_argument("--module", default="main", help="Module to import (default: main).")
+    parser.add_argument("--repeat", type=int, default=5, help="Fresh interpreters to measure; the median is reported.")
+    parser.add_argument("--budget-ms", type=float, help="Fail if the median import time exceeds this many milliseconds.")
+    parser.add_argument("--json", dest="json_path", help="Also write the results to this JSON file.")
+    args = parser.parse_args()
+
+    runs: List[dict] = [measure_import(args.module) for _ in range(args.repeat)]
+    median_ms = statistics.median(run["seconds"] for run in runs) * 1000
+    eager = sorted({package for run in runs for package in run["eager_packages"]})
+
+    print(f"import {args.module}: median {median_ms:.1f} ms over {args.repeat} runs "
+          f"(min {min(run['seconds'] for run in runs) * 1000:.1f} ms), {runs[0]['controls']} controls registered")
+    print(f"SDK packages imported at startup: {', '.join(eager) or 'none'}")
+
+    if args.json_path:
+        with open(args.json_path, "w") as f:
+            json.dump({"module": args.module, "median_ms": median_ms, "eager_packages": eager, "runs": runs}, f, indent=2)
+
+    failures = []
+    if eager:
+        failures.append(f"SDK packages imported eagerly: {', '.join(eager)}")
+    if args.budget_ms is not None and median_ms > args.budget_ms:
+        failures.append(f"median import time {median_ms:.1f} ms exceeds the {args.budget_ms:.0f} ms budget")
+    for failure in failures:
+        print(f"REGRESSION {failure}", file=sys.stderr)
+    if failures:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,106 +1,231 @@
+import importlib
+from services.offload_service import make_async
 
+# --- Lazy Provider Modules ---
+# Evidence functions live in one module per provider, and each pulls in its cloud SDK
+# (boto3, google-cloud-storage, the azure-mgmt packages). They are imported the first time
+# one of their controls runs, so the registry below (and /tools) is available at startup.
+PROVIDER_MODULES = {
+    "aws": "services.aws_service",
+    "gcp": "services.gcp_service",
+    "azure": "services.azure_service",
+}
+
+
+def load_provider(provider: str):
+    """Imports a provider's evidence module (and its SDK) on first use and returns it."""
+    return importlib.import_module(PROVIDER_MODULES[provider])
+
+
+def _lazy(provider: str, name: str):
+    """A stand-in for an evidence function that imports its provider module when first called."""
+    def function(*args, **kwargs):
+        return getattr(load_provider(provider), name)(*args, **kwargs)
+    function.__name__ = function.__qualname__ = name
+    return function
 
-# Import all our evidence-gathering functions
-from services.aws_service import *
-from services.gcp_service import *
-from services.azure_service import *
 
 # --- Control Mapping (Our single source of truth) ---
+# "function" is the control's evidence function (imported lazily, see above); "provider" is
+# filled in from the control ID's prefix.
+# "resources" lists the shared resource collections a control reads. Controls that declare
+# them receive the audit's ResourceInventory, so each collection is listed once per run.
+# "scope" is "regional" for AWS checks that fan out across regions in multi-region audits,
+# and "global" for account-wide services (S3, IAM, CloudTrail, and every GCP/Azure check)
+# that are queried only once.
+# "apis" lists the SDK operations a control calls. "cost" is its expected call count: "calls"
+# fixed calls (list calls included), plus "per_resource" calls for each item of the named
+# collections, i.e. the N+1 loops, plus a call for each further "pages" page of a paginated list.
+# The audit planner uses it to start expensive checks first, and dry runs to project an audit's cost.
+# "cache_ttl" overrides how many seconds a cached result stays fresh (AUDITRON_RESULT_TTL by
+# default); account-level settings that rarely change are cached longer.
 
 SUPPORTED_CONTROLS = {
     # AWS Controls
     "AWS-S3-PUBLIC-ACCESS-V1": {
-        "function": check_s3_public_access,
+        "function": _lazy("aws", "check_s3_public_access"),
         "description": "Checks that all S3 buckets block public access.",
+        "scope": "global",
+        "resources": ["aws:s3:buckets"],
+        "apis": ["s3:ListBuckets", "s3:GetPublicAccessBlock"],
+        "cost": {"calls": 1, "per_resource": {"aws:s3:buckets": 1}},
     },
     "AWS-EBS-ENCRYPTION-V1": {
-        "function": check_ebs_encryption,
+        "function": _lazy("aws", "check_ebs_encryption"),
         "description": "Checks that all EBS volumes in the configured region have encryption enabled.",
+        "scope": "regional",
+        "resources": ["aws:ec2:volumes"],
+        "apis": ["ec2:DescribeVolumes"],
+        "cost": {"calls": 1, "pages": {"aws:ec2:volumes": 500}},
     },
     "AWS-EFS-ENCRYPTION-IN-TRANSIT-V1": {
-        "function": check_efs_encryption_in_transit,
+        "function": _lazy("aws", "check_efs_encryption_in_transit"),
         "description": "Checks that all EFS file systems in the configured region enforce encryption in transit.",
+        "scope": "regional",
+        "apis": ["efs:DescribeFileSystems", "efs:DescribeFileSystemPolicy"],
+        "cost": {"calls": 1, "per_resource": {"aws:efs:file_systems": 1}},
     },
     "AWS-RDS-PUBLIC-ACCESS-V1": {
-        "function": check_rds_public_access,
+        "function": _lazy("aws", "check_rds_public_access"),
         "description": "Checks if any RDS database instances are publicly accessible.",
+        "scope": "regional",
+        "resources": ["aws:rds:db_instances"],
+        "apis": ["rds:DescribeDBInstances"],
+        "cost": {"calls": 1, "pages": {"aws:rds:db_instances": 100}},
     },
     "AWS-RDS-STORAGE-ENCRYPTION-V1": {
-        "function": check_rds_storage_encryption,
+        "function": _lazy("aws", "check_rds_storage_encryption"),
         "description": "Checks if all RDS database instances have storage encryption enabled.",
+        "scope": "regional",
+        "resources": ["aws:rds:db_instances"],
+        "apis": ["rds:DescribeDBInstances"],
+        "cost": {"calls": 1, "pages": {"aws:rds:db_instances": 100}},
     },
     "AWS-EBS-SNAPSHOT-PUBLIC-V1": {
-        "function": check_ebs_snapshot_public,
+        "function": _lazy("aws", "check_ebs_snapshot_public"),
         "description": "Checks if any EBS snapshots are publicly shared.",
+        "scope": "regional",
+        "resources": ["aws:ec2:snapshots"],
+        "apis": ["ec2:DescribeSnapshots"],
+        "cost": {"calls": 2, "pages": {"aws:ec2:snapshots": 1000}},
     },
     "AWS-DYNAMODB-PITR-V1": {
-        "function": check_dynamodb_pitr,
+        "function": _lazy("aws", "check_dynamodb_pitr"),
         "description": "Checks if all DynamoDB tables have Point-in-Time Recovery (PITR) enabled.",
+        "scope": "regional",
+        "apis": ["dynamodb:ListTables", "dynamodb:DescribeContinuousBackups"],
+        "cost": {"calls": 1, "per_resource": {"aws:dynamodb:tables": 1}, "pages": {"aws:dynamodb:tables": 100}},
     },
     "AWS-IAM-MFA-CONSOLE-V1": {
-        "function": check_iam_mfa_console,
+        "function": _lazy("aws", "check_iam_mfa_console"),
         "description": "Checks if IAM users with console passwords have MFA enabled.",
+        "scope": "global",
+        "resources": ["aws:iam:credential_report", "aws:iam:users"],
+        "cache_ttl": 900,
+        "apis": ["iam:GenerateCredentialReport", "iam:GetCredentialReport"],
+        "cost": {"calls": 2},
     },
     "AWS-IAM-ROOT-MFA-V1": {
-        "function": check_iam_root_mfa,
+        "function": _lazy("aws", "check_iam_root_mfa"),
         "description": "Checks if the account's root user has MFA enabled.",
+        "scope": "global",
+        "apis": ["iam:GetAccountSummary"],
+        "cost": {"calls": 1},
     },
     "AWS-VPC-SG-RESTRICTED-SSH-V1": {
-        "function": check_vpc_sg_restricted_ssh,
+        "function": _lazy("aws", "check_vpc_sg_restricted_ssh"),
         "description": "Checks for Security Groups allowing unrestricted SSH (0.0.0.0/0) access.",
+        "scope": "regional",
+        "resources": ["aws:ec2:security_groups"],
+        "apis": ["ec2:DescribeSecurityGroups"],
+        "cost": {"calls": 1, "pages": {"aws:ec2:security_groups": 1000}},
     },
     "AWS-KMS-KEY-ROTATION-V1": {
-        "function": check_kms_key_rotation,
+        "function": _lazy("aws", "check_kms_key_rotation"),
         "description": "Checks if customer-managed KMS keys have automatic key rotation enabled.",
+        "scope": "regional",
+        "apis": ["kms:ListKeys", "kms:DescribeKey", "kms:GetKeyRotationStatus"],
+        "cost": {"calls": 1, "per_resource": {"aws:kms:keys": 2}, "pages": {"aws:kms:keys": 100}},
     },
     "AWS-CLOUDTRAIL-ENABLED-V1": {
-        "function": check_cloudtrail_enabled,
+        "function": _lazy("aws", "check_cloudtrail_enabled"),
         "description": "Checks that a multi-region CloudTrail is enabled and logging.",
+        "scope": "global",
+        "cache_ttl": 900,
+        "apis": ["cloudtrail:DescribeTrails", "cloudtrail:GetTrailStatus"],
+        "cost": {"calls": 1, "per_resource": {"aws:cloudtrail:trails": 1}},
     },
     "AWS-CONFIG-ENABLED-V1": {
-        "function": check_config_enabled,
+        "function": _lazy("aws", "check_config_enabled"),
         "description": "Checks that AWS Config is enabled to record all resource changes.",
+        "scope": "regional",
+        "cache_ttl": 900,
+        "apis": ["config:DescribeConfigurationRecorders"],
+        "cost": {"calls": 1},
     },
     "AWS-GUARDDUTY-ENABLED-V1": {
-        "function": check_guardduty_enabled,
+        "function": _lazy("aws", "check_guardduty_enabled"),
         "description": "Checks that GuardDuty is enabled for threat detection.",
+        "scope": "regional",
+        "cache_ttl": 900,
+        "apis": ["guardduty:ListDetectors"],
+        "cost": {"calls": 1},
     },
     "AWS-SECRETSMANAGER-ROTATION-V1": {
-        "function": check_secretsmanager_rotation,
+        "function": _lazy("aws", "check_secretsmanager_rotation"),
         "description": "Checks if secrets are configured for automatic rotation.",
+        "scope": "regional",
+        "apis": ["secretsmanager:ListSecrets", "secretsmanager:DescribeSecret"],
+        "cost": {"calls": 1, "per_resource": {"aws:secretsmanager:secrets": 1}, "pages": {"aws:secretsmanager:secrets": 100}},
     },
     # GCP Controls
     "GCP-STORAGE-PUBLIC-V1": {
-        "function": check_gcp_storage_public,
+        "function": _lazy("gcp", "check_gcp_storage_public"),
         "description": "Checks that all GCP Cloud Storage buckets are not publicly accessible.",
+        "scope": "global",
+        "apis": ["storage:ListBuckets", "storage:GetIamPolicy"],
+        "cost": {"calls": 1, "per_resource": {"gcp:storage:buckets": 1}, "pages": {"gcp:storage:buckets": 1000}},
     },
     # Azure Controls
     "AZURE-STORAGE-PUBLIC-V1": {
-        "function": check_azure_storage_public,
+        "function": _lazy("azure", "check_azure_storage_public"),
         "description": "Checks for publicly accessible Azure Blob Storage containers.",
+        "resources": ["azure:storage:accounts"],
+        "scope": "global",
+        "apis": ["storage:StorageAccounts.List", "storage:BlobContainers.List"],
+        "cost": {"calls": 1, "per_resource": {"azure:storage:accounts": 1}},
     },
     "AZURE-STORAGE-HTTPS-V1": {
-        "function": check_azure_storage_https,
+        "function": _lazy("azure", "check_azure_storage_https"),
         "description": "Checks if Azure Storage Accounts enforce 'Secure transfer required' (HTTPS).",
+        "resources": ["azure:storage:accounts"],
+        "scope": "global",
+        "apis": ["storage:StorageAccounts.List"],
+        "cost": {"calls": 1},
     },
     "AZURE-SQL-TDE-V1": {
-        "function": check_azure_sql_tde,
+        "function": _lazy("azure", "check_azure_sql_tde"),
         "description": "Checks if Azure SQL databases have Transparent Data Encryption (TDE) enabled.",
+        "resources": ["azure:sql:servers"],
+        "scope": "global",
+        "apis": ["sql:Servers.List", "sql:Databases.ListByServer", "sql:TransparentDataEncryptions.Get"],
+        "cost": {"calls": 1, "per_resource": {"azure:sql:servers": 1, "azure:sql:databases": 1}},
     },
     "AZURE-ENTRA-MFA-ADMIN-V1": {
-        "function": check_azure_entra_mfa_admin,
+        "function": _lazy("azure", "check_azure_entra_mfa_admin"),
         "description": "Checks if users with administrative roles have MFA enabled (via Conditional Access).",
+        "scope": "global",
+        "apis": [],
+        "cost": {"calls": 0},
     },
     "AZURE-NSG-RESTRICTED-RDP-V1": {
-        "function": check_azure_nsg_restricted_rdp,
+        "function": _lazy("azure", "check_azure_nsg_restricted_rdp"),
         "description": "Checks for Network Security Groups allowing unrestricted RDP (3389) access.",
+        "resources": ["azure:network:nsgs"],
+        "scope": "global",
+        "apis": ["network:NetworkSecurityGroups.ListAll"],
+        "cost": {"calls": 1},
     },
     "AZURE-MONITOR-LOG-PROFILES-V1": {
-        "function": check_azure_monitor_log_profiles,
+        "function": _lazy("azure", "check_azure_monitor_log_profiles"),
         "description": "Checks that Azure Monitor is configured to export Activity Logs for retention.",
+        "cache_ttl": 900,
+        "scope": "global",
+        "apis": ["monitor:DiagnosticSettings.List"],
+        "cost": {"calls": 1},
     },
     "AZURE-DEFENDER-STANDARD-TIER-V1": {
-        "function": check_azure_defender_standard_tier,
+        "function": _lazy("azure", "check_azure_defender_standard_tier"),
         "description": "Checks that the standard tier of Microsoft Defender for Cloud is enabled.",
+        "cache_ttl": 900,
+        "scope": "global",
+        "apis": ["security:Pricings.List"],
+        "cost": {"calls": 1},
     },
 }
+
+# Async variants of every control, used by the API so SDK calls run off the event loop.
+# The plain "function" entries stay synchronous for the CLI and for tests.
+for _control_id, _control in SUPPORTED_CONTROLS.items():
+    _control["provider"] = _control_id.split("-")[0].lower()
+    _control["async_function"] = make_async(_control["function"])
@@ -1,20 +1,38 @@
-from fastapi import FastAPI
+from contextlib import asynccontextmanager
+from fastapi import FastAPI, HTTPException
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi import Request
-from typing import List
+from fastapi.responses import Response, StreamingResponse
+from typing import List, Optional
 from dotenv import load_dotenv
 
 from controls import SUPPORTED_CONTROLS
 
-from services.audit_service_new import run_audit
+from services.audit_service_new import run_audit, run_multi_provider_audit
+from services.supabase_service import invalidate_user_credentials
+from services.stream_service import stream_audit_events, STREAM_MEDIA_TYPES
+from services.job_service import job_manager, JobQueueFull, SUCCEEDED
+from services.batch_service import stream_batch_ndjson
+from services.metrics_service import metrics_payload
+from services.dry_run_service import plan_audit_dry_run
+from services.evidence_service import get_evidence_page
+from services.serialization_service import dumps
 
 # Import pydantic models
-from models import AuditRequest, AuditResult, AuditResponse, ToolInfo, ToolsResponse
+from models import AuditRequest, AuditResult, AuditResponse, ToolInfo, ToolsResponse, AuditJobRequest, AuditJobStatus, MultiAuditResponse, BatchAuditRequest, AuditPlanResponse, EvidencePage
 
 # Load environment variables from .env file
 load_dotenv()
 
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Requeue or fail the background jobs left behind when this worker last stopped.
+    await job_manager.start()
+    yield
+
+
 app = FastAPI(
+    lifespan=lifespan,
     title="Project Auditron",
     description="An AI Compliance Co-pilot Server for automated, multi-cloud evidence gathering.",
     version="2.0.0",
@@ -45,6 +63,14 @@ async def force_cors_headers(request: Request, call_next):
 
 
 
+def _json_response(model) -> Response:
+    """
+    Encodes a response model with the Rust serializer in one pass. The route's response_model
+    only documents it: FastAPI would otherwise dump, re-validate and re-encode every result.
+    """
+    return Response(content=dumps(model), media_type="application/json")
+
+
 # --- New RESTful API Endpoints ---
 
 
@@ -62,32 +88,162 @@ async def list_tools():
     """
     providers = {"aws": [], "gcp": [], "azure": []}
     for key, value in SUPPORTED_CONTROLS.items():
-        provider = key.split("-")[0].lower()
-        if provider in providers:
-            providers[provider].append(
+        if value["provider"] in providers:
+            providers[value["provider"]].append(
                 ToolInfo(id=key, description=value["description"])
             )
 
     return ToolsResponse(tool_count=len(SUPPORTED_CONTROLS), providers=providers)
 
 
+@app.delete("/credentials/{user_id}/cache", tags=["System"])
+async def invalidate_credentials_cache(user_id: str):
+    """Drops the cached credentials for a user so the next audit reads them from Supabase again."""
+    return {"user_id": user_id, "invalidated": invalidate_user_credentials(user_id)}
+
+
+@app.get("/metrics", tags=["System"])
+async def metrics():
+    """
+    Prometheus metrics for this worker process: control latency, credential-fetch latency,
+    cloud API calls per service/operation, cache hits and misses, in-flight audits and results by status.
+    """
+    payload, content_type = metrics_payload()
+    return Response(content=payload, media_type=content_type)
+
+
+
+@app.post("/audit", response_model=MultiAuditResponse, tags=["Auditing"])
+async def audit_all(request: AuditRequest):
+    """
+    Executes a mixed list of AWS, Azure and GCP controls in one call. Controls are routed by
+    their ID prefix, and the provider groups run concurrently; results are grouped per provider.
+    """
+    return _json_response(await run_multi_provider_audit(request.controls, request.user_id, request))
+
+
+@app.post("/audit/batch", tags=["Auditing"])
+async def audit_batch(request: BatchAuditRequest):
+    """
+    Audits many tenants in one call with fair scheduling (per-tenant and per-cloud-account caps),
+    streaming one NDJSON line per (user_id, provider) as soon as it finishes.
+    """
+    return StreamingResponse(
+        stream_batch_ndjson(request.items, request),
+        media_type="application/x-ndjson",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
 
 @app.post("/audit/aws", response_model=AuditResponse, tags=["Auditing"])
 async def audit_aws(request: AuditRequest):
     """Executes a list of specified audit controls for Amazon Web Services."""
-    return await run_audit("aws", request.controls, request.user_id)
+    return _json_response(await run_audit("aws", request.controls, request.user_id, request))
 
 
 @app.post("/audit/azure", response_model=AuditResponse, tags=["Auditing"])
 async def audit_azure(request: AuditRequest):
     """Executes a list of specified audit controls for Microsoft Azure."""
-    return await run_audit("azure", request.controls, request.user_id)
+    return _json_response(await run_audit("azure", request.controls, request.user_id, request))
 
 
 @app.post("/audit/gcp", response_model=AuditResponse, tags=["Auditing"])
 async def audit_gcp(request: AuditRequest):
     """Executes a list of specified audit controls for Google Cloud Platform."""
-    return await run_audit("gcp", request.controls, request.user_id)
+    return _json_response(await run_audit("gcp", request.controls, request.user_id, request))
+
+
+@app.post("/audit/{provider}/stream", tags=["Auditing"])
+async def audit_stream(provider: str, request: AuditRequest, format: str = "ndjson"):
+    """
+    Executes audit controls for a provider and streams each result as soon as its control finishes,
+    with progress events in between. Use format=ndjson (default) or format=sse for Server-Sent Events.
+    """
+    if provider not in ("aws", "azure", "gcp"):
+        raise HTTPException(status_code=404, detail=f"Unknown provider '{provider}'.")
+    if format not in STREAM_MEDIA_TYPES:
+        raise HTTPException(status_code=400, detail=f"Unsupported stream format '{format}'. Use 'ndjson' or 'sse'.")
+
+    return StreamingResponse(
+        stream_audit_events(provider, request.controls, request.user_id, request, format),
+        media_type=STREAM_MEDIA_TYPES[format],
+        # Keep proxies from buffering the stream
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+@app.post("/audit/{provider}/plan", response_model=AuditPlanResponse, tags=["Auditing"])
+async def audit_plan(provider: str, request: AuditRequest):
+    """
+    Dry run: sizes the account with cheap list calls only and projects each control's API calls,
+    duration and throttling risk, so heavy tenants can be scheduled off-peak before a full audit.
+    """
+    if provider not in ("aws", "azure", "gcp"):
+        raise HTTPException(status_code=404, detail=f"Unknown provider '{provider}'.")
+    return await plan_audit_dry_run(provider, request.controls, request.user_id, request)
+
+
+# --- Background Audit Jobs ---
+
+
+async def _get_job_or_404(job_id: str):
+    job = await job_manager.get(job_id)
+    if not job:
+        raise HTTPException(status_code=404, detail=f"Job '{job_id}' not found.")
+    return job
 
 
+@app.post("/jobs", response_model=AuditJobStatus, status_code=202, tags=["Jobs"])
+async def submit_audit_job(request: AuditJobRequest):
+    """Queues an audit to run in the background and returns its job id immediately."""
+    if request.provider not in ("aws", "azure", "gcp"):
+        raise HTTPException(status_code=400, detail=f"Unknown provider '{request.provider}'.")
+    try:
+        job_id = await job_manager.submit(request.provider, request.controls, request.user_id, request)
+    except JobQueueFull as e:
+        raise HTTPException(status_code=503, detail=str(e))
+    return AuditJobStatus(**await job_manager.get(job_id))
 
+
+@app.get("/jobs/{job_id}", response_model=AuditJobStatus, tags=["Jobs"])
+async def get_audit_job(job_id: str):
+    """Returns the status of a background audit job."""
+    return AuditJobStatus(**await _get_job_or_404(job_id))
+
+
+@app.get("/jobs/{job_id}/result", response_model=AuditResponse, tags=["Jobs"])
+async def get_audit_job_result(job_id: str):
+    """Returns the result of a finished audit job, sent as the JSON it was stored as."""
+    job = await _get_job_or_404(job_id)
+    if job["status"] != SUCCEEDED:
+        raise HTTPException(status_code=409, detail=f"Job '{job_id}' is {job['status']}, no result is available.")
+    return Response(content=job["result"], media_type="application/json")
+
+
+@app.delete("/jobs/{job_id}", response_model=AuditJobStatus, tags=["Jobs"])
+async def cancel_audit_job(job_id: str):
+    """Cancels a queued or running audit job."""
+    await _get_job_or_404(job_id)
+    if not await job_manager.cancel(job_id):
+        raise HTTPException(status_code=409, detail=f"Job '{job_id}' has already finished.")
+    return AuditJobStatus(**await job_manager.get(job_id))
+
+
+# --- Evidence ---
+
+
+@app.get("/evidence/{evidence_id}", response_model=EvidencePage, tags=["Evidence"])
+async def get_evidence(evidence_id: str, cursor: Optional[str] = None, limit: Optional[int] = None, status: str = "all"):
+    """
+    Pages through the full findings of an audit result, using the evidence_id it returned.
+    Pass the response's next_cursor as cursor until it is null; status=non_compliant or compliant filters the findings.
+    Findings are kept in the memory of the worker process that ran the audit, so this endpoint needs a
+    single worker (or sticky routing); other deployments should request full_evidence instead.
+    """
+    try:
+        page = get_evidence_page(evidence_id, cursor, limit, status)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    if page is None:
+        raise HTTPException(status_code=404, detail=f"Evidence '{evidence_id}' not found or expired; run the audit again.")
+    return _json_response(page)
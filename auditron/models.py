@@ -1,5 +1,12 @@
-from pydantic import BaseModel, Field
-from typing import List, Dict, Any, Optional
+import re
+from pydantic import BaseModel, Field, PrivateAttr, field_validator
+from typing import List, Dict, Any, Optional, Tuple
+
+
+# One resource's entry in a control's evidence: the resource's identifier under its own key (bucket_name,
+# volume_id, ...) and "status": "Compliant", or a "reason" when it is not compliant. Findings are plain dicts,
+# the cheapest records to build and to encode, so they are never turned into models.
+Finding = Dict[str, Any]
 
 
 class AWSCredentials(BaseModel):
@@ -19,21 +26,136 @@ class GCPCredentials(BaseModel):
     service_account_json: Dict[str, Any]  # The parsed JSON object
 
 
-class AuditRequest(BaseModel):
+# AWS region names: partition prefix, optional qualifiers and a number, e.g. us-east-1, us-gov-west-1, cn-north-1.
+_AWS_REGION = re.compile(r"^[a-z]{2}(-[a-z]+)+-\d+$")
+
+
+class AuditOptions(BaseModel):
+    max_concurrency: Optional[int] = Field(
+        None, ge=1, description="Maximum number of controls to run at the same time for this request"
+    )
+    regions: Optional[List[str]] = Field(
+        None,
+        example=["us-east-1", "eu-west-1"],
+        description='AWS regions to scan with regional controls; ["all"] scans every enabled region',
+    )
+    max_age: Optional[int] = Field(
+        None, ge=0, description="Accept cached results up to this many seconds old (defaults to each control's TTL)"
+    )
+    force_refresh: bool = Field(False, description="Ignore cached results and query the cloud APIs again")
+    stale_while_revalidate: bool = Field(
+        False, description="Serve an expired cached result immediately and refresh it in the background"
+    )
+    control_timeout: Optional[float] = Field(
+        None, gt=0, description="Seconds each control may run before it returns TIMEOUT with partial evidence"
+    )
+    audit_timeout: Optional[float] = Field(
+        None, gt=0, description="Upper bound in seconds on the whole audit; unfinished controls return TIMEOUT"
+    )
+    debug_trace: bool = Field(
+        False, description="Trace the audit and attach its span tree (Supabase lookup, controls, API calls) to the response"
+    )
+    full_evidence: bool = Field(
+        False, description="Return every finding inline instead of counts, the first page of non-compliant findings and an evidence_id to page the rest (always on for background jobs)"
+    )
+
+    @field_validator("regions")
+    @classmethod
+    def _check_regions(cls, regions: Optional[List[str]]) -> Optional[List[str]]:
+        """Rejects unknown region names and "all" mixed with regions; repeated regions are scanned once."""
+        if regions is None:
+            return None
+        unique = list(dict.fromkeys(region.strip().lower() for region in regions))
+        if "all" in unique:
+            if len(unique) > 1:
+                raise ValueError('"all" cannot be combined with other regions')
+            return unique
+        invalid = [region for region in unique if not _AWS_REGION.match(region)]
+        if invalid:
+            raise ValueError(f"Invalid AWS region name(s): {', '.join(invalid)}")
+        return unique
+
+
+class AuditRequest(AuditOptions):
     controls: List[str] = Field(..., example=["AWS-S3-PUBLIC-ACCESS-V1"])
     user_id: str = Field(..., description="User ID for credential retrieval")
 
 
+class BatchAuditItem(BaseModel):
+    user_id: str
+    controls: List[str] = Field(..., example=["AWS-S3-PUBLIC-ACCESS-V1", "AZURE-STORAGE-HTTPS-V1"])
+
+
+class BatchAuditRequest(AuditOptions):
+    items: List[BatchAuditItem]
+
+
+class AuditJobRequest(AuditRequest):
+    provider: str = Field(..., example="aws", description="Cloud provider to audit: aws, azure or gcp")
+
+
+class AuditJobStatus(BaseModel):
+    job_id: str
+    status: str
+    provider: str
+    created_at: float
+    started_at: Optional[float] = None
+    finished_at: Optional[float] = None
+    error: Optional[str] = None
+
+
 class AuditResult(BaseModel):
     control_id: str
     status: str
     summary: str
     evidence: Any
+    cached: Optional[bool] = None
+    collected_at: Optional[float] = Field(None, description="Unix time the evidence was collected")
+    evidence_age_seconds: Optional[float] = None
+    retries: Optional[int] = Field(None, description="API call retries (throttling and transient errors) made collecting the evidence")
+    # Compliant findings the check gathered, as (region, findings) pairs. FAILURE evidence carries only their
+    # count, so they are never encoded; the evidence store pages them. Cached copies of the result keep them.
+    _compliant_findings: List[Tuple[Optional[str], List[Finding]]] = PrivateAttr(default_factory=list)
 
 
 class AuditResponse(BaseModel):
     provider: str
     results: List[AuditResult]
+    trace: Optional[Dict[str, Any]] = Field(None, description="The audit's span tree, when debug_trace was requested")
+
+
+class MultiAuditResponse(BaseModel):
+    providers: Dict[str, AuditResponse]
+
+
+class ControlPlan(BaseModel):
+    control_id: str
+    scope: Optional[str] = None
+    resource_counts: Dict[str, int] = Field(default_factory=dict, description="Items in each collection the control pages through or loops over")
+    estimated_calls: int = Field(0, description="Projected API calls, list calls included")
+    per_resource_calls: int = Field(0, description="Projected calls made once per resource (the N+1 part of estimated_calls)")
+    estimated_seconds: float = 0.0
+    throttling_risk: str = Field("low", description="low, medium (paced by the rate limiter) or high (likely to hit the deadline)")
+    exceeds_timeout: bool = False
+    error: Optional[str] = None
+
+
+class AuditPlanResponse(BaseModel):
+    provider: str
+    regions: Optional[List[str]] = None
+    controls: List[ControlPlan]
+    estimated_calls: int
+    estimated_seconds: float
+    throttling_risk: str
+
+
+class EvidencePage(BaseModel):
+    evidence_id: str
+    control_id: str
+    status: str = Field(..., description="Findings paged: all (non-compliant first), non_compliant or compliant")
+    total: int = Field(..., description="Findings matching status across all pages")
+    findings: List[Dict[str, Any]]
+    next_cursor: Optional[str] = Field(None, description="Pass as cursor to fetch the next page; null on the last page")
 
 
 class ToolInfo(BaseModel):
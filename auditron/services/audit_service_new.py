@@ -1,103 +1,415 @@
-from typing import List, Optional
-from models import AuditResult, AuditResponse, AWSCredentials, AzureCredentials, GCPCredentials
-from controls import SUPPORTED_CONTROLS
-from services.supabase_service import get_user_credentials
-
-async def run_audit(provider: str, requested_controls: List[str], user_id: str):
-    """A shared helper function to execute audits for a given provider using user credentials from Supabase."""
-    results = []
-    
-    # Fetch user credentials from Supabase
+import asyncio
+import os
+import time
+from typing import Any, AsyncIterator, Dict, List, Optional, Tuple
+from models import AuditOptions, AuditResult, AuditResponse, MultiAuditResponse, AWSCredentials, AzureCredentials, GCPCredentials
+from controls import PROVIDER_MODULES, SUPPORTED_CONTROLS, load_provider
+from services.supabase_service import get_user_credentials, PROVIDERS
+from services.offload_service import offload, MAX_CONTROL_WORKERS
+from services.inventory_service import ResourceInventory
+from services.planner_service import plan_audit
+from services.result_cache_service import get_cached_result, result_cache_key, store_result
+from services.rate_limit_service import track_retries
+from services.evidence_service import page_evidence
+from services.deadline_service import AUDIT_TIMEOUT, CONTROL_TIMEOUT, control_deadline, evidence_region, timeout_result
+from services.metrics_service import audit_in_flight, control_scope, observe_control
+from services.tracing_service import Span, finish_trace, start_trace, traced, use_span
+
+# Default per-request cap, used when the request does not set max_concurrency.
+DEFAULT_REQUEST_CONCURRENCY = int(os.getenv("AUDITRON_REQUEST_CONCURRENCY", "8"))
+# Regions scanned at the same time by one regional control in a multi-region audit.
+REGION_CONCURRENCY = int(os.getenv("AUDITRON_REGION_CONCURRENCY", "8"))
+# Stale-while-revalidate refreshes running at the same time across every audit in this process.
+REVALIDATION_CONCURRENCY = int(os.getenv("AUDITRON_REVALIDATION_CONCURRENCY", "4"))
+
+# Background stale-while-revalidate refreshes, keyed by result cache key so each runs once.
+_revalidations = {}
+# The refreshes' semaphore and the event loop it was created on.
+_revalidation_slots: Optional[Tuple[asyncio.AbstractEventLoop, asyncio.Semaphore]] = None
+
+
+async def _run_across_regions(evidence_function, credentials: AWSCredentials, regions: List[str], kwargs) -> dict:
+    """Runs a regional AWS control in every region concurrently and merges the evidence into one result."""
+    semaphore = asyncio.Semaphore(REGION_CONCURRENCY)
+
+    async def run_region(region: str) -> dict:
+        async with semaphore:
+            try:
+                with traced("region", region=region), evidence_region(region):
+                    return await evidence_function(credentials.model_copy(update={"region": region}), **kwargs)
+            except Exception as e:
+                return {"status": "ERROR", "summary": f"Error executing control: {str(e)}", "evidence": {"error": "execution_failed", "details": str(e)}}
+
+    region_results = await asyncio.gather(*(run_region(region) for region in regions))
+    return load_provider("aws").merge_regional_results(dict(zip(regions, region_results)))
+
+
+async def resolve_regions(credentials, options: AuditOptions) -> Optional[List[str]]:
+    """
+    Returns the regions to fan regional AWS controls out to, or None for a single-region audit.
+    AuditOptions has already deduplicated and checked options.regions, so "all" only ever comes alone.
+    """
+    if not credentials or not options.regions:
+        return None
+    if "all" not in options.regions:
+        return options.regions
     try:
-        credentials_data = get_user_credentials(user_id)
-        print(f"Fetched credentials for user {user_id}: {bool(credentials_data.get(f'{provider}_credentials'))}")
+        return await offload(load_provider("aws").get_enabled_regions, credentials)
     except Exception as e:
-        # If we can't fetch credentials, add error results for all controls
-        for control_id in requested_controls:
-            results.append(
-                AuditResult(
-                    control_id=control_id,
-                    status="ERROR",
-                    summary=f"Failed to retrieve user credentials: {str(e)}",
-                    evidence={"error": "credential_fetch_failed"}
-                )
-            )
-        return AuditResponse(provider=provider, results=results)
-    
-    # Extract provider-specific credentials
-    aws_credentials = None
-    azure_credentials = None
-    gcp_credentials = None
-    
+        print(f"Could not discover enabled AWS regions, auditing {credentials.region} only: {str(e)}")
+        return None
+
+
+async def _execute_control(provider: str, control_id: str, credentials, inventory: Optional[ResourceInventory] = None,
+                           regions: Optional[List[str]] = None, timeout: Optional[float] = None) -> AuditResult:
+    """
+    Runs a single control function and normalizes its output into an AuditResult.
+    A control still running after timeout seconds returns TIMEOUT with the evidence gathered so far.
+    """
+    if not control_id.lower().startswith(provider):
+        return AuditResult(
+            control_id=control_id,
+            status="ERROR",
+            summary=f"Invalid control ID for provider '{provider}'.",
+            evidence={
+                "note": f"Control ID '{control_id}' does not belong to the '{provider}' provider."
+            },
+        )
+
+    if control_id not in SUPPORTED_CONTROLS:
+        return AuditResult(
+            control_id=control_id,
+            status="ERROR",
+            summary=f"Control ID '{control_id}' is not supported.",
+            evidence={"error": "unsupported_control"},
+        )
+
+    control = SUPPORTED_CONTROLS[control_id]
+    evidence_function = control["async_function"]
+    # Controls that declare shared resource collections read them from the audit's inventory
+    kwargs = {"inventory": inventory} if control.get("resources") else {}
+
+    # Pass credentials to the evidence function based on provider
+    try:
+        with track_retries() as retry_counter, control_deadline() as deadline, control_scope(control_id), \
+                traced("control", control_id=control_id) as span:
+            if credentials and regions and control.get("scope") == "regional":
+                collect = _run_across_regions(evidence_function, credentials, regions, kwargs)
+            elif credentials:
+                collect = evidence_function(credentials, **kwargs)
+            else:
+                collect = None
+                # No credentials available for this provider
+                result_data = {
+                    "status": "ERROR",
+                    "summary": f"No {provider.upper()} credentials configured for user.",
+                    "evidence": {"error": "no_credentials"}
+                }
+
+            if collect is not None:
+                try:
+                    result_data = await asyncio.wait_for(collect, timeout)
+                except asyncio.TimeoutError:
+                    # The worker thread cannot be interrupted; it stops at its next API call instead.
+                    deadline.expire()
+                    result_data = timeout_result(timeout, deadline)
+
+            if span is not None:
+                span.set(status=result_data.get("status"), retries=retry_counter.retries)
+
+        # Ensure all required fields are present
+        if 'evidence' not in result_data:
+            result_data['evidence'] = {}
+        if 'status' not in result_data:
+            result_data['status'] = 'ERROR'
+        if 'summary' not in result_data:
+            result_data['summary'] = 'No summary provided'
+
+        result = AuditResult(control_id=control_id, retries=retry_counter.retries, **result_data)
+        if result.status in ("SUCCESS", "FAILURE"):
+            # Kept for the evidence store: FAILURE evidence only counts the compliant resources.
+            result._compliant_findings = deadline.tracked("compliant")
+        return result
+    except Exception as e:
+        # Handle errors in evidence function execution
+        return AuditResult(
+            control_id=control_id,
+            status="ERROR",
+            summary=f"Error executing control: {str(e)}",
+            evidence={"error": "execution_failed", "details": str(e)}
+        )
+
+
+async def _prefetch(provider: str, name: str, credentials, inventory: ResourceInventory, semaphore: asyncio.Semaphore):
+    """
+    Lists a shared collection into the audit's inventory ahead of the controls that read it.
+    It takes one of the request's slots like a control, so max_concurrency bounds prefetches too.
+    """
+    loader = getattr(load_provider(provider), f"{provider.upper()}_COLLECTIONS", {}).get(name)
+    if loader is None:
+        return
+    # Failures are remembered by the inventory and reported by the controls that read the collection.
+    try:
+        async with semaphore:
+            with traced("prefetch", collection=name):
+                await offload(inventory.get, name, loader, credentials)
+    except Exception:
+        pass
+
+
+def _control_timeout(control: Optional[dict], options: AuditOptions, audit_deadline: Optional[float],
+                     deadlines: bool = True) -> Optional[float]:
+    """
+    The request's control_timeout, else (with deadlines) the control's own "timeout" or CONTROL_TIMEOUT,
+    capped by what is left of the audit deadline. None when the control may run for as long as it needs.
+    """
+    timeout = options.control_timeout
+    if timeout is None and deadlines:
+        timeout = (control or {}).get("timeout") or CONTROL_TIMEOUT
+    if audit_deadline is not None:
+        remaining = audit_deadline - asyncio.get_running_loop().time()
+        timeout = remaining if timeout is None else min(timeout, remaining)
+    return timeout
+
+
+def _revalidation_semaphore() -> asyncio.Semaphore:
+    """The process-wide bound on refreshes, created on the running event loop the first time it is needed."""
+    global _revalidation_slots
+    loop = asyncio.get_running_loop()
+    if _revalidation_slots is None or _revalidation_slots[0] is not loop:
+        _revalidation_slots = (loop, asyncio.Semaphore(REVALIDATION_CONCURRENCY))
+    return _revalidation_slots[1]
+
+
+def _revalidate(provider: str, control_id: str, credentials, regions: Optional[List[str]], cache_key, control: dict,
+                inventory: ResourceInventory):
+    """
+    Refreshes a stale cached result in the background, at most once at a time per cache key.
+    At most REVALIDATION_CONCURRENCY refreshes run at once; the ones an audit triggers share its inventory,
+    so a session with many stale controls lists each collection once rather than once per control.
+    """
+    if cache_key in _revalidations:
+        return
+
+    async def refresh():
+        try:
+            # Refreshes outlive the audit that triggered them, so they are not part of its trace.
+            with use_span(None):
+                async with _revalidation_semaphore():
+                    timeout = _control_timeout(control, AuditOptions(), None)
+                    result = await _execute_control(provider, control_id, credentials, inventory, regions, timeout)
+            store_result(cache_key, control, result)
+        finally:
+            _revalidations.pop(cache_key, None)
+
+    _revalidations[cache_key] = asyncio.create_task(refresh())
+
+
+def credential_error_results(requested_controls: List[str], error: Exception) -> List[AuditResult]:
+    """ERROR results for every requested control when the user's credentials cannot be fetched or parsed."""
+    return [
+        AuditResult(
+            control_id=control_id,
+            status="ERROR",
+            summary=f"Failed to retrieve user credentials: {str(error)}",
+            evidence={"error": "credential_fetch_failed"}
+        )
+        for control_id in requested_controls
+    ]
+
+
+def provider_credentials(provider: str, credentials_data: Dict[str, Any]):
+    """Builds the provider's credentials model from a get_user_credentials() lookup, or None."""
     if provider == "aws" and credentials_data.get('aws_credentials'):
-        aws_creds_data = credentials_data['aws_credentials']
-        aws_credentials = AWSCredentials(**aws_creds_data)
+        return AWSCredentials(**credentials_data['aws_credentials'])
     elif provider == "azure" and credentials_data.get('azure_credentials'):
-        azure_creds_data = credentials_data['azure_credentials']
-        azure_credentials = AzureCredentials(**azure_creds_data)
+        return AzureCredentials(**credentials_data['azure_credentials'])
     elif provider == "gcp" and credentials_data.get('gcp_credentials'):
-        gcp_creds_data = credentials_data['gcp_credentials']
-        gcp_credentials = GCPCredentials(**gcp_creds_data)
-    
-    for control_id in requested_controls:
-        if not control_id.lower().startswith(provider):
-            results.append(
-                AuditResult(
-                    control_id=control_id,
-                    status="ERROR",
-                    summary=f"Invalid control ID for provider '{provider}'.",
-                    evidence={
-                        "note": f"Control ID '{control_id}' does not belong to the '{provider}' provider."
-                    },
-                )
-            )
-            continue
+        return GCPCredentials(**credentials_data['gcp_credentials'])
+    return None
 
-        if control_id in SUPPORTED_CONTROLS:
-            evidence_function = SUPPORTED_CONTROLS[control_id]["function"]
-            
-            # Pass credentials to the evidence function based on provider
-            try:
-                if provider == "aws" and aws_credentials:
-                    result_data = evidence_function(aws_credentials)
-                elif provider == "azure" and azure_credentials:
-                    result_data = evidence_function(azure_credentials)
-                elif provider == "gcp" and gcp_credentials:
-                    result_data = evidence_function(gcp_credentials)
+
+async def load_credentials(provider: str, user_id: str, credentials_data: Optional[Dict[str, Any]] = None):
+    """Fetches the user's credentials for the provider, or None when none are configured."""
+    if credentials_data is None:
+        credentials_data = await offload(get_user_credentials, user_id, provider)
+    print(f"Fetched credentials for user {user_id}: {bool(credentials_data.get(f'{provider}_credentials'))}")
+
+    # Extract provider-specific credentials
+    return provider_credentials(provider, credentials_data)
+
+
+async def iter_audit_results(provider: str, requested_controls: List[str], user_id: str,
+                             options: Optional[AuditOptions] = None,
+                             credentials_data: Optional[Dict[str, Any]] = None,
+                             trace: Optional[Span] = None, deadlines: bool = True) -> AsyncIterator[Tuple[int, AuditResult]]:
+    """
+    Runs an audit and yields (index, AuditResult) pairs as soon as each control finishes,
+    where index is the control's position in requested_controls.
+    Controls still running are cancelled if the consumer stops iterating (e.g. a client disconnect).
+    credentials_data may be passed in when the caller already fetched the user's credentials.
+    trace is the audit's span when the caller manages it; otherwise the audit traces itself.
+    deadlines applies AUDIT_TIMEOUT and CONTROL_TIMEOUT when the request sets no timeouts of its own;
+    background jobs and batch runs pass False, as they exist to run audits too long for a request.
+    """
+    options = options or AuditOptions()
+    audit_timeout = options.audit_timeout or (AUDIT_TIMEOUT if deadlines else None)
+    audit_deadline = asyncio.get_running_loop().time() + audit_timeout if audit_timeout else None
+    owns_trace = trace is None
+    if owns_trace:
+        trace = start_trace("audit", options.debug_trace, provider=provider, controls=len(requested_controls))
+
+    # The span is only made current around awaits, never across a yield, so it cannot leak into the consumer.
+    with audit_in_flight(provider):
+        # Fetch user credentials from Supabase
+        try:
+            with use_span(trace):
+                credentials = await load_credentials(provider, user_id, credentials_data)
+        except Exception as e:
+            # If we can't fetch credentials, add error results for all controls
+            for index, result in enumerate(credential_error_results(requested_controls, e)):
+                observe_control(provider, result.control_id if result.control_id in SUPPORTED_CONTROLS else "unsupported", result.status)
+                yield index, result
+            if owns_trace:
+                finish_trace(trace, error="credential_fetch_failed")
+            return
+
+        # Run the controls on the shared SDK executor, bounded per request by a semaphore.
+        concurrency = min(options.max_concurrency or DEFAULT_REQUEST_CONCURRENCY, MAX_CONTROL_WORKERS)
+        semaphore = asyncio.Semaphore(concurrency)
+        # One inventory per audit run, so controls share the resource listings they have in common
+        inventory = ResourceInventory()
+        # Enabled regions are only looked up for multi-region AWS audits
+        with use_span(trace):
+            # The provider's SDK is imported on first use: off the event loop, and before any control's deadline starts.
+            if credentials and provider in PROVIDER_MODULES:
+                await offload(load_provider, provider)
+            regions = await resolve_regions(credentials, options) if provider == "aws" else None
+        # Expensive controls go first; collections several controls read are listed as soon as one needs them.
+        plan = plan_audit(requested_controls, multi_region=bool(regions))
+        prefetches: Dict[str, asyncio.Task] = {}
+
+        async def run_control(index: int, control_id: str) -> Tuple[int, AuditResult]:
+            control = SUPPORTED_CONTROLS.get(control_id)
+            # Unknown IDs come from the request, so they share one label to keep metric cardinality bounded.
+            metric_id = control_id if control else "unsupported"
+            cache_key = None
+            if control and credentials and control_id.lower().startswith(provider):
+                cache_key = result_cache_key(provider, credentials, control_id, control, regions)
+                cached = get_cached_result(cache_key, control, options)
+                if cached.result:
+                    if cached.revalidate:
+                        _revalidate(provider, control_id, credentials, regions, cache_key, control, inventory)
+                    observe_control(provider, metric_id, cached.result.status, cached=True)
+                    return index, page_evidence(cached.result, options, cache_key)
+                # Collections shared with other controls are listed now rather than once this control gets a slot,
+                # if a slot is free for it; otherwise the readers list them themselves, as they would have anyway.
+                for name in control.get("resources", []):
+                    if name in plan.prefetch and name not in prefetches and not semaphore.locked():
+                        prefetches[name] = asyncio.ensure_future(_prefetch(provider, name, credentials, inventory, semaphore))
+
+            duration = None
+            async with semaphore:
+                # Running controls end by the audit deadline, so queued ones never wait much past it.
+                timeout = _control_timeout(control, options, audit_deadline, deadlines)
+                if timeout is not None and timeout <= 0:
+                    result = AuditResult(control_id=control_id, **timeout_result(audit_timeout))
                 else:
-                    # No credentials available for this provider
-                    result_data = {
-                        "status": "ERROR",
-                        "summary": f"No {provider.upper()} credentials configured for user.",
-                        "evidence": {"error": "no_credentials"}
-                    }
-                
-                # Ensure all required fields are present
-                if 'evidence' not in result_data:
-                    result_data['evidence'] = {}
-                if 'status' not in result_data:
-                    result_data['status'] = 'ERROR'
-                if 'summary' not in result_data:
-                    result_data['summary'] = 'No summary provided'
-                
-                results.append(AuditResult(control_id=control_id, **result_data))
-            except Exception as e:
-                # Handle errors in evidence function execution
-                results.append(
-                    AuditResult(
-                        control_id=control_id,
-                        status="ERROR",
-                        summary=f"Error executing control: {str(e)}",
-                        evidence={"error": "execution_failed", "details": str(e)}
-                    )
-                )
+                    started = time.perf_counter()
+                    result = await _execute_control(provider, control_id, credentials, inventory, regions, timeout)
+                    duration = time.perf_counter() - started if control else None
+            observe_control(provider, metric_id, result.status, duration)
+            if cache_key:
+                result = store_result(cache_key, control, result)
+            # Full evidence stays in the cache and the evidence store; the response carries its first page.
+            return index, page_evidence(result, options, cache_key)
+
+        # Tasks take semaphore slots in creation order, so they are created in the planner's order.
+        rank = {control_id: position for position, control_id in enumerate(plan.order)}
+        scheduled = sorted(enumerate(requested_controls), key=lambda item: rank[item[1]])
+        # Each task copies the current context, so control spans attach to the audit's span.
+        with use_span(trace):
+            tasks = [asyncio.ensure_future(run_control(index, control_id)) for index, control_id in scheduled]
+        try:
+            for next_done in asyncio.as_completed(tasks):
+                yield await next_done
+        finally:
+            for task in tasks + list(prefetches.values()):
+                task.cancel()
+            if owns_trace:
+                finish_trace(trace)
+
+
+async def run_audit(provider: str, requested_controls: List[str], user_id: str, options: Optional[AuditOptions] = None,
+                    credentials_data: Optional[Dict[str, Any]] = None, deadlines: bool = True):
+    """
+    A shared helper function to execute audits for a given provider using user credentials from Supabase.
+    deadlines is passed on to iter_audit_results().
+    """
+    options = options or AuditOptions()
+    trace = start_trace("audit", options.debug_trace, provider=provider, controls=len(requested_controls))
+    # Results are placed by index, so they come back in the order the controls were requested
+    results: List[Optional[AuditResult]] = [None] * len(requested_controls)
+    try:
+        async for index, result in iter_audit_results(provider, requested_controls, user_id, options, credentials_data, trace, deadlines):
+            results[index] = result
+    finally:
+        finish_trace(trace)
+    response = AuditResponse(provider=provider, results=results)
+    if options.debug_trace and trace is not None:
+        response.trace = trace.to_dict()
+    return response
+
+
+def control_provider(control_id: str) -> Optional[str]:
+    """The provider a control ID belongs to, taken from its prefix (e.g. "AWS-..." -> "aws")."""
+    provider = control_id.split("-")[0].lower()
+    return provider if provider in PROVIDERS else None
+
+
+async def run_multi_provider_audit(requested_controls: List[str], user_id: str, options: Optional[AuditOptions] = None) -> MultiAuditResponse:
+    """
+    Audits a mixed list of controls: routes them by provider prefix, fetches the user's
+    credentials for every provider in one lookup, and runs the provider groups concurrently.
+    """
+    groups: Dict[str, List[str]] = {}
+    unknown = []
+    for control_id in requested_controls:
+        provider = control_provider(control_id)
+        if provider:
+            groups.setdefault(provider, []).append(control_id)
         else:
-            results.append(
-                AuditResult(
-                    control_id=control_id,
-                    status="ERROR",
-                    summary=f"Control ID '{control_id}' is not supported.",
-                    evidence={"error": "unsupported_control"},
-                )
+            unknown.append(control_id)
+
+    responses: Dict[str, AuditResponse] = {}
+    if groups:
+        # Provider audits become child spans of one trace, exported once for the whole request.
+        trace = start_trace("multi_audit", bool(options and options.debug_trace), providers=sorted(groups))
+        try:
+            with use_span(trace):
+                credentials_data = await offload(get_user_credentials, user_id)
+        except Exception as e:
+            for provider, control_ids in groups.items():
+                responses[provider] = AuditResponse(provider=provider, results=credential_error_results(control_ids, e))
+        else:
+            with use_span(trace):
+                grouped = await asyncio.gather(*(
+                    run_audit(provider, control_ids, user_id, options, credentials_data)
+                    for provider, control_ids in groups.items()
+                ))
+            responses = {response.provider: response for response in grouped}
+        finally:
+            finish_trace(trace)
+
+    if unknown:
+        responses["unknown"] = AuditResponse(provider="unknown", results=[
+            AuditResult(
+                control_id=control_id,
+                status="ERROR",
+                summary=f"Control ID '{control_id}' does not belong to a supported provider.",
+                evidence={"error": "unsupported_control"},
             )
-    return AuditResponse(provider=provider, results=results)
+            for control_id in unknown
+        ])
+
+    return MultiAuditResponse(providers=responses)
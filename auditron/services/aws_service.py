@@ -1,27 +1,264 @@
 # services/aws_service.py
 import boto3
+from botocore.config import Config
 from botocore.exceptions import NoCredentialsError, ClientError
+import contextvars
+import csv
+import hashlib
+import io
 import os
-from typing import Optional
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, NamedTuple, Optional
+from models import Finding
+from services.cache_service import TTLCache
+from services.deadline_service import track_partial
+from services.inventory_service import load_collection
+from services.metrics_service import register_aws_metrics, register_cache
+from services.rate_limit_service import MAX_ATTEMPTS, register_aws_rate_control
+from services.tracing_service import register_aws_tracing
+
+# --- Client Pool Configuration ---
+AWS_CLIENT_CACHE_SIZE = int(os.getenv("AUDITRON_AWS_CLIENT_CACHE_SIZE", "512"))
+AWS_CLIENT_IDLE_TTL = int(os.getenv("AUDITRON_AWS_CLIENT_IDLE_TTL", "900"))
+# Sized for the concurrent control workers sharing one client.
+AWS_MAX_POOL_CONNECTIONS = int(os.getenv("AUDITRON_AWS_MAX_POOL_CONNECTIONS", "50"))
+
+# botocore's standard retry mode backs off throttling and transient errors; the shared
+# per-(account, service) token bucket from rate_limit_service paces every attempt.
+_client_config = Config(
+    max_pool_connections=AWS_MAX_POOL_CONNECTIONS,
+    retries={"mode": "standard", "max_attempts": MAX_ATTEMPTS},
+)
+
+# Sessions are keyed by (key hash, region) and clients by (key hash, region, service).
+# Both expire after AWS_CLIENT_IDLE_TTL seconds without use.
+_session_cache = TTLCache(max_size=AWS_CLIENT_CACHE_SIZE, ttl=AWS_CLIENT_IDLE_TTL, refresh_on_access=True)
+_client_cache = TTLCache(max_size=AWS_CLIENT_CACHE_SIZE, ttl=AWS_CLIENT_IDLE_TTL, refresh_on_access=True)
+
+# Enabled regions per key pair, used by multi-region audits.
+AWS_REGION_CACHE_TTL = int(os.getenv("AUDITRON_AWS_REGION_CACHE_TTL", "3600"))
+_region_cache = TTLCache(max_size=AWS_CLIENT_CACHE_SIZE, ttl=AWS_REGION_CACHE_TTL)
+
+register_cache("aws_clients", _client_cache)
+register_cache("aws_regions", _region_cache)
+
+# --- IAM Configuration ---
+# Engine for IAM user controls: "credential_report" (one bulk report) or "per_user" (API calls per user).
+IAM_ENGINE = os.getenv("AUDITRON_IAM_ENGINE", "credential_report")
+CREDENTIAL_REPORT_POLL_INTERVAL = float(os.getenv("AUDITRON_CREDENTIAL_REPORT_POLL_INTERVAL", "2"))
+CREDENTIAL_REPORT_MAX_WAIT = float(os.getenv("AUDITRON_CREDENTIAL_REPORT_MAX_WAIT", "60"))
+
+# --- EBS Snapshot Configuration ---
+# Engine for public snapshot detection: "filtered" (server-side filter) or "per_snapshot".
+SNAPSHOT_ENGINE = os.getenv("AUDITRON_SNAPSHOT_ENGINE", "filtered")
+# Concurrent describe_snapshot_attribute calls for the per-snapshot engine.
+SNAPSHOT_ATTRIBUTE_WORKERS = int(os.getenv("AUDITRON_SNAPSHOT_ATTRIBUTE_WORKERS", "8"))
+
+
+def _credential_hash(access_key_id: Optional[str], secret_access_key: Optional[str]) -> str:
+    """Hashes a key pair so raw secrets are never kept as cache keys."""
+    return hashlib.sha256(f"{access_key_id}:{secret_access_key}".encode()).hexdigest()
+
+
+def _resolve_aws_credentials(aws_credentials: Optional['AWSCredentials'] = None):
+    """Returns (access_key_id, secret_access_key, region) from the given credentials or the environment."""
+    if aws_credentials:
+        return aws_credentials.access_key_id, aws_credentials.secret_access_key, aws_credentials.region
+    return os.getenv("AWS_ACCESS_KEY_ID"), os.getenv("AWS_SECRET_ACCESS_KEY"), os.getenv("AWS_REGION")
+
+
+def _region_name(aws_credentials: Optional['AWSCredentials'] = None) -> Optional[str]:
+    """The region a regional check runs against."""
+    return _resolve_aws_credentials(aws_credentials)[2]
+
 
 def get_aws_client(service_name: str, aws_credentials: Optional['AWSCredentials'] = None):
-    """Helper function to create AWS client with provided credentials or environment variables."""
-    if aws_credentials:
-        return boto3.client(
-            service_name,
-            aws_access_key_id=aws_credentials.access_key_id,
-            aws_secret_access_key=aws_credentials.secret_access_key,
-            region_name=aws_credentials.region
+    """
+    Returns a pooled AWS client for the provided credentials or environment variables.
+    Clients are built once per (key pair, region, service) and reused across controls and requests.
+    """
+    access_key_id, secret_access_key, region = _resolve_aws_credentials(aws_credentials)
+    credential_hash = _credential_hash(access_key_id, secret_access_key)
+
+    def build_session():
+        session = boto3.session.Session(
+            aws_access_key_id=access_key_id,
+            aws_secret_access_key=secret_access_key,
+            region_name=region
         )
+        # Sessions are not thread-safe, so client creation on a shared session is serialized.
+        return session, threading.Lock()
+
+    def build_client():
+        session, session_lock = _session_cache.get_or_create((credential_hash, region), build_session)
+        with session_lock:
+            client = session.client(service_name, config=_client_config)
+        register_aws_rate_control(client, credential_hash)
+        register_aws_metrics(client)
+        register_aws_tracing(client)
+        return client
+
+    return _client_cache.get_or_create((credential_hash, region, service_name), build_client)
+
+# --- Multi-Region Support ---
+
+def get_enabled_regions(aws_credentials: Optional['AWSCredentials'] = None):
+    """Returns the regions enabled for the account, discovered once and cached per key pair."""
+    access_key_id, secret_access_key, _ = _resolve_aws_credentials(aws_credentials)
+
+    def discover_regions():
+        regions = get_aws_client('ec2', aws_credentials).describe_regions(AllRegions=False).get('Regions', [])
+        return sorted(region['RegionName'] for region in regions)
+
+    return _region_cache.get_or_create(_credential_hash(access_key_id, secret_access_key), discover_regions)
+
+
+def merge_regional_results(region_results):
+    """Merges {region: control result} from a regional control run in several regions into one result."""
+    statuses = {region: result.get('status', 'ERROR') for region, result in region_results.items()}
+    if any(status == 'FAILURE' for status in statuses.values()):
+        status = 'FAILURE'
+    elif any(status == 'ERROR' for status in statuses.values()):
+        status = 'ERROR'
     else:
-        return boto3.client(
-            service_name,
-            aws_access_key_id=os.getenv("AWS_ACCESS_KEY_ID"),
-            aws_secret_access_key=os.getenv("AWS_SECRET_ACCESS_KEY"),
-            region_name=os.getenv("AWS_REGION")
-        )
+        status = 'SUCCESS'
+
+    flagged = [f"{region} ({region_status})" for region, region_status in statuses.items() if region_status != 'SUCCESS']
+    summary = f"Checked {len(region_results)} regions. "
+    summary += f"Issues in: {', '.join(flagged)}." if flagged else "All regions are compliant."
+
+    return {
+        "status": status,
+        "summary": summary,
+        "evidence": {
+            "regions": {
+                region: {
+                    "status": result.get('status', 'ERROR'),
+                    "summary": result.get('summary', 'No summary provided'),
+                    "evidence": result.get('evidence', {}),
+                }
+                for region, result in region_results.items()
+            }
+        }
+    }
+
 
-def check_s3_public_access(aws_credentials: Optional['AWSCredentials'] = None):
+# --- Shared Resource Collections ---
+# Collections read by more than one control. Controls load them through the audit's
+# ResourceInventory so each one is listed once per audit run.
+
+def list_s3_buckets(aws_credentials: Optional['AWSCredentials'] = None):
+    return get_aws_client('s3', aws_credentials).list_buckets().get('Buckets', [])
+
+
+def list_ebs_volumes(aws_credentials: Optional['AWSCredentials'] = None):
+    paginator = get_aws_client('ec2', aws_credentials).get_paginator('describe_volumes')
+    return [volume for page in paginator.paginate() for volume in page['Volumes']]
+
+
+def list_owned_snapshots(aws_credentials: Optional['AWSCredentials'] = None):
+    paginator = get_aws_client('ec2', aws_credentials).get_paginator('describe_snapshots')
+    return [snapshot for page in paginator.paginate(OwnerIds=['self']) for snapshot in page['Snapshots']]
+
+
+def list_security_groups(aws_credentials: Optional['AWSCredentials'] = None):
+    paginator = get_aws_client('ec2', aws_credentials).get_paginator('describe_security_groups')
+    return [sg for page in paginator.paginate() for sg in page['SecurityGroups']]
+
+
+def list_rds_instances(aws_credentials: Optional['AWSCredentials'] = None):
+    paginator = get_aws_client('rds', aws_credentials).get_paginator('describe_db_instances')
+    return [instance for page in paginator.paginate() for instance in page['DBInstances']]
+
+
+def list_iam_users(aws_credentials: Optional['AWSCredentials'] = None):
+    paginator = get_aws_client('iam', aws_credentials).get_paginator('list_users')
+    return [user for page in paginator.paginate() for user in page['Users']]
+
+
+class CredentialReportRow(NamedTuple):
+    """The credential report columns IAM controls evaluate, for one IAM user."""
+    user_name: str
+    arn: str
+    password_enabled: bool
+    password_last_used: Optional[str]
+    mfa_active: bool
+    access_key_1_active: bool
+    access_key_2_active: bool
+
+
+def get_credential_report(aws_credentials: Optional['AWSCredentials'] = None):
+    """
+    Generates (when needed) and downloads the IAM credential report, parsed in one pass
+    into a compact list of CredentialReportRow, excluding the root account.
+    AWS regenerates the report at most every four hours, so it can lag recent changes.
+    """
+    iam_client = get_aws_client('iam', aws_credentials)
+    deadline = time.monotonic() + CREDENTIAL_REPORT_MAX_WAIT
+    while iam_client.generate_credential_report()['State'] != 'COMPLETE':
+        if time.monotonic() > deadline:
+            raise TimeoutError(f"IAM credential report was not ready after {CREDENTIAL_REPORT_MAX_WAIT} seconds.")
+        time.sleep(CREDENTIAL_REPORT_POLL_INTERVAL)
+
+    content = iam_client.get_credential_report()['Content']
+    rows = []
+    for record in csv.DictReader(io.StringIO(content.decode('utf-8'))):
+        if record['user'] == '<root_account>':
+            continue
+        last_used = record.get('password_last_used')
+        rows.append(CredentialReportRow(
+            user_name=record['user'],
+            arn=record['arn'],
+            password_enabled=record.get('password_enabled') == 'true',
+            password_last_used=None if last_used in (None, '', 'N/A', 'no_information') else last_used,
+            mfa_active=record.get('mfa_active') == 'true',
+            access_key_1_active=record.get('access_key_1_active') == 'true',
+            access_key_2_active=record.get('access_key_2_active') == 'true',
+        ))
+    return rows
+
+
+AWS_COLLECTIONS = {
+    "aws:s3:buckets": list_s3_buckets,
+    "aws:ec2:volumes": list_ebs_volumes,
+    "aws:ec2:snapshots": list_owned_snapshots,
+    "aws:ec2:security_groups": list_security_groups,
+    "aws:rds:db_instances": list_rds_instances,
+    "aws:iam:users": list_iam_users,
+    "aws:iam:credential_report": get_credential_report,
+}
+
+
+def _collection(name: str, aws_credentials: Optional['AWSCredentials'] = None, inventory=None):
+    return load_collection(name, AWS_COLLECTIONS[name], aws_credentials, inventory)
+
+
+# --- Resource Counts ---
+# Sizes of the collections controls paginate or loop over, for dry-run audit plans.
+# Each counter only makes the list calls; nothing is fetched per resource.
+
+def _count_pages(service_name: str, operation: str, key: str, aws_credentials: Optional['AWSCredentials'] = None, **kwargs):
+    paginator = get_aws_client(service_name, aws_credentials).get_paginator(operation)
+    return sum(len(page.get(key, [])) for page in paginator.paginate(**kwargs))
+
+
+AWS_RESOURCE_COUNTERS = {
+    "aws:s3:buckets": lambda credentials: len(list_s3_buckets(credentials)),
+    "aws:ec2:volumes": lambda credentials: _count_pages('ec2', 'describe_volumes', 'Volumes', credentials),
+    "aws:ec2:snapshots": lambda credentials: _count_pages('ec2', 'describe_snapshots', 'Snapshots', credentials, OwnerIds=['self']),
+    "aws:ec2:security_groups": lambda credentials: _count_pages('ec2', 'describe_security_groups', 'SecurityGroups', credentials),
+    "aws:rds:db_instances": lambda credentials: _count_pages('rds', 'describe_db_instances', 'DBInstances', credentials),
+    "aws:efs:file_systems": lambda credentials: _count_pages('efs', 'describe_file_systems', 'FileSystems', credentials),
+    "aws:dynamodb:tables": lambda credentials: _count_pages('dynamodb', 'list_tables', 'TableNames', credentials),
+    "aws:kms:keys": lambda credentials: _count_pages('kms', 'list_keys', 'Keys', credentials),
+    "aws:cloudtrail:trails": lambda credentials: len(get_aws_client('cloudtrail', credentials).describe_trails().get('trailList', [])),
+    "aws:secretsmanager:secrets": lambda credentials: _count_pages('secretsmanager', 'list_secrets', 'SecretList', credentials),
+}
+
+
+def check_s3_public_access(aws_credentials: Optional['AWSCredentials'] = None, inventory=None):
     """
     Checks all S3 buckets for public access blocks.
     Returns a formatted report.
@@ -29,7 +266,7 @@ def check_s3_public_access(aws_credentials: Optional['AWSCredentials'] = None):
     try:
         s3_client = get_aws_client('s3', aws_credentials)
         
-        buckets = s3_client.list_buckets().get('Buckets', [])
+        buckets = _collection('aws:s3:buckets', aws_credentials, inventory)
         if not buckets:
             return {
                 "status": "SUCCESS",
@@ -37,8 +274,9 @@ def check_s3_public_access(aws_credentials: Optional['AWSCredentials'] = None):
                 "evidence": []
             }
 
-        compliant_buckets = []
-        non_compliant_buckets = []
+        compliant_buckets: List[Finding] = []
+        non_compliant_buckets: List[Finding] = []
+        track_partial(compliant=compliant_buckets, non_compliant=non_compliant_buckets)
 
         for bucket in buckets:
             bucket_name = bucket['Name']
@@ -77,25 +315,24 @@ def check_s3_public_access(aws_credentials: Optional['AWSCredentials'] = None):
         return {"status": "ERROR", "summary": f"An unexpected error occurred: {str(e)}", "evidence": {"error": str(e)}}
 
 
-def check_ebs_encryption(aws_credentials: Optional['AWSCredentials'] = None):
+def check_ebs_encryption(aws_credentials: Optional['AWSCredentials'] = None, inventory=None):
     """
     Checks all EBS volumes for encryption.
     Returns a formatted report.
     """
     try:
         # Note: EBS is regional, so we check the configured region.
-        ec2_client = get_aws_client('ec2', aws_credentials)
-        
-        volumes = ec2_client.describe_volumes().get('Volumes', [])
+        volumes = _collection('aws:ec2:volumes', aws_credentials, inventory)
         if not volumes:
             return {
                 "status": "SUCCESS",
-                "summary": f"No EBS volumes found in the region {os.getenv('AWS_REGION')}.",
+                "summary": f"No EBS volumes found in the region {_region_name(aws_credentials)}.",
                 "evidence": []
             }
 
-        compliant_volumes = []
-        non_compliant_volumes = []
+        compliant_volumes: List[Finding] = []
+        non_compliant_volumes: List[Finding] = []
+        track_partial(compliant=compliant_volumes, non_compliant=non_compliant_volumes)
 
         for volume in volumes:
             volume_id = volume['VolumeId']
@@ -140,12 +377,13 @@ def check_efs_encryption_in_transit(aws_credentials: Optional['AWSCredentials']
         if not filesystems:
             return {
                 "status": "SUCCESS",
-                "summary": f"No EFS file systems found in the region {os.getenv('AWS_REGION')}.",
+                "summary": f"No EFS file systems found in the region {_region_name(aws_credentials)}.",
                 "evidence": []
             }
 
-        compliant_filesystems = []
-        non_compliant_filesystems = []
+        compliant_filesystems: List[Finding] = []
+        non_compliant_filesystems: List[Finding] = []
+        track_partial(compliant=compliant_filesystems, non_compliant=non_compliant_filesystems)
 
         for fs in filesystems:
             fs_id = fs['FileSystemId']
@@ -187,22 +425,17 @@ def check_efs_encryption_in_transit(aws_credentials: Optional['AWSCredentials']
         return {"status": "ERROR", "summary": f"An unexpected error occurred: {str(e)}", "evidence": {"error": str(e)}}
 
 
-def check_rds_public_access(aws_credentials: Optional['AWSCredentials'] = None):
+def check_rds_public_access(aws_credentials: Optional['AWSCredentials'] = None, inventory=None):
     """Checks all RDS instances to see if they are publicly accessible."""
     try:
-        rds_client = get_aws_client('rds', aws_credentials)
-        paginator = rds_client.get_paginator('describe_db_instances')
-        pages = paginator.paginate()
-        
-        all_instances = []
-        for page in pages:
-            all_instances.extend(page['DBInstances'])
+        all_instances = _collection('aws:rds:db_instances', aws_credentials, inventory)
 
         if not all_instances:
             return {"status": "SUCCESS", "summary": "No RDS instances found.", "evidence": []}
 
-        compliant_instances = []
-        non_compliant_instances = []
+        compliant_instances: List[Finding] = []
+        non_compliant_instances: List[Finding] = []
+        track_partial(compliant=compliant_instances, non_compliant=non_compliant_instances)
 
         for instance in all_instances:
             instance_id = instance['DBInstanceIdentifier']
@@ -231,22 +464,17 @@ def check_rds_public_access(aws_credentials: Optional['AWSCredentials'] = None):
     except Exception as e:
         return {"status": "ERROR", "summary": f"An unexpected error occurred: {str(e)}"}
 
-def check_rds_storage_encryption(aws_credentials: Optional['AWSCredentials'] = None):
+def check_rds_storage_encryption(aws_credentials: Optional['AWSCredentials'] = None, inventory=None):
     """Checks all RDS instances for storage encryption."""
     try:
-        rds_client = get_aws_client('rds', aws_credentials)
-        paginator = rds_client.get_paginator('describe_db_instances')
-        pages = paginator.paginate()
-        
-        all_instances = []
-        for page in pages:
-            all_instances.extend(page['DBInstances'])
+        all_instances = _collection('aws:rds:db_instances', aws_credentials, inventory)
 
         if not all_instances:
             return {"status": "SUCCESS", "summary": "No RDS instances found.", "evidence": []}
 
-        compliant_instances = []
-        non_compliant_instances = []
+        compliant_instances: List[Finding] = []
+        non_compliant_instances: List[Finding] = []
+        track_partial(compliant=compliant_instances, non_compliant=non_compliant_instances)
 
         for instance in all_instances:
             instance_id = instance['DBInstanceIdentifier']
@@ -275,29 +503,61 @@ def check_rds_storage_encryption(aws_credentials: Optional['AWSCredentials'] = N
     except Exception as e:
         return {"status": "ERROR", "summary": f"An unexpected error occurred: {str(e)}"}
 
-def check_ebs_snapshot_public(aws_credentials: Optional['AWSCredentials'] = None):
-    """Checks all EBS snapshots to see if they are publicly shared."""
+def _public_snapshot_ids_filtered(aws_credentials: Optional['AWSCredentials'] = None):
+    """Finds public snapshots server-side: owned snapshots that anyone ('all') can restore."""
+    paginator = get_aws_client('ec2', aws_credentials).get_paginator('describe_snapshots')
+    pages = paginator.paginate(OwnerIds=['self'], RestorableByUserIds=['all'])
+    return {snapshot['SnapshotId'] for page in pages for snapshot in page['Snapshots']}
+
+
+def _public_snapshot_ids_per_snapshot(snapshot_ids, aws_credentials: Optional['AWSCredentials'] = None):
+    """Fallback: describes the createVolumePermission of every snapshot, several at a time."""
+    ec2_client = get_aws_client('ec2', aws_credentials)
+
+    def is_public(snapshot_id):
+        attributes = ec2_client.describe_snapshot_attribute(
+            SnapshotId=snapshot_id,
+            Attribute='createVolumePermission'
+        )
+        return any(perm.get('Group') == 'all' for perm in attributes.get('CreateVolumePermissions', []))
+
+    with ThreadPoolExecutor(max_workers=SNAPSHOT_ATTRIBUTE_WORKERS) as executor:
+        # Each call runs in a copy of the caller's context so its retries count towards the control.
+        flags = [executor.submit(contextvars.copy_context().run, is_public, snapshot_id) for snapshot_id in snapshot_ids]
+        flags = [flag.result() for flag in flags]
+        return {snapshot_id for snapshot_id, public in zip(snapshot_ids, flags) if public}
+
+
+def check_ebs_snapshot_public(aws_credentials: Optional['AWSCredentials'] = None, inventory=None, engine: Optional[str] = None):
+    """
+    Checks all EBS snapshots to see if they are publicly shared.
+    engine selects "filtered" (server-side RestorableByUserIds filter, the default) or "per_snapshot".
+    """
+    engine = engine or SNAPSHOT_ENGINE
     try:
-        ec2_client = get_aws_client('ec2', aws_credentials)
         # We must specify the owner as 'self' to only check our own snapshots
-        snapshots = ec2_client.describe_snapshots(OwnerIds=['self']).get('Snapshots', [])
+        snapshots = _collection('aws:ec2:snapshots', aws_credentials, inventory)
 
         if not snapshots:
             return {"status": "SUCCESS", "summary": "No EBS snapshots found.", "evidence": []}
 
-        compliant_snapshots = []
-        non_compliant_snapshots = []
+        snapshot_ids = [snapshot['SnapshotId'] for snapshot in snapshots]
+        public_ids = None
+        if engine == "filtered":
+            try:
+                # Only owned snapshots are evaluated, matching the per-snapshot engine.
+                public_ids = _public_snapshot_ids_filtered(aws_credentials) & set(snapshot_ids)
+            except ClientError as e:
+                print(f"Filtered snapshot lookup failed, checking snapshots individually: {str(e)}")
+        if public_ids is None:
+            public_ids = _public_snapshot_ids_per_snapshot(snapshot_ids, aws_credentials)
 
-        for snapshot in snapshots:
-            snapshot_id = snapshot['SnapshotId']
-            # To check if it's public, we describe the create volume permissions
-            attributes = ec2_client.describe_snapshot_attribute(
-                SnapshotId=snapshot_id,
-                Attribute='createVolumePermission'
-            )
-            is_public = any(perm.get('Group') == 'all' for perm in attributes.get('CreateVolumePermissions', []))
+        compliant_snapshots: List[Finding] = []
+        non_compliant_snapshots: List[Finding] = []
+        track_partial(compliant=compliant_snapshots, non_compliant=non_compliant_snapshots)
 
-            if is_public:
+        for snapshot_id in snapshot_ids:
+            if snapshot_id in public_ids:
                 non_compliant_snapshots.append({"snapshot_id": snapshot_id, "reason": "Snapshot is publicly shared."})
             else:
                 compliant_snapshots.append({"snapshot_id": snapshot_id, "status": "Compliant"})
@@ -333,8 +593,9 @@ def check_dynamodb_pitr(aws_credentials: Optional['AWSCredentials'] = None):
         if not all_tables:
             return {"status": "SUCCESS", "summary": "No DynamoDB tables found.", "evidence": []}
 
-        compliant_tables = []
-        non_compliant_tables = []
+        compliant_tables: List[Finding] = []
+        non_compliant_tables: List[Finding] = []
+        track_partial(compliant=compliant_tables, non_compliant=non_compliant_tables)
 
         for table_name in all_tables:
             response = dynamodb_client.describe_continuous_backups(TableName=table_name)
@@ -363,52 +624,88 @@ def check_dynamodb_pitr(aws_credentials: Optional['AWSCredentials'] = None):
     except Exception as e:
         return {"status": "ERROR", "summary": f"An unexpected error occurred: {str(e)}"}
 
-def check_iam_mfa_console(aws_credentials: Optional['AWSCredentials'] = None):
-    """Checks if IAM users with a console password have MFA enabled."""
-    try:
-        iam_client = get_aws_client('iam', aws_credentials)
-        paginator = iam_client.get_paginator('list_users')
+def _iam_mfa_per_user(aws_credentials: Optional['AWSCredentials'] = None, inventory=None):
+    """Per-user engine: one get_login_profile and one list_mfa_devices call per IAM user."""
+    iam_client = get_aws_client('iam', aws_credentials)
+    all_users = _collection('aws:iam:users', aws_credentials, inventory)
+
+    compliant_users: List[Finding] = []
+    non_compliant_users: List[Finding] = []
+    track_partial(compliant=compliant_users, non_compliant=non_compliant_users)
+
+    for user in all_users:
+        user_name = user['UserName']
+        try:
+            # This call will fail if the user has no console password, which is compliant.
+            iam_client.get_login_profile(UserName=user_name)
+            
+            # If the above call succeeded, the user has a password. Now check for MFA.
+            mfa_devices = iam_client.list_mfa_devices(UserName=user_name).get('MFADevices', [])
+            if mfa_devices:
+                compliant_users.append({"user_name": user_name, "status": "Compliant", "mfa_enabled": True})
+            else:
+                non_compliant_users.append({"user_name": user_name, "reason": "User has a console password but no MFA device."})
         
-        all_users = []
-        for page in paginator.paginate():
-            all_users.extend(page['Users'])
+        except ClientError as e:
+            if e.response['Error']['Code'] == 'NoSuchEntity':
+                # This user has no console password, so they are compliant in this context.
+                compliant_users.append({"user_name": user_name, "status": "Compliant", "mfa_enabled": "N/A (No Console Password)"})
+            else:
+                raise
 
-        if not all_users:
-            return {"status": "SUCCESS", "summary": "No IAM users found.", "evidence": []}
+    return len(all_users), compliant_users, non_compliant_users
+
+
+def _iam_mfa_from_credential_report(aws_credentials: Optional['AWSCredentials'] = None, inventory=None):
+    """Bulk engine: evaluates every IAM user from a single credential report download."""
+    report = _collection('aws:iam:credential_report', aws_credentials, inventory)
+
+    compliant_users: List[Finding] = []
+    non_compliant_users: List[Finding] = []
+    track_partial(compliant=compliant_users, non_compliant=non_compliant_users)
+
+    for row in report:
+        if not row.password_enabled:
+            compliant_users.append({"user_name": row.user_name, "status": "Compliant", "mfa_enabled": "N/A (No Console Password)"})
+        elif row.mfa_active:
+            compliant_users.append({"user_name": row.user_name, "status": "Compliant", "mfa_enabled": True})
+        else:
+            non_compliant_users.append({"user_name": row.user_name, "reason": "User has a console password but no MFA device."})
+
+    return len(report), compliant_users, non_compliant_users
 
-        compliant_users = []
-        non_compliant_users = []
 
-        for user in all_users:
-            user_name = user['UserName']
+def check_iam_mfa_console(aws_credentials: Optional['AWSCredentials'] = None, inventory=None, engine: Optional[str] = None):
+    """
+    Checks if IAM users with a console password have MFA enabled.
+    engine selects "credential_report" (bulk, the default) or "per_user"; both produce the same evidence.
+    """
+    engine = engine or IAM_ENGINE
+    try:
+        if engine == "credential_report":
             try:
-                # This call will fail if the user has no console password, which is compliant.
-                iam_client.get_login_profile(UserName=user_name)
-                
-                # If the above call succeeded, the user has a password. Now check for MFA.
-                mfa_devices = iam_client.list_mfa_devices(UserName=user_name).get('MFADevices', [])
-                if mfa_devices:
-                    compliant_users.append({"user_name": user_name, "status": "Compliant", "mfa_enabled": True})
-                else:
-                    non_compliant_users.append({"user_name": user_name, "reason": "User has a console password but no MFA device."})
-            
+                user_count, compliant_users, non_compliant_users = _iam_mfa_from_credential_report(aws_credentials, inventory)
             except ClientError as e:
-                if e.response['Error']['Code'] == 'NoSuchEntity':
-                    # This user has no console password, so they are compliant in this context.
-                    compliant_users.append({"user_name": user_name, "status": "Compliant", "mfa_enabled": "N/A (No Console Password)"})
-                else:
+                # Principals allowed to list users but not to generate reports fall back to per-user calls.
+                if e.response['Error']['Code'] not in ('AccessDenied', 'AccessDeniedException'):
                     raise
+                user_count, compliant_users, non_compliant_users = _iam_mfa_per_user(aws_credentials, inventory)
+        else:
+            user_count, compliant_users, non_compliant_users = _iam_mfa_per_user(aws_credentials, inventory)
+
+        if not user_count:
+            return {"status": "SUCCESS", "summary": "No IAM users found.", "evidence": []}
 
         if not non_compliant_users:
             return {
                 "status": "SUCCESS",
-                "summary": f"Checked {len(all_users)} IAM users. All with console access have MFA enabled.",
+                "summary": f"Checked {user_count} IAM users. All with console access have MFA enabled.",
                 "evidence": compliant_users
             }
         else:
             return {
                 "status": "FAILURE",
-                "summary": f"Checked {len(all_users)} IAM users. Found {len(non_compliant_users)} with console access but no MFA.",
+                "summary": f"Checked {user_count} IAM users. Found {len(non_compliant_users)} with console access but no MFA.",
                 "evidence": {
                     "compliant_count": len(compliant_users),
                     "non_compliant_users": non_compliant_users
@@ -439,17 +736,17 @@ def check_iam_root_mfa(aws_credentials: Optional['AWSCredentials'] = None):
     except Exception as e:
         return {"status": "ERROR", "summary": f"An unexpected error occurred: {str(e)}"}
 
-def check_vpc_sg_restricted_ssh(aws_credentials: Optional['AWSCredentials'] = None):
+def check_vpc_sg_restricted_ssh(aws_credentials: Optional['AWSCredentials'] = None, inventory=None):
     """Checks for security groups that allow unrestricted inbound SSH traffic (from 0.0.0.0/0)."""
     try:
-        ec2_client = get_aws_client('ec2', aws_credentials)
-        sgs = ec2_client.describe_security_groups().get('SecurityGroups', [])
+        sgs = _collection('aws:ec2:security_groups', aws_credentials, inventory)
 
         if not sgs:
             return {"status": "SUCCESS", "summary": "No security groups found.", "evidence": []}
 
-        compliant_sgs = []
-        non_compliant_sgs = []
+        compliant_sgs: List[Finding] = []
+        non_compliant_sgs: List[Finding] = []
+        track_partial(compliant=compliant_sgs, non_compliant=non_compliant_sgs)
 
         for sg in sgs:
             is_non_compliant = False
@@ -504,8 +801,9 @@ def check_kms_key_rotation(aws_credentials: Optional['AWSCredentials'] = None):
         if not customer_managed_keys:
             return {"status": "SUCCESS", "summary": "No customer-managed KMS keys found.", "evidence": []}
 
-        compliant_keys = []
-        non_compliant_keys = []
+        compliant_keys: List[Finding] = []
+        non_compliant_keys: List[Finding] = []
+        track_partial(compliant=compliant_keys, non_compliant=non_compliant_keys)
 
         for key in customer_managed_keys:
             key_id = key['KeyId']
@@ -547,8 +845,9 @@ def check_cloudtrail_enabled(aws_credentials: Optional['AWSCredentials'] = None)
                 "evidence": []
             }
 
-        compliant_trails = []
-        non_compliant_trails = []
+        compliant_trails: List[Finding] = []
+        non_compliant_trails: List[Finding] = []
+        track_partial(compliant=compliant_trails, non_compliant=non_compliant_trails)
         multi_region_trail_exists = False
 
         for trail in trails:
@@ -588,7 +887,7 @@ def check_config_enabled(aws_credentials: Optional['AWSCredentials'] = None):
         if not recorders:
             return {
                 "status": "FAILURE",
-                "summary": f"AWS Config is not enabled in the region {os.getenv('AWS_REGION')}.",
+                "summary": f"AWS Config is not enabled in the region {_region_name(aws_credentials)}.",
                 "evidence": []
             }
         
@@ -619,13 +918,13 @@ def check_guardduty_enabled(aws_credentials: Optional['AWSCredentials'] = None):
         if detectors:
             return {
                 "status": "SUCCESS",
-                "summary": f"GuardDuty is enabled in the region {os.getenv('AWS_REGION')}.",
+                "summary": f"GuardDuty is enabled in the region {_region_name(aws_credentials)}.",
                 "evidence": {"detector_ids": detectors}
             }
         else:
             return {
                 "status": "FAILURE",
-                "summary": f"GuardDuty is not enabled in the region {os.getenv('AWS_REGION')}.",
+                "summary": f"GuardDuty is not enabled in the region {_region_name(aws_credentials)}.",
                 "evidence": []
             }
     except ClientError as e:
@@ -633,7 +932,7 @@ def check_guardduty_enabled(aws_credentials: Optional['AWSCredentials'] = None):
         if e.response['Error']['Code'] == 'BadRequestException':
              return {
                 "status": "FAILURE",
-                "summary": f"GuardDuty is not enabled in the region {os.getenv('AWS_REGION')}.",
+                "summary": f"GuardDuty is not enabled in the region {_region_name(aws_credentials)}.",
                 "evidence": []
             }
         else:
@@ -654,8 +953,9 @@ def check_secretsmanager_rotation(aws_credentials: Optional['AWSCredentials'] =
         if not all_secrets:
             return {"status": "SUCCESS", "summary": "No secrets found in Secrets Manager.", "evidence": []}
 
-        compliant_secrets = []
-        non_compliant_secrets = []
+        compliant_secrets: List[Finding] = []
+        non_compliant_secrets: List[Finding] = []
+        track_partial(compliant=compliant_secrets, non_compliant=non_compliant_secrets)
 
         for secret in all_secrets:
             secret_arn = secret['ARN']
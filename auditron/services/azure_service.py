@@ -6,42 +6,176 @@ from azure.mgmt.network import NetworkManagementClient
 from azure.mgmt.monitor import MonitorManagementClient
 from azure.mgmt.security import SecurityCenter
 from azure.core.exceptions import ClientAuthenticationError
+import hashlib
 import os
-from typing import Optional
+import threading
+import time
+from typing import List, Optional
+from models import Finding
+from services.cache_service import TTLCache
+from services.deadline_service import track_partial
+from services.inventory_service import load_collection
+from services.metrics_service import azure_metrics_policy, register_cache
+from services.tracing_service import azure_tracing_policy, traced
+from services.rate_limit_service import MAX_ATTEMPTS, azure_rate_control_policy
+
+# --- Client Pool Configuration ---
+AZURE_POOL_CACHE_SIZE = int(os.getenv("AUDITRON_AZURE_POOL_CACHE_SIZE", "256"))
+AZURE_POOL_IDLE_TTL = int(os.getenv("AUDITRON_AZURE_POOL_IDLE_TTL", "1800"))
+# Tokens are refreshed this many seconds before they expire.
+AZURE_TOKEN_REFRESH_MARGIN = int(os.getenv("AUDITRON_AZURE_TOKEN_REFRESH_MARGIN", "300"))
+
+
+class SharedTokenCredential:
+    """
+    Wraps a credential so every management client built on it shares one access
+    token per scope, fetched once and refreshed ahead of expiry.
+    """
+
+    def __init__(self, credential):
+        self._credential = credential
+        self._tokens = {}
+        self._lock = threading.Lock()
+
+    def get_token(self, *scopes, **kwargs):
+        # Claims challenges need a fresh token and must bypass the shared cache.
+        if kwargs.get("claims"):
+            return self._credential.get_token(*scopes, **kwargs)
+        with self._lock:
+            token = self._tokens.get(scopes)
+            if token is None or token.expires_on - time.time() < AZURE_TOKEN_REFRESH_MARGIN:
+                with traced("azure.get_token", scopes=" ".join(scopes)):
+                    token = self._credential.get_token(*scopes, **kwargs)
+                self._tokens[scopes] = token
+            return token
+
+    def close(self):
+        self._credential.close()
+
+
+class AzureClientPool:
+    """One shared credential plus lazily created management clients for a (tenant, client, subscription)."""
+
+    def __init__(self, credential: SharedTokenCredential, subscription_id: str):
+        self.credential = credential
+        self.subscription_id = subscription_id
+        self._clients = {}
+        self._lock = threading.Lock()
+
+    def client(self, client_class):
+        with self._lock:
+            if client_class not in self._clients:
+                # The SDK's RetryPolicy honours Retry-After on 429s; the per-retry policy paces
+                # every attempt through the subscription's shared token bucket.
+                self._clients[client_class] = client_class(
+                    self.credential,
+                    self.subscription_id,
+                    retry_total=MAX_ATTEMPTS - 1,
+                    per_call_policies=[azure_metrics_policy(client_class.__name__), azure_tracing_policy(client_class.__name__)],
+                    per_retry_policies=[azure_rate_control_policy(self.subscription_id, client_class.__name__)],
+                )
+            return self._clients[client_class]
+
+
+_pool_cache = TTLCache(max_size=AZURE_POOL_CACHE_SIZE, ttl=AZURE_POOL_IDLE_TTL, refresh_on_access=True)
+register_cache("azure_clients", _pool_cache)
+
+
+def get_azure_client_pool(azure_credentials: Optional['AzureCredentials'] = None) -> Optional[AzureClientPool]:
+    """Returns the cached client pool for the provided credentials or environment variables."""
+    if azure_credentials:
+        tenant_id = azure_credentials.tenant_id
+        client_id = azure_credentials.client_id
+        client_secret = azure_credentials.client_secret
+        subscription_id = azure_credentials.subscription_id
+    else:
+        tenant_id = os.getenv("AZURE_TENANT_ID")
+        client_id = os.getenv("AZURE_CLIENT_ID")
+        client_secret = os.getenv("AZURE_CLIENT_SECRET")
+        subscription_id = os.getenv("AZURE_SUBSCRIPTION_ID")
+
+    if not all([tenant_id, client_id, client_secret, subscription_id]):
+        return None
+
+    # The secret is hashed so it is never kept as a cache key, and a rotated secret gets a new pool.
+    secret_hash = hashlib.sha256(client_secret.encode()).hexdigest()
+    return _pool_cache.get_or_create(
+        (tenant_id, client_id, subscription_id, secret_hash),
+        lambda: AzureClientPool(SharedTokenCredential(ClientSecretCredential(tenant_id, client_id, client_secret)), subscription_id)
+    )
+
 
 # --- Helper function to get credentials ---
 def get_azure_credentials(azure_credentials: Optional['AzureCredentials'] = None):
-    """Helper to centralize credential loading."""
+    """Helper to centralize credential loading. Returns the pooled credential and subscription ID."""
     try:
-        if azure_credentials:
-            tenant_id = azure_credentials.tenant_id
-            client_id = azure_credentials.client_id
-            client_secret = azure_credentials.client_secret
-            subscription_id = azure_credentials.subscription_id
-        else:
-            tenant_id = os.getenv("AZURE_TENANT_ID")
-            client_id = os.getenv("AZURE_CLIENT_ID")
-            client_secret = os.getenv("AZURE_CLIENT_SECRET")
-            subscription_id = os.getenv("AZURE_SUBSCRIPTION_ID")
-
-        if not all([tenant_id, client_id, client_secret, subscription_id]):
+        pool = get_azure_client_pool(azure_credentials)
+        if not pool:
             return None, None
-        
-        credential = ClientSecretCredential(tenant_id, client_id, client_secret)
-        return credential, subscription_id
+        return pool.credential, pool.subscription_id
     except Exception:
         return None, None
 
+
+def get_azure_client(client_class, azure_credentials: Optional['AzureCredentials'] = None):
+    """Returns the pooled management client of the given class, sharing the pool's credential and token."""
+    return get_azure_client_pool(azure_credentials).client(client_class)
+
+# --- Shared Resource Collections ---
+# Collections read by more than one control, loaded once per audit run through the ResourceInventory.
+
+def list_storage_accounts(azure_credentials: Optional['AzureCredentials'] = None):
+    return list(get_azure_client(StorageManagementClient, azure_credentials).storage_accounts.list())
+
+
+def list_network_security_groups(azure_credentials: Optional['AzureCredentials'] = None):
+    return list(get_azure_client(NetworkManagementClient, azure_credentials).network_security_groups.list_all())
+
+
+def list_sql_servers(azure_credentials: Optional['AzureCredentials'] = None):
+    return list(get_azure_client(SqlManagementClient, azure_credentials).servers.list())
+
+
+AZURE_COLLECTIONS = {
+    "azure:storage:accounts": list_storage_accounts,
+    "azure:network:nsgs": list_network_security_groups,
+    "azure:sql:servers": list_sql_servers,
+}
+
+
+def _count_sql_databases(azure_credentials: Optional['AzureCredentials'] = None):
+    # Databases are only listed per server: one call per server, still far fewer than the per-database checks.
+    sql_client = get_azure_client(SqlManagementClient, azure_credentials)
+    return sum(
+        len(list(sql_client.databases.list_by_server(server.id.split('/')[4], server.name)))
+        for server in list_sql_servers(azure_credentials)
+    )
+
+
+# Sizes of the collections controls loop over, for dry-run audit plans.
+AZURE_RESOURCE_COUNTERS = {
+    "azure:storage:accounts": lambda credentials: len(list_storage_accounts(credentials)),
+    "azure:sql:servers": lambda credentials: len(list_sql_servers(credentials)),
+    "azure:sql:databases": _count_sql_databases,
+}
+
+
+def _collection(name: str, azure_credentials: Optional['AzureCredentials'] = None, inventory=None):
+    return load_collection(name, AZURE_COLLECTIONS[name], azure_credentials, inventory)
+
+
 # --- Category 1 Functions ---
 
-def check_azure_storage_public(azure_credentials: Optional['AzureCredentials'] = None):
+def check_azure_storage_public(azure_credentials: Optional['AzureCredentials'] = None, inventory=None):
     credential, subscription_id = get_azure_credentials(azure_credentials)
     if not credential: return {"status": "ERROR", "summary": "Azure credentials not configured."}
     try:
-        storage_client = StorageManagementClient(credential, subscription_id)
-        storage_accounts = list(storage_client.storage_accounts.list())
+        storage_client = get_azure_client(StorageManagementClient, azure_credentials)
+        storage_accounts = _collection("azure:storage:accounts", azure_credentials, inventory)
         if not storage_accounts: return {"status": "SUCCESS", "summary": "No Azure Storage Accounts found.", "evidence": []}
-        compliant_accounts, non_compliant_accounts = [], []
+        compliant_accounts: List[Finding] = []
+        non_compliant_accounts: List[Finding] = []
+        track_partial(compliant=compliant_accounts, non_compliant=non_compliant_accounts)
         for account in storage_accounts:
             resource_group_name = account.id.split('/')[4]
             containers = storage_client.blob_containers.list(resource_group_name, account.name)
@@ -54,14 +188,15 @@ def check_azure_storage_public(azure_credentials: Optional['AzureCredentials'] =
         else: return {"status": "FAILURE", "summary": f"Found {len(non_compliant_accounts)} accounts with public containers.", "evidence": {"compliant": len(compliant_accounts), "non_compliant": non_compliant_accounts}}
     except Exception as e: return {"status": "ERROR", "summary": f"An unexpected error occurred: {str(e)}"}
 
-def check_azure_storage_https(azure_credentials: Optional['AzureCredentials'] = None):
+def check_azure_storage_https(azure_credentials: Optional['AzureCredentials'] = None, inventory=None):
     credential, subscription_id = get_azure_credentials(azure_credentials)
     if not credential: return {"status": "ERROR", "summary": "Azure credentials not configured."}
     try:
-        storage_client = StorageManagementClient(credential, subscription_id)
-        storage_accounts = list(storage_client.storage_accounts.list())
+        storage_accounts = _collection("azure:storage:accounts", azure_credentials, inventory)
         if not storage_accounts: return {"status": "SUCCESS", "summary": "No Azure Storage Accounts found.", "evidence": []}
-        compliant_accounts, non_compliant_accounts = [], []
+        compliant_accounts: List[Finding] = []
+        non_compliant_accounts: List[Finding] = []
+        track_partial(compliant=compliant_accounts, non_compliant=non_compliant_accounts)
         for account in storage_accounts:
             if account.enable_https_traffic_only: compliant_accounts.append({"account_name": account.name, "status": "Compliant"})
             else: non_compliant_accounts.append({"account_name": account.name, "reason": "'Secure transfer required' is disabled."})
@@ -69,14 +204,17 @@ def check_azure_storage_https(azure_credentials: Optional['AzureCredentials'] =
         else: return {"status": "FAILURE", "summary": f"Found {len(non_compliant_accounts)} accounts not enforcing HTTPS.", "evidence": {"compliant": len(compliant_accounts), "non_compliant": non_compliant_accounts}}
     except Exception as e: return {"status": "ERROR", "summary": f"An unexpected error occurred: {str(e)}"}
 
-def check_azure_sql_tde(azure_credentials: Optional['AzureCredentials'] = None):
+def check_azure_sql_tde(azure_credentials: Optional['AzureCredentials'] = None, inventory=None):
     credential, subscription_id = get_azure_credentials(azure_credentials)
     if not credential: return {"status": "ERROR", "summary": "Azure credentials not configured."}
     try:
-        sql_client = SqlManagementClient(credential, subscription_id)
-        servers = list(sql_client.servers.list())
+        sql_client = get_azure_client(SqlManagementClient, azure_credentials)
+        servers = _collection("azure:sql:servers", azure_credentials, inventory)
         if not servers: return {"status": "SUCCESS", "summary": "No Azure SQL servers found.", "evidence": []}
-        all_databases, compliant_databases, non_compliant_databases = [], []
+        all_databases = []
+        compliant_databases: List[Finding] = []
+        non_compliant_databases: List[Finding] = []
+        track_partial(compliant=compliant_databases, non_compliant=non_compliant_databases)
         for server in servers:
             resource_group_name = server.id.split('/')[4]
             databases = list(sql_client.databases.list_by_server(resource_group_name, server.name))
@@ -102,14 +240,15 @@ def check_azure_entra_mfa_admin(azure_credentials: Optional['AzureCredentials']
         return {"status": "SUCCESS", "summary": "Placeholder: A full MFA check requires the MS Graph SDK.", "evidence": [{"note": "In a production tool, query the Graph API for Conditional Access policies targeting admin roles and requiring MFA."}]}
     except Exception as e: return {"status": "ERROR", "summary": f"An unexpected error occurred: {str(e)}"}
 
-def check_azure_nsg_restricted_rdp(azure_credentials: Optional['AzureCredentials'] = None):
+def check_azure_nsg_restricted_rdp(azure_credentials: Optional['AzureCredentials'] = None, inventory=None):
     credential, subscription_id = get_azure_credentials(azure_credentials)
     if not credential: return {"status": "ERROR", "summary": "Azure credentials not configured."}
     try:
-        network_client = NetworkManagementClient(credential, subscription_id)
-        nsgs = list(network_client.network_security_groups.list_all())
+        nsgs = _collection("azure:network:nsgs", azure_credentials, inventory)
         if not nsgs: return {"status": "SUCCESS", "summary": "No Network Security Groups found.", "evidence": []}
-        compliant_nsgs, non_compliant_nsgs = [], []
+        compliant_nsgs: List[Finding] = []
+        non_compliant_nsgs: List[Finding] = []
+        track_partial(compliant=compliant_nsgs, non_compliant=non_compliant_nsgs)
         for nsg in nsgs:
             offending_rule = next((rule for rule in nsg.security_rules if rule.direction == 'Inbound' and rule.protocol in ('TCP', '*') and rule.destination_port_range in ('3389', '*') and rule.source_address_prefix in ('*', 'Any', 'Internet')), None)
             if offending_rule:
@@ -128,7 +267,7 @@ def check_azure_monitor_log_profiles(azure_credentials: Optional['AzureCredentia
     if not credential:
         return {"status": "ERROR", "summary": "Azure credentials not configured."}
     try:
-        monitor_client = MonitorManagementClient(credential, subscription_id)
+        monitor_client = get_azure_client(MonitorManagementClient, azure_credentials)
         resource_uri = f"/subscriptions/{subscription_id}"
         
         # ✅ DEFINITIVE FIX: Access the diagnostic_settings property of the client
@@ -165,7 +304,7 @@ def check_azure_defender_standard_tier(azure_credentials: Optional['AzureCredent
     if not credential:
         return {"status": "ERROR", "summary": "Azure credentials not configured."}
     try:
-        security_client = SecurityCenter(credential, subscription_id)
+        security_client = get_azure_client(SecurityCenter, azure_credentials)
         # ✅ DEFINITIVE FIX: The scope_id is required and must be the full subscription resource ID.
         scope = f"/subscriptions/{subscription_id}"
         
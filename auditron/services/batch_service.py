@@ -0,0 +1,93 @@
+# services/batch_service.py
+import asyncio
+import os
+from collections import defaultdict
+from itertools import zip_longest
+from typing import AsyncIterator, Dict, List, Optional
+from models import AuditOptions, AuditResult, AuditResponse, BatchAuditItem
+from services.audit_service_new import run_audit, control_provider, credential_error_results, provider_credentials
+from services.offload_service import offload
+from services.result_cache_service import account_identity
+from services.serialization_service import dumps
+from services.supabase_service import get_user_credentials
+
+# --- Batch Scheduling Configuration ---
+# Provider audits running at once across the whole batch.
+BATCH_CONCURRENCY = int(os.getenv("AUDITRON_BATCH_CONCURRENCY", "16"))
+# Provider audits running at once for a single tenant (user_id).
+BATCH_TENANT_CONCURRENCY = int(os.getenv("AUDITRON_BATCH_TENANT_CONCURRENCY", "2"))
+# Provider audits running at once against a single cloud account, even if several tenants share it.
+BATCH_ACCOUNT_CONCURRENCY = int(os.getenv("AUDITRON_BATCH_ACCOUNT_CONCURRENCY", "1"))
+
+
+def _fair_order(items: List[BatchAuditItem]):
+    """
+    Splits every item into (user_id, provider, controls) units and interleaves them round-robin
+    across tenants, so each tenant's first audit is scheduled before any tenant's second one.
+    """
+    units_by_tenant: Dict[str, list] = defaultdict(list)
+    for item in items:
+        groups: Dict[Optional[str], List[str]] = {}
+        for control_id in item.controls:
+            groups.setdefault(control_provider(control_id), []).append(control_id)
+        units_by_tenant[item.user_id].extend((item.user_id, provider, control_ids) for provider, control_ids in groups.items())
+
+    for round_units in zip_longest(*units_by_tenant.values()):
+        for unit in round_units:
+            if unit is not None:
+                yield unit
+
+
+async def iter_batch_audit(items: List[BatchAuditItem], options: Optional[AuditOptions] = None,
+                           concurrency: int = BATCH_CONCURRENCY,
+                           tenant_concurrency: int = BATCH_TENANT_CONCURRENCY,
+                           account_concurrency: int = BATCH_ACCOUNT_CONCURRENCY) -> AsyncIterator[dict]:
+    """
+    Audits many tenants and yields one record per (user_id, provider) as soon as it finishes.
+    Records hold the response's AuditResult models as they are, so they are only encoded once, on the way out.
+
+    Work is admitted in round-robin order and capped per tenant and per cloud account before it
+    takes one of the batch-wide slots, so a tenant with many accounts or controls cannot starve the rest.
+    asyncio semaphores wake waiters in FIFO order, which keeps the round-robin order under contention.
+    """
+    batch_slots = asyncio.Semaphore(concurrency)
+    tenant_slots = defaultdict(lambda: asyncio.Semaphore(tenant_concurrency))
+    account_slots = defaultdict(lambda: asyncio.Semaphore(account_concurrency))
+
+    async def run_unit(user_id: str, provider: Optional[str], control_ids: List[str]) -> dict:
+        if provider is None:
+            results = [
+                AuditResult(control_id=control_id, status="ERROR",
+                            summary=f"Control ID '{control_id}' does not belong to a supported provider.",
+                            evidence={"error": "unsupported_control"})
+                for control_id in control_ids
+            ]
+            return {"user_id": user_id, **dict(AuditResponse(provider="unknown", results=results))}
+
+        async with tenant_slots[user_id]:
+            # One tenant's unreadable or malformed credentials fail its own unit, not the whole batch.
+            try:
+                credentials_data = await offload(get_user_credentials, user_id, provider)
+                credentials = provider_credentials(provider, credentials_data)
+            except Exception as e:
+                results = credential_error_results(control_ids, e)
+                return {"user_id": user_id, **dict(AuditResponse(provider=provider, results=results))}
+            account = account_identity(provider, credentials) if credentials else f"missing:{user_id}:{provider}"
+            async with account_slots[account], batch_slots:
+                # Batch runs take as long as the tenants need; only timeouts set on the request apply.
+                response = await run_audit(provider, control_ids, user_id, options, credentials_data, deadlines=False)
+        return {"user_id": user_id, **dict(response)}
+
+    tasks = [asyncio.ensure_future(run_unit(*unit)) for unit in _fair_order(items)]
+    try:
+        for next_done in asyncio.as_completed(tasks):
+            yield await next_done
+    finally:
+        for task in tasks:
+            task.cancel()
+
+
+async def stream_batch_ndjson(items: List[BatchAuditItem], options: Optional[AuditOptions] = None, **limits) -> AsyncIterator[bytes]:
+    """iter_batch_audit() encoded as NDJSON lines."""
+    async for record in iter_batch_audit(items, options, **limits):
+        yield dumps(record) + b"\n"
@@ -0,0 +1,104 @@
+# services/cache_service.py
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Hashable, Optional
+
+_MISSING = object()
+
+
+class TTLCache:
+    """
+    A small thread-safe LRU cache with per-entry expiry.
+
+    Entries are evicted least-recently-used first once max_size is reached, and
+    expire ttl seconds after they were stored (or last read, when refresh_on_access
+    is set, which turns the TTL into an idle timeout).
+    """
+
+    def __init__(self, max_size: int, ttl: float, refresh_on_access: bool = False):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.refresh_on_access = refresh_on_access
+        self.hits = 0
+        self.misses = 0
+        self._entries: "OrderedDict[Hashable, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+        # Striped locks so concurrent get_or_create() calls for the same key build it once.
+        self._build_locks = [threading.Lock() for _ in range(32)]
+
+    def get(self, key: Hashable, default: Any = None, count: bool = True) -> Any:
+        """
+        Returns key's live value, or default. Callers that may still turn the value down pass
+        count=False and report the outcome with count_lookup() once they have decided.
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                if count:
+                    self.misses += 1
+                return default
+            expires_at, value = entry
+            now = time.monotonic()
+            if expires_at <= now:
+                del self._entries[key]
+                if count:
+                    self.misses += 1
+                return default
+            if self.refresh_on_access:
+                self._entries[key] = (now + self.ttl, value)
+            self._entries.move_to_end(key)
+            if count:
+                self.hits += 1
+            return value
+
+    def count_lookup(self, hit: bool):
+        """Records a lookup made with get(count=False) as a hit or a miss."""
+        with self._lock:
+            if hit:
+                self.hits += 1
+            else:
+                self.misses += 1
+
+    def set(self, key: Hashable, value: Any, ttl: Optional[float] = None):
+        with self._lock:
+            self._entries[key] = (time.monotonic() + (self.ttl if ttl is None else ttl), value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def get_or_create(self, key: Hashable, factory: Callable[[], Any]) -> Any:
+        """Returns the cached value for key, building and storing it with factory() on a miss."""
+        value = self.get(key, _MISSING)
+        if value is not _MISSING:
+            return value
+        with self._build_locks[hash(key) % len(self._build_locks)]:
+            # Another thread may have built it while we were waiting for the lock.
+            with self._lock:
+                entry = self._entries.get(key)
+                if entry is not None and entry[0] > time.monotonic():
+                    return entry[1]
+            value = factory()
+            self.set(key, value)
+            return value
+
+    def pop(self, key: Hashable, default: Any = None) -> Any:
+        with self._lock:
+            entry = self._entries.pop(key, None)
+            return default if entry is None else entry[1]
+
+    def pop_matching(self, predicate: Callable[[Hashable], bool]) -> int:
+        """Removes every entry whose key satisfies predicate and returns how many were removed."""
+        with self._lock:
+            keys = [key for key in self._entries if predicate(key)]
+            for key in keys:
+                del self._entries[key]
+            return len(keys)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self) -> int:
+        with self._lock:
+            return len(self._entries)
@@ -0,0 +1,110 @@
+# services/deadline_service.py
+import contextvars
+import os
+import threading
+from contextlib import contextmanager
+from typing import Iterator, List, Optional, Tuple
+
+# --- Deadline Configuration ---
+# Seconds a single control may run before it returns a TIMEOUT result.
+CONTROL_TIMEOUT = float(os.getenv("AUDITRON_CONTROL_TIMEOUT", "120"))
+# Seconds a whole audit may run; controls still queued or running at the deadline return TIMEOUT.
+# 0 disables the audit-wide deadline.
+AUDIT_TIMEOUT = float(os.getenv("AUDITRON_AUDIT_TIMEOUT", "300"))
+
+
+class DeadlineExceeded(Exception):
+    """Raised at the next API call of a control whose deadline has passed."""
+
+
+class ControlDeadline:
+    """
+    Per-control run state shared with the worker threads doing the control's API calls.
+
+    Checks register the evidence lists they fill in with track_partial(), so a timed-out control
+    can report what it gathered so far, and compliant findings a FAILURE result leaves out of its
+    evidence can still be paged. Once expired, the abandoned thread stops at its next API call.
+    """
+
+    def __init__(self):
+        self.expired = False
+        self._collections: List[Tuple[Optional[str], dict]] = []
+        self._lock = threading.Lock()
+
+    def track(self, collections: dict, region: Optional[str] = None):
+        with self._lock:
+            self._collections.append((region, collections))
+
+    def tracked(self, name: str) -> List[Tuple[Optional[str], list]]:
+        """The lists tracked under name, each with the region it was gathered in (None outside multi-region runs)."""
+        with self._lock:
+            return [(region, collections[name]) for region, collections in self._collections if name in collections]
+
+    def expire(self):
+        self.expired = True
+
+    def partial_evidence(self) -> dict:
+        """Snapshot of the tracked lists, merged by name (regional runs each register their own)."""
+        merged = {}
+        with self._lock:
+            for _, collections in self._collections:
+                for name, items in collections.items():
+                    merged.setdefault(name, []).extend(list(items))
+        return merged
+
+
+# Set per control run; copied into the worker threads that make the SDK calls.
+_deadline: contextvars.ContextVar[Optional[ControlDeadline]] = contextvars.ContextVar("auditron_control_deadline", default=None)
+# Set per region of a multi-region run, so the lists a check tracks there are tagged with the region.
+_region: contextvars.ContextVar[Optional[str]] = contextvars.ContextVar("auditron_evidence_region", default=None)
+
+
+@contextmanager
+def control_deadline() -> Iterator[ControlDeadline]:
+    deadline = ControlDeadline()
+    token = _deadline.set(deadline)
+    try:
+        yield deadline
+    finally:
+        _deadline.reset(token)
+
+
+@contextmanager
+def evidence_region(region: str) -> Iterator[None]:
+    token = _region.set(region)
+    try:
+        yield
+    finally:
+        _region.reset(token)
+
+
+def track_partial(**collections: list):
+    """Registers a check's in-progress evidence lists, reported if the control times out."""
+    deadline = _deadline.get()
+    if deadline is not None:
+        deadline.track(collections, _region.get())
+
+
+def checkpoint():
+    """Stops a control's worker thread once its deadline has passed. Called before every API call."""
+    deadline = _deadline.get()
+    if deadline is not None and deadline.expired:
+        raise DeadlineExceeded("The control's deadline has passed.")
+
+
+def timeout_result(timeout: float, deadline: Optional[ControlDeadline] = None) -> dict:
+    """A TIMEOUT result carrying whatever evidence the control gathered before its deadline."""
+    timeout = round(timeout, 2)
+    partial = deadline.partial_evidence() if deadline else {}
+    if partial:
+        counts = ", ".join(f"{len(items)} {name.replace('_', '-')}" for name, items in partial.items())
+        summary = f"Control did not finish within {timeout:g}s. Partial evidence: {counts}."
+    elif deadline is None:
+        summary = f"Control was not started before the audit deadline ({timeout:g}s)."
+    else:
+        summary = f"Control did not finish within {timeout:g}s."
+    return {
+        "status": "TIMEOUT",
+        "summary": summary,
+        "evidence": {"error": "timeout", "timeout_seconds": timeout, "partial": partial},
+    }
@@ -0,0 +1,161 @@
+# services/dry_run_service.py
+import asyncio
+import os
+from collections import defaultdict
+from typing import Any, Dict, List, Optional, Tuple
+from models import AuditOptions, AuditPlanResponse, ControlPlan
+from controls import SUPPORTED_CONTROLS, load_provider
+from services.offload_service import offload
+from services.audit_service_new import DEFAULT_REQUEST_CONCURRENCY, load_credentials, resolve_regions
+from services.planner_service import estimate_calls
+from services.rate_limit_service import RATE_LIMIT_BURST, RATE_LIMIT_RPS
+from services.deadline_service import CONTROL_TIMEOUT
+
+# --- Dry Run Configuration ---
+# Typical latency of one cloud API call, used to turn projected calls into a duration.
+PLAN_CALL_LATENCY = float(os.getenv("AUDITRON_PLAN_CALL_LATENCY_MS", "100")) / 1000
+
+RISK_LEVELS = ("low", "medium", "high")
+
+
+def _service(control: dict) -> str:
+    """The API service a control's calls are rate limited under, e.g. "s3" for "s3:ListBuckets"."""
+    apis = control.get("apis") or ["none"]
+    return apis[0].split(":")[0]
+
+
+def _rate_limited_seconds(calls: int) -> float:
+    """Time the rate limiter needs to let calls through once the burst is spent."""
+    return max(calls - RATE_LIMIT_BURST, 0) / RATE_LIMIT_RPS
+
+
+def _per_resource_calls(control: dict, resource_counts: Dict[str, int]) -> int:
+    per_resource = control.get("cost", {}).get("per_resource", {})
+    return sum(per_item * resource_counts.get(collection, 0) for collection, per_item in per_resource.items())
+
+
+async def _count(counter, credentials, timeout: float, semaphore: asyncio.Semaphore) -> int:
+    async with semaphore:
+        return await asyncio.wait_for(offload(counter, credentials), timeout)
+
+
+async def plan_audit_dry_run(provider: str, requested_controls: List[str], user_id: str,
+                             options: Optional[AuditOptions] = None,
+                             credentials_data: Optional[Dict[str, Any]] = None) -> AuditPlanResponse:
+    """
+    Projects what an audit would cost without running it. Only the list calls that size the
+    collections controls loop over are made (buckets, tables, keys, snapshots, storage accounts...);
+    the declared "cost" of each control then gives its API calls, duration and throttling risk.
+    """
+    options = options or AuditOptions()
+    timeout = options.control_timeout or CONTROL_TIMEOUT
+    concurrency = options.max_concurrency or DEFAULT_REQUEST_CONCURRENCY
+    try:
+        credentials = await load_credentials(provider, user_id, credentials_data)
+    except Exception as e:
+        print(f"Could not load credentials to plan the audit for user {user_id}: {str(e)}")
+        return AuditPlanResponse(
+            provider=provider,
+            controls=[
+                ControlPlan(control_id=control_id, error="credential_fetch_failed"
+                            if SUPPORTED_CONTROLS.get(control_id, {}).get("provider") == provider else "unsupported_control")
+                for control_id in requested_controls
+            ],
+            estimated_calls=0,
+            estimated_seconds=0.0,
+            throttling_risk="low",
+        )
+
+    plans: Dict[int, ControlPlan] = {}
+    planned: List[Tuple[int, dict]] = []
+    for index, control_id in enumerate(requested_controls):
+        control = SUPPORTED_CONTROLS.get(control_id)
+        if not control or control["provider"] != provider:
+            plans[index] = ControlPlan(control_id=control_id, error="unsupported_control")
+        elif not credentials:
+            plans[index] = ControlPlan(control_id=control_id, scope=control.get("scope"), error="no_credentials")
+        else:
+            planned.append((index, control))
+
+    regions = None
+    counts: Dict[Tuple[str, Optional[str]], Any] = {}
+    if planned:
+        counters = getattr(await offload(load_provider, provider), f"{provider.upper()}_RESOURCE_COUNTERS", {})
+        regions = await resolve_regions(credentials, options) if provider == "aws" else None
+
+        # Each (collection, region) is counted once, however many controls read it.
+        for _, control in planned:
+            cost = control.get("cost", {})
+            for collection in {**cost.get("per_resource", {}), **cost.get("pages", {})}:
+                for region in (regions if regions and control.get("scope") == "regional" else [None]):
+                    counts.setdefault((collection, region), None)
+        keys = [key for key in counts if key[0] in counters]
+        # Count calls are bounded like an audit's controls, by the request's max_concurrency.
+        semaphore = asyncio.Semaphore(concurrency)
+        values = await asyncio.gather(*(
+            _count(counters[name], credentials.model_copy(update={"region": region}) if region else credentials, timeout, semaphore)
+            for name, region in keys
+        ), return_exceptions=True)
+        counts.update(zip(keys, values))
+
+    service_calls: Dict[str, int] = defaultdict(int)
+    for index, control in planned:
+        control_id = requested_controls[index]
+        control_regions = regions if regions and control.get("scope") == "regional" else [None]
+        cost = control.get("cost", {})
+        collections = list({**cost.get("per_resource", {}), **cost.get("pages", {})})
+
+        errors = []
+        calls = per_resource = slowest_region = 0
+        resource_counts: Dict[str, int] = defaultdict(int)
+        for region in control_regions:
+            region_counts = {}
+            for collection in collections:
+                value = counts.get((collection, region))
+                if isinstance(value, BaseException):
+                    errors.append(f"{collection}: {str(value) or type(value).__name__}")
+                elif value is not None:
+                    region_counts[collection] = value
+                    resource_counts[collection] += value
+            region_calls = estimate_calls(control, region_counts)
+            calls += region_calls
+            per_resource += _per_resource_calls(control, region_counts)
+            slowest_region = max(slowest_region, region_calls)
+        service_calls[_service(control)] += calls
+
+        # Regions run concurrently but share one rate limit per account and service.
+        plans[index] = ControlPlan(
+            control_id=control_id,
+            scope=control.get("scope"),
+            resource_counts=dict(resource_counts),
+            estimated_calls=calls,
+            per_resource_calls=per_resource,
+            estimated_seconds=round(max(slowest_region * PLAN_CALL_LATENCY, _rate_limited_seconds(calls)), 2),
+            error="; ".join(errors) or None,
+        )
+
+    # Controls on the same service share its token bucket, so risk is judged on the service's total demand.
+    for index, control in planned:
+        plan = plans[index]
+        control_timeout = options.control_timeout or control.get("timeout") or CONTROL_TIMEOUT
+        service_seconds = _rate_limited_seconds(service_calls[_service(control)])
+        plan.exceeds_timeout = plan.estimated_seconds > control_timeout
+        if plan.exceeds_timeout or service_seconds > control_timeout:
+            plan.throttling_risk = "high"
+        elif service_calls[_service(control)] > RATE_LIMIT_BURST:
+            plan.throttling_risk = "medium"
+
+    controls = [plans[index] for index in range(len(requested_controls))]
+    estimated_seconds = max(
+        [plan.estimated_seconds for plan in controls]
+        + [_rate_limited_seconds(calls) for calls in service_calls.values()]
+        + [sum(plan.estimated_seconds for plan in controls) / concurrency]
+    )
+    return AuditPlanResponse(
+        provider=provider,
+        regions=regions,
+        controls=controls,
+        estimated_calls=sum(plan.estimated_calls for plan in controls),
+        estimated_seconds=round(estimated_seconds, 2),
+        throttling_risk=max((plan.throttling_risk for plan in controls), key=RISK_LEVELS.index, default="low"),
+    )
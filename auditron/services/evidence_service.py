@@ -0,0 +1,197 @@
+# services/evidence_service.py
+import base64
+import hashlib
+import os
+import secrets
+from typing import Any, Dict, Hashable, List, NamedTuple, Optional, Tuple
+from models import AuditOptions, AuditResult, EvidencePage, Finding
+from services.cache_service import TTLCache
+from services.metrics_service import register_cache
+
+# --- Evidence Paging Configuration ---
+# Non-compliant findings returned inline with a result; the rest are paged from GET /evidence/{id}.
+EVIDENCE_PAGE_SIZE = int(os.getenv("AUDITRON_EVIDENCE_PAGE_SIZE", "100"))
+EVIDENCE_MAX_PAGE_SIZE = int(os.getenv("AUDITRON_EVIDENCE_MAX_PAGE_SIZE", "1000"))
+# Results whose findings are kept for paging, and for how long after the last response that referenced them.
+EVIDENCE_STORE_SIZE = int(os.getenv("AUDITRON_EVIDENCE_STORE_SIZE", "1024"))
+EVIDENCE_TTL = int(os.getenv("AUDITRON_EVIDENCE_TTL", "3600"))
+
+EVIDENCE_FILTERS = ("all", "non_compliant", "compliant")
+
+_evidence_store = TTLCache(max_size=EVIDENCE_STORE_SIZE, ttl=EVIDENCE_TTL)
+register_cache("evidence", _evidence_store)
+
+# Evidence ids are derived from result cache keys, salted per process so they cannot be guessed.
+_ID_SALT = secrets.token_hex(16)
+
+
+class StoredEvidence(NamedTuple):
+    control_id: str
+    non_compliant: List[Finding]
+    compliant: List[Finding]
+
+
+def _is_finding(entry: Any) -> bool:
+    return isinstance(entry, dict) and ("reason" in entry or entry.get("status") == "Compliant")
+
+
+def _is_findings(value: Any) -> bool:
+    return isinstance(value, list) and bool(value) and _is_finding(value[0])
+
+
+class _FindingCollector:
+    """Takes the findings out of a result's evidence, wherever the check or the audit put them."""
+
+    def __init__(self):
+        self.non_compliant: List[Finding] = []
+        self.compliant: List[Finding] = []
+        self.found = False
+        # Findings already collected, by identity, so the result's withheld compliant findings are not added twice.
+        self._seen = set()
+
+    def add(self, findings: List[Finding], region: Optional[str]):
+        self.found = True
+        for finding in findings:
+            self._seen.add(id(finding))
+            if region:
+                finding = {**finding, "region": region}
+            (self.non_compliant if "reason" in finding else self.compliant).append(finding)
+
+    def add_withheld(self, result: AuditResult):
+        """Collects the compliant findings the check tracked but left out of the evidence (FAILURE results)."""
+        for region, findings in result._compliant_findings:
+            withheld = [finding for finding in findings if id(finding) not in self._seen]
+            if withheld:
+                self.add(withheld, region)
+
+    def strip(self, evidence: Any, region: Optional[str] = None) -> Any:
+        """Collects evidence's findings and returns what is left of it (None when nothing is)."""
+        if _is_findings(evidence):
+            self.add(evidence, region)
+            return None
+        if not isinstance(evidence, dict):
+            return evidence
+
+        rest = {}
+        for key, value in evidence.items():
+            if _is_findings(value):
+                self.add(value, region)
+            elif isinstance(value, list) and not value and key.startswith(("compliant", "non_compliant")):
+                continue
+            elif key in ("compliant_count", "compliant") and isinstance(value, int):
+                # Counts are taken from the findings themselves.
+                continue
+            elif key == "regions" and isinstance(value, dict):
+                # Multi-region results: findings are tagged with their region, each region keeps its status.
+                rest[key] = {name: self.strip(entry, name) for name, entry in value.items()}
+            elif isinstance(value, dict):
+                value = self.strip(value, region)
+                if value:
+                    rest[key] = value
+            else:
+                rest[key] = value
+        return rest or None
+
+
+def _evidence_id(cache_key: Optional[Hashable], collected_at: Optional[float]) -> str:
+    """
+    Cached results keep one id for as long as they are served, so cache hits refresh a single stored
+    entry instead of adding a copy each; results that are not cached get a random id.
+    """
+    if cache_key is None or collected_at is None:
+        return secrets.token_hex(16)
+    return hashlib.sha256(f"{_ID_SALT}:{cache_key!r}:{collected_at!r}".encode()).hexdigest()[:32]
+
+
+def _encode_cursor(status: str, offset: int) -> str:
+    return base64.urlsafe_b64encode(f"{status}:{offset}".encode()).decode().rstrip("=")
+
+
+def _decode_cursor(cursor: str) -> Tuple[str, int]:
+    try:
+        status, offset = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)).decode().split(":")
+        offset = int(offset)
+    except ValueError:
+        raise ValueError(f"Invalid cursor '{cursor}'.")
+    if status not in EVIDENCE_FILTERS or offset < 0:
+        raise ValueError(f"Invalid cursor '{cursor}'.")
+    return status, offset
+
+
+def page_evidence(result: AuditResult, options: Optional[AuditOptions] = None,
+                  cache_key: Optional[Hashable] = None) -> AuditResult:
+    """
+    Bounds a result's evidence: its findings (with the compliant ones a FAILURE result only counts) are stored
+    server-side and replaced by counts, the first EVIDENCE_PAGE_SIZE non-compliant findings, an evidence_id
+    and a next_cursor for GET /evidence/{id}.
+    Anything else in the evidence (errors, timeout details, per-region statuses) is kept as it was.
+    Results without findings, and requests with full_evidence, are returned unchanged.
+    """
+    if options is not None and options.full_evidence:
+        return result
+
+    collector = _FindingCollector()
+    rest = collector.strip(result.evidence)
+    collector.add_withheld(result)
+    if not collector.found:
+        return result
+
+    non_compliant = collector.non_compliant
+    evidence_id = None
+    next_cursor = None
+    if collector.compliant or len(non_compliant) > EVIDENCE_PAGE_SIZE:
+        evidence_id = _evidence_id(cache_key, result.collected_at)
+        _evidence_store.set(evidence_id, StoredEvidence(result.control_id, non_compliant, collector.compliant))
+        if len(non_compliant) > EVIDENCE_PAGE_SIZE:
+            next_cursor = _encode_cursor("non_compliant", EVIDENCE_PAGE_SIZE)
+
+    evidence: Dict[str, Any] = {
+        "compliant_count": len(collector.compliant),
+        "non_compliant_count": len(non_compliant),
+        "non_compliant": non_compliant[:EVIDENCE_PAGE_SIZE],
+        "evidence_id": evidence_id,
+        "next_cursor": next_cursor,
+    }
+    if rest:
+        evidence.update(rest)
+    return result.model_copy(update={"evidence": evidence})
+
+
+def get_evidence_page(evidence_id: str, cursor: Optional[str] = None, limit: Optional[int] = None,
+                      status: str = "all") -> Optional[EvidencePage]:
+    """
+    One page of a stored result's findings, or None when evidence_id is unknown or has expired.
+    status picks non_compliant or compliant findings, or all of them (non-compliant first);
+    a cursor carries the status it was issued for. Raises ValueError for a bad cursor, status or limit.
+    """
+    limit = EVIDENCE_PAGE_SIZE if limit is None else limit
+    if not 1 <= limit <= EVIDENCE_MAX_PAGE_SIZE:
+        raise ValueError(f"limit must be between 1 and {EVIDENCE_MAX_PAGE_SIZE}.")
+    if status not in EVIDENCE_FILTERS:
+        raise ValueError(f"Unsupported status '{status}'. Use one of: {', '.join(EVIDENCE_FILTERS)}.")
+    offset = 0
+    if cursor:
+        status, offset = _decode_cursor(cursor)
+
+    stored: Optional[StoredEvidence] = _evidence_store.get(evidence_id)
+    if stored is None:
+        return None
+
+    end = offset + limit
+    if status == "non_compliant":
+        total, findings = len(stored.non_compliant), stored.non_compliant[offset:end]
+    elif status == "compliant":
+        total, findings = len(stored.compliant), stored.compliant[offset:end]
+    else:
+        # Non-compliant findings come first; the two lists are sliced rather than joined.
+        split = len(stored.non_compliant)
+        total = split + len(stored.compliant)
+        findings = stored.non_compliant[offset:end] + stored.compliant[max(offset - split, 0):max(end - split, 0)]
+    return EvidencePage(
+        evidence_id=evidence_id,
+        control_id=stored.control_id,
+        status=status,
+        total=total,
+        findings=findings,
+        next_cursor=_encode_cursor(status, end) if end < total else None,
+    )
@@ -1,25 +1,68 @@
 # services/gcp_service.py
 from google.cloud import storage
+from google.oauth2 import service_account
 from google.api_core import exceptions
 import os
-import json
-import tempfile
-from typing import Optional
+from typing import List, Optional
+from models import Finding
+from services.cache_service import TTLCache
+from services.deadline_service import track_partial
+from services.metrics_service import record_api_call, register_cache
+from services.rate_limit_service import call_with_retries, is_gcp_throttle
+from services.tracing_service import traced
+
+# --- Client Cache Configuration ---
+GCP_CLIENT_CACHE_SIZE = int(os.getenv("AUDITRON_GCP_CLIENT_CACHE_SIZE", "256"))
+GCP_CLIENT_IDLE_TTL = int(os.getenv("AUDITRON_GCP_CLIENT_IDLE_TTL", "1800"))
+
+# Clients are keyed by service account identity. Each cached client keeps its
+# credentials object, so the OAuth token is reused until it is close to expiry.
+_client_cache = TTLCache(max_size=GCP_CLIENT_CACHE_SIZE, ttl=GCP_CLIENT_IDLE_TTL, refresh_on_access=True)
+register_cache("gcp_clients", _client_cache)
+
 
 def get_gcp_client(gcp_credentials: Optional['GCPCredentials'] = None):
-    """Helper function to create GCP client with provided credentials or environment variables."""
+    """Helper function to get a cached GCP client for the provided credentials or environment variables."""
     if gcp_credentials:
-        # Create a temporary file with the service account JSON
-        with tempfile.NamedTemporaryFile(mode='w', suffix='.json', delete=False) as temp_file:
-            json.dump(gcp_credentials.service_account_json, temp_file)
-            temp_file_path = temp_file.name
-        
-        storage_client = storage.Client.from_service_account_json(temp_file_path)
-        # Clean up the temporary file
-        os.unlink(temp_file_path)
-        return storage_client
+        info = gcp_credentials.service_account_json
+        # private_key_id changes when the key is rotated, which gives the new key its own client.
+        cache_key = ("info", info.get("client_email"), info.get("private_key_id"), info.get("project_id"))
+
+        def build_client():
+            credentials = service_account.Credentials.from_service_account_info(info)
+            return storage.Client(project=info.get("project_id"), credentials=credentials)
+
+        return _client_cache.get_or_create(cache_key, build_client)
     else:
-        return storage.Client.from_service_account_json(os.getenv("GCP_SERVICE_ACCOUNT_FILE"))
+        service_account_file = os.getenv("GCP_SERVICE_ACCOUNT_FILE")
+        return _client_cache.get_or_create(
+            ("file", service_account_file),
+            lambda: storage.Client.from_service_account_json(service_account_file)
+        )
+
+def _storage_call(storage_client, operation: str, func, *args, **kwargs):
+    """Runs a Cloud Storage call under the project's rate limiter, counting and tracing it."""
+    # google-cloud-storage has no retry hooks for IAM calls, so they go through call_with_retries.
+    try:
+        with traced(f"gcp.storage.{operation}", service="storage", operation=operation):
+            result = call_with_retries(storage_client.project, "storage", func, *args, is_throttle=is_gcp_throttle, **kwargs)
+    except Exception:
+        record_api_call("gcp", "storage", operation, "error")
+        raise
+    record_api_call("gcp", "storage", operation)
+    return result
+
+
+def _count_buckets(gcp_credentials: Optional['GCPCredentials'] = None):
+    storage_client = get_gcp_client(gcp_credentials)
+    return _storage_call(storage_client, "list_buckets", lambda: sum(1 for _ in storage_client.list_buckets()))
+
+
+# Sizes of the collections controls loop over, for dry-run audit plans.
+GCP_RESOURCE_COUNTERS = {
+    "gcp:storage:buckets": _count_buckets,
+}
+
 
 def check_gcp_storage_public(gcp_credentials: Optional['GCPCredentials'] = None):
     """
@@ -28,7 +71,7 @@ def check_gcp_storage_public(gcp_credentials: Optional['GCPCredentials'] = None)
     """
     try:
         storage_client = get_gcp_client(gcp_credentials)
-        buckets = list(storage_client.list_buckets())
+        buckets = _storage_call(storage_client, "list_buckets", lambda: list(storage_client.list_buckets()))
         
         if not buckets:
             return {
@@ -37,12 +80,13 @@ def check_gcp_storage_public(gcp_credentials: Optional['GCPCredentials'] = None)
                 "evidence": []
             }
 
-        compliant_buckets = []
-        non_compliant_buckets = []
+        compliant_buckets: List[Finding] = []
+        non_compliant_buckets: List[Finding] = []
+        track_partial(compliant=compliant_buckets, non_compliant=non_compliant_buckets)
 
         for bucket in buckets:
             try:
-                policy = bucket.get_iam_policy(requested_policy_version=3)
+                policy = _storage_call(storage_client, "get_iam_policy", bucket.get_iam_policy, requested_policy_version=3)
                 is_public = False
                 public_roles = []
                 for binding in policy.bindings:
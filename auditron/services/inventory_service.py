@@ -0,0 +1,49 @@
+# services/inventory_service.py
+import threading
+from typing import Any, Callable, Dict, Hashable, Optional
+from services.deadline_service import DeadlineExceeded
+from services.tracing_service import traced
+
+
+class ResourceInventory:
+    """
+    Request-scoped store of resource collections shared by the controls of one audit run.
+
+    Each collection (e.g. "aws:rds:db_instances") is fetched at most once per region,
+    by whichever control asks for it first; the other controls wait for and reuse that result.
+    A failed fetch is remembered too, so a throttled list call is not retried by every control,
+    except when the loading control ran out of time: the next reader then loads the collection itself.
+    """
+
+    def __init__(self):
+        self._results: Dict[Hashable, tuple] = {}
+        self._locks: Dict[Hashable, threading.Lock] = {}
+        self._lock = threading.Lock()
+
+    def get(self, name: str, loader: Callable[[Any], Any], credentials: Any) -> Any:
+        key = (name, getattr(credentials, "region", None))
+        with self._lock:
+            collection_lock = self._locks.setdefault(key, threading.Lock())
+
+        with collection_lock:
+            if key not in self._results:
+                try:
+                    with traced("inventory.load", collection=name, region=key[1]):
+                        self._results[key] = (loader(credentials), None)
+                except DeadlineExceeded:
+                    # The loader's own deadline, not a property of the collection.
+                    raise
+                except Exception as e:
+                    self._results[key] = (None, e)
+
+        value, error = self._results[key]
+        if error is not None:
+            raise error
+        return value
+
+
+def load_collection(name: str, loader: Callable[[Any], Any], credentials: Any, inventory: Optional[ResourceInventory] = None) -> Any:
+    """Returns a resource collection from the audit's inventory, or loads it directly when running standalone."""
+    if inventory is None:
+        return loader(credentials)
+    return inventory.get(name, loader, credentials)
@@ -0,0 +1,243 @@
+# services/job_service.py
+import asyncio
+import json
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from typing import Any, Dict, List, Optional
+from models import AuditOptions, AuditResponse
+from services.audit_service_new import run_audit
+from services.offload_service import offload
+
+# --- Job Configuration ---
+# SQLite file shared by every uvicorn worker on the host, so job state survives client disconnects.
+JOB_DB_PATH = os.getenv("AUDITRON_JOB_DB", "auditron_jobs.sqlite3")
+# Audits run in the background at the same time, per process.
+JOB_WORKERS = int(os.getenv("AUDITRON_JOB_WORKERS", "4"))
+# Jobs waiting for a worker before new submissions are rejected.
+JOB_QUEUE_SIZE = int(os.getenv("AUDITRON_JOB_QUEUE_SIZE", "1000"))
+# Finished jobs are deleted this many seconds after they complete.
+JOB_RETENTION = int(os.getenv("AUDITRON_JOB_RETENTION", "86400"))
+# How often a running job checks whether it was cancelled (possibly from another worker process).
+JOB_CANCEL_POLL_INTERVAL = float(os.getenv("AUDITRON_JOB_CANCEL_POLL_INTERVAL", "1"))
+
+QUEUED, RUNNING, SUCCEEDED, FAILED, CANCELLED = "queued", "running", "succeeded", "failed", "cancelled"
+FINISHED_STATUSES = (SUCCEEDED, FAILED, CANCELLED)
+
+
+def _process_alive(pid: int) -> bool:
+    if pid == os.getpid():
+        return False  # This process is starting up, so it is not running any job yet
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+class JobQueueFull(Exception):
+    """Raised when a job is submitted while the queue is at JOB_QUEUE_SIZE."""
+
+
+class JobStore:
+    """SQLite-backed store of audit jobs and their results."""
+
+    def __init__(self, path: str = JOB_DB_PATH):
+        self._connection = sqlite3.connect(path, check_same_thread=False, timeout=30)
+        self._connection.row_factory = sqlite3.Row
+        self._lock = threading.Lock()
+        with self._lock, self._connection:
+            self._connection.execute("PRAGMA journal_mode=WAL")
+            self._connection.execute(
+                """
+                CREATE TABLE IF NOT EXISTS audit_jobs (
+                    job_id TEXT PRIMARY KEY,
+                    status TEXT NOT NULL,
+                    provider TEXT NOT NULL,
+                    user_id TEXT NOT NULL,
+                    controls TEXT NOT NULL,
+                    options TEXT NOT NULL,
+                    result TEXT,
+                    error TEXT,
+                    created_at REAL NOT NULL,
+                    started_at REAL,
+                    finished_at REAL,
+                    worker_pid INTEGER
+                )
+                """
+            )
+            columns = {row["name"] for row in self._connection.execute("PRAGMA table_info(audit_jobs)")}
+            if "worker_pid" not in columns:
+                self._connection.execute("ALTER TABLE audit_jobs ADD COLUMN worker_pid INTEGER")
+
+    def create(self, provider: str, controls: List[str], user_id: str, options: AuditOptions) -> str:
+        job_id = uuid.uuid4().hex
+        with self._lock, self._connection:
+            self._connection.execute(
+                "INSERT INTO audit_jobs (job_id, status, provider, user_id, controls, options, created_at) VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (job_id, QUEUED, provider, user_id, json.dumps(controls), options.model_dump_json(), time.time()),
+            )
+        return job_id
+
+    def get(self, job_id: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            row = self._connection.execute("SELECT * FROM audit_jobs WHERE job_id = ?", (job_id,)).fetchone()
+        return dict(row) if row else None
+
+    def mark_running(self, job_id: str) -> bool:
+        """Moves a queued job to running; returns False if it was cancelled while queued."""
+        with self._lock, self._connection:
+            cursor = self._connection.execute(
+                "UPDATE audit_jobs SET status = ?, started_at = ?, worker_pid = ? WHERE job_id = ? AND status = ?",
+                (RUNNING, time.time(), os.getpid(), job_id, QUEUED),
+            )
+        return cursor.rowcount == 1
+
+    def recover(self) -> List[str]:
+        """
+        Fails running jobs whose worker process has exited (e.g. a restart), and returns the ids of
+        queued jobs, oldest first, so they can be queued again. Jobs running in live sibling workers are left alone.
+        """
+        with self._lock, self._connection:
+            running = self._connection.execute(
+                "SELECT job_id, worker_pid FROM audit_jobs WHERE status = ?", (RUNNING,)
+            ).fetchall()
+            for row in running:
+                if row["worker_pid"] is None or not _process_alive(row["worker_pid"]):
+                    self._connection.execute(
+                        "UPDATE audit_jobs SET status = ?, error = ?, finished_at = ? WHERE job_id = ? AND status = ?",
+                        (FAILED, "Interrupted by a restart of the worker running it.", time.time(), row["job_id"], RUNNING),
+                    )
+            queued = self._connection.execute(
+                "SELECT job_id FROM audit_jobs WHERE status = ? ORDER BY created_at", (QUEUED,)
+            ).fetchall()
+        return [row["job_id"] for row in queued]
+
+    def finish(self, job_id: str, status: str, result: Optional[str] = None, error: Optional[str] = None):
+        # A job cancelled while running keeps its cancelled status.
+        with self._lock, self._connection:
+            self._connection.execute(
+                "UPDATE audit_jobs SET status = ?, result = ?, error = ?, finished_at = ? WHERE job_id = ? AND status = ?",
+                (status, result, error, time.time(), job_id, RUNNING),
+            )
+
+    def cancel(self, job_id: str) -> bool:
+        """Marks a queued or running job as cancelled; returns False if it had already finished."""
+        with self._lock, self._connection:
+            cursor = self._connection.execute(
+                "UPDATE audit_jobs SET status = ?, finished_at = ? WHERE job_id = ? AND status IN (?, ?)",
+                (CANCELLED, time.time(), job_id, QUEUED, RUNNING),
+            )
+        return cursor.rowcount == 1
+
+    def purge_expired(self) -> int:
+        with self._lock, self._connection:
+            cursor = self._connection.execute(
+                "DELETE FROM audit_jobs WHERE finished_at IS NOT NULL AND finished_at < ?",
+                (time.time() - JOB_RETENTION,),
+            )
+        return cursor.rowcount
+
+
+class JobManager:
+    """Queues audit jobs and runs them on a bounded pool of background worker tasks."""
+
+    def __init__(self, store: Optional[JobStore] = None, workers: int = JOB_WORKERS):
+        self._store = store
+        self._workers = workers
+        self._queue: Optional[asyncio.Queue] = None
+        self._worker_tasks: List[asyncio.Task] = []
+        self._running: Dict[str, asyncio.Task] = {}
+
+    @property
+    def store(self) -> JobStore:
+        # Opened on first use so importing the API does not create the database file.
+        if self._store is None:
+            self._store = JobStore()
+        return self._store
+
+    async def _ensure_workers(self):
+        if self._queue is None:
+            self._queue = asyncio.Queue(maxsize=JOB_QUEUE_SIZE)
+            # First start: pick up the jobs a previous run of this process left in the database.
+            for job_id in await offload(self.store.recover):
+                if self._queue.full():
+                    await offload(self.store.cancel, job_id)
+                    print(f"Audit job {job_id} could not be requeued after a restart: the queue is full.")
+                else:
+                    self._queue.put_nowait(job_id)
+        if not self._worker_tasks:
+            self._worker_tasks = [asyncio.create_task(self._worker()) for _ in range(self._workers)]
+
+    async def start(self):
+        """Starts the workers and recovers interrupted jobs; otherwise done on the first submission."""
+        await self._ensure_workers()
+
+    async def submit(self, provider: str, controls: List[str], user_id: str, options: AuditOptions) -> str:
+        await self._ensure_workers()
+        if self._queue.full():
+            raise JobQueueFull(f"The audit job queue is full ({JOB_QUEUE_SIZE} jobs waiting).")
+        job_id = await offload(self.store.create, provider, controls, user_id, options)
+        self._queue.put_nowait(job_id)
+        return job_id
+
+    async def get(self, job_id: str) -> Optional[Dict[str, Any]]:
+        return await offload(self.store.get, job_id)
+
+    async def cancel(self, job_id: str) -> bool:
+        cancelled = await offload(self.store.cancel, job_id)
+        task = self._running.get(job_id)
+        if cancelled and task:
+            task.cancel()
+        return cancelled
+
+    async def _worker(self):
+        while True:
+            job_id = await self._queue.get()
+            try:
+                await self._run_job(job_id)
+            except Exception as e:
+                print(f"Audit job {job_id} failed unexpectedly: {str(e)}")
+            finally:
+                self._queue.task_done()
+
+    async def _run_job(self, job_id: str):
+        if not await offload(self.store.mark_running, job_id):
+            return  # Cancelled while it was queued
+
+        job = await offload(self.store.get, job_id)
+        # Stored results outlive the in-process evidence store, so they keep every finding inline.
+        try:
+            options = AuditOptions.model_validate_json(job["options"]).model_copy(update={"full_evidence": True})
+        except ValueError as e:
+            # Jobs queued before a change to the options' validation fail instead of staying RUNNING.
+            await offload(self.store.finish, job_id, FAILED, None, f"Invalid job options: {str(e)}")
+            return
+        # Jobs exist for audits too long for a request, so only timeouts set on the job apply.
+        task = asyncio.create_task(run_audit(job["provider"], json.loads(job["controls"]), job["user_id"], options, deadlines=False))
+        self._running[job_id] = task
+        try:
+            # Poll for cancellations made through another worker process while the audit runs.
+            while not task.done():
+                await asyncio.wait({task}, timeout=JOB_CANCEL_POLL_INTERVAL)
+                if not task.done():
+                    current = await offload(self.store.get, job_id)
+                    if current and current["status"] == CANCELLED:
+                        task.cancel()
+            response: AuditResponse = task.result()
+            await offload(self.store.finish, job_id, SUCCEEDED, response.model_dump_json())
+        except asyncio.CancelledError:
+            if not task.cancelled():
+                raise  # The worker itself is shutting down
+        except Exception as e:
+            await offload(self.store.finish, job_id, FAILED, None, str(e))
+        finally:
+            self._running.pop(job_id, None)
+            await offload(self.store.purge_expired)
+
+
+job_manager = JobManager()
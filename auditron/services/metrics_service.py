@@ -0,0 +1,154 @@
+# services/metrics_service.py
+import contextvars
+import re
+import time
+from contextlib import contextmanager
+from typing import Dict, Iterator, Optional, Tuple
+from urllib.parse import urlparse
+from prometheus_client import CONTENT_TYPE_LATEST, Counter, Gauge, Histogram, REGISTRY, generate_latest
+from prometheus_client.core import CounterMetricFamily, GaugeMetricFamily
+from services.cache_service import TTLCache
+
+# Control latencies range from a single cached call to N+1 loops over thousands of resources.
+CONTROL_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300)
+
+CONTROL_DURATION = Histogram(
+    "auditron_control_duration_seconds", "Time to collect a control's evidence (cache hits excluded).",
+    ["provider", "control_id"], buckets=CONTROL_BUCKETS,
+)
+CONTROL_RESULTS = Counter(
+    "auditron_control_results_total", "Control results returned, by status and whether they came from the result cache.",
+    ["provider", "control_id", "status", "cached"],
+)
+CREDENTIAL_FETCH_DURATION = Histogram(
+    "auditron_credential_fetch_duration_seconds", "Time to fetch a user's credentials from Supabase (cache hits excluded).",
+    ["provider", "outcome"],
+)
+API_CALLS = Counter(
+    "auditron_cloud_api_calls_total", "Cloud API calls made by controls.",
+    ["provider", "service", "operation", "control_id", "outcome"],
+)
+AUDITS_IN_FLIGHT = Gauge("auditron_audits_in_flight", "Audits currently running.", ["provider"])
+
+# Set while a control runs, so SDK hooks in worker threads can label API calls with it.
+_current_control: contextvars.ContextVar[str] = contextvars.ContextVar("auditron_metrics_control", default="none")
+
+
+@contextmanager
+def control_scope(control_id: str) -> Iterator[None]:
+    token = _current_control.set(control_id)
+    try:
+        yield
+    finally:
+        _current_control.reset(token)
+
+
+def observe_control(provider: str, control_id: str, status: str, duration: Optional[float] = None, cached: bool = False):
+    """Records a returned result, and its collection time when it was not served from the cache."""
+    CONTROL_RESULTS.labels(provider, control_id, status, str(cached).lower()).inc()
+    if duration is not None:
+        CONTROL_DURATION.labels(provider, control_id).observe(duration)
+
+
+@contextmanager
+def audit_in_flight(provider: str) -> Iterator[None]:
+    gauge = AUDITS_IN_FLIGHT.labels(provider)
+    gauge.inc()
+    try:
+        yield
+    finally:
+        gauge.dec()
+
+
+@contextmanager
+def time_credential_fetch(provider: Optional[str]) -> Iterator[None]:
+    started = time.perf_counter()
+    outcome = "error"
+    try:
+        yield
+        outcome = "ok"
+    finally:
+        CREDENTIAL_FETCH_DURATION.labels(provider or "all", outcome).observe(time.perf_counter() - started)
+
+
+def record_api_call(provider: str, service: str, operation: str, outcome: str = "ok"):
+    API_CALLS.labels(provider, service, operation, _current_control.get(), outcome).inc()
+
+
+# --- SDK Hooks ---
+
+def register_aws_metrics(client):
+    """Counts every API call (not every retry attempt) made through a botocore client."""
+    service = client.meta.service_model.service_name
+
+    def after_call(model=None, parsed=None, **kwargs):
+        # after-call also fires for error responses (ClientError is raised afterwards).
+        outcome = "error" if (parsed or {}).get("Error") else "ok"
+        record_api_call("aws", service, model.name if model else "unknown", outcome)
+
+    def after_call_error(model=None, **kwargs):
+        record_api_call("aws", service, model.name if model else "unknown", "error")
+
+    client.meta.events.register("after-call", after_call)
+    client.meta.events.register("after-call-error", after_call_error)
+
+
+# Resource types from an ARM path, e.g. ".../providers/Microsoft.Sql/servers/s1/databases/d1" -> "Microsoft.Sql/servers/databases".
+_ARM_PROVIDER = re.compile(r"/providers/([^/]+)/(.*)$", re.IGNORECASE)
+
+
+def _arm_operation(method: str, path: str) -> str:
+    match = _ARM_PROVIDER.search(path)
+    if not match:
+        return method
+    namespace, rest = match.groups()
+    # Segments alternate type/name, so keeping every other one drops the (unbounded) resource names.
+    types = rest.split("/")[::2]
+    return f"{method} {namespace}/{'/'.join(types)}"
+
+
+def azure_metrics_policy(service: str):
+    """Builds a per-call pipeline policy counting each Azure management API call once, whatever its retries."""
+    from azure.core.pipeline.policies import SansIOHTTPPolicy
+
+    class MetricsPolicy(SansIOHTTPPolicy):
+        def on_response(self, request, response):
+            http_request = request.http_request
+            outcome = "ok" if response.http_response.status_code < 400 else "error"
+            record_api_call("azure", service, _arm_operation(http_request.method, urlparse(http_request.url).path), outcome)
+
+        def on_exception(self, request):
+            http_request = request.http_request
+            record_api_call("azure", service, _arm_operation(http_request.method, urlparse(http_request.url).path), "error")
+
+    return MetricsPolicy()
+
+
+# --- Cache Statistics ---
+
+_caches: Dict[str, TTLCache] = {}
+
+
+def register_cache(name: str, cache: TTLCache):
+    """Exposes a TTLCache's hits, misses and size as auditron_cache_* metrics."""
+    _caches[name] = cache
+
+
+class _CacheCollector:
+    def collect(self):
+        hits = CounterMetricFamily("auditron_cache_hits", "Cache lookups that found a live entry.", labels=["cache"])
+        misses = CounterMetricFamily("auditron_cache_misses", "Cache lookups that found no live entry.", labels=["cache"])
+        size = GaugeMetricFamily("auditron_cache_entries", "Entries currently held by the cache.", labels=["cache"])
+        for name, cache in _caches.items():
+            hits.add_metric([name], cache.hits)
+            misses.add_metric([name], cache.misses)
+            size.add_metric([name], len(cache))
+        return [hits, misses, size]
+
+
+REGISTRY.register(_CacheCollector())
+
+
+def metrics_payload() -> Tuple[bytes, str]:
+    """The Prometheus exposition of this process's metrics, and its content type."""
+    return generate_latest(REGISTRY), CONTENT_TYPE_LATEST
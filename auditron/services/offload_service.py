@@ -0,0 +1,30 @@
+# services/offload_service.py
+import asyncio
+import contextvars
+import functools
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+# Process-wide cap on blocking SDK work (control checks, credential lookups) running at once.
+MAX_CONTROL_WORKERS = int(os.getenv("AUDITRON_MAX_CONTROL_WORKERS", "32"))
+
+_sdk_executor = ThreadPoolExecutor(max_workers=MAX_CONTROL_WORKERS, thread_name_prefix="auditron-sdk")
+
+
+async def offload(func, *args, **kwargs):
+    """
+    Runs a blocking function on the dedicated SDK executor and awaits its result,
+    so synchronous boto3/azure-mgmt/google-cloud calls never block the event loop.
+    The caller's context variables are carried over to the worker thread.
+    """
+    loop = asyncio.get_running_loop()
+    context = contextvars.copy_context()
+    return await loop.run_in_executor(_sdk_executor, functools.partial(context.run, func, *args, **kwargs))
+
+
+def make_async(func):
+    """Wraps a synchronous control function into an awaitable one that runs on the SDK executor."""
+    @functools.wraps(func)
+    async def wrapper(*args, **kwargs):
+        return await offload(func, *args, **kwargs)
+    return wrapper
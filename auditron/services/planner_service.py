@@ -0,0 +1,68 @@
+# services/planner_service.py
+import math
+import os
+from typing import Dict, List, NamedTuple, Optional
+from controls import SUPPORTED_CONTROLS
+
+# --- Planner Configuration ---
+# Items assumed per resource collection when the real counts are unknown.
+PLANNER_DEFAULT_RESOURCES = int(os.getenv("AUDITRON_PLANNER_DEFAULT_RESOURCES", "100"))
+
+
+class AuditPlan(NamedTuple):
+    """The order an audit starts its controls in, and the shared collections to load up front."""
+    order: List[str]
+    prefetch: List[str]
+    estimated_calls: Dict[str, int]
+
+
+def estimate_calls(control: dict, resource_counts: Optional[Dict[str, int]] = None) -> int:
+    """A control's expected API calls from its declared "cost", given the number of items in each collection."""
+    resource_counts = resource_counts or {}
+    cost = control.get("cost", {})
+    calls = cost.get("calls", 1)
+    for collection, per_item in cost.get("per_resource", {}).items():
+        calls += per_item * resource_counts.get(collection, PLANNER_DEFAULT_RESOURCES)
+    for collection, page_size in cost.get("pages", {}).items():
+        calls += max(math.ceil(resource_counts.get(collection, PLANNER_DEFAULT_RESOURCES) / page_size) - 1, 0)
+    return calls
+
+
+def plan_audit(control_ids: List[str], resource_counts: Optional[Dict[str, int]] = None, multi_region: bool = False) -> AuditPlan:
+    """
+    Orders an audit's controls longest-first: the run is bounded by its slowest control, so N+1
+    checks start before cheap single-call ones fill the concurrency slots. Controls reading the same
+    shared collection are kept next to each other, behind the most expensive of them.
+
+    Collections read by more than one requested control are returned as prefetch, so the audit can
+    list them once as soon as it starts instead of when their first reader gets a slot. Regional
+    collections are left out of multi-region audits, where each region lists its own.
+    """
+    estimates = {
+        control_id: estimate_calls(SUPPORTED_CONTROLS[control_id], resource_counts)
+        for control_id in control_ids if control_id in SUPPORTED_CONTROLS
+    }
+
+    # A group is led by its most expensive control; the others sharing a collection follow it.
+    readers: Dict[str, List[str]] = {}
+    for control_id in sorted(estimates, key=lambda c: -estimates[c]):
+        for collection in SUPPORTED_CONTROLS[control_id].get("resources", []):
+            readers.setdefault(collection, []).append(control_id)
+
+    order: Dict[str, None] = {}
+    for control_id in sorted(estimates, key=lambda c: -estimates[c]):
+        order.setdefault(control_id)
+        for collection in SUPPORTED_CONTROLS[control_id].get("resources", []):
+            for reader in readers[collection]:
+                order.setdefault(reader)
+    # Unknown controls fail without calling anything, so their position does not matter.
+    for control_id in control_ids:
+        order.setdefault(control_id)
+
+    prefetch = [
+        collection for collection, collection_readers in readers.items()
+        if len(collection_readers) > 1 and not (
+            multi_region and any(SUPPORTED_CONTROLS[reader].get("scope") == "regional" for reader in collection_readers)
+        )
+    ]
+    return AuditPlan(order=list(order), prefetch=prefetch, estimated_calls=estimates)
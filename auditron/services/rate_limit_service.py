@@ -0,0 +1,210 @@
+# services/rate_limit_service.py
+import contextvars
+import os
+import random
+import threading
+import time
+from contextlib import contextmanager
+from typing import Callable, Iterator, Optional
+from services.cache_service import TTLCache
+from services.deadline_service import checkpoint
+
+# --- Rate Control Configuration ---
+# Requests per second allowed per (account, service) when no throttling has been seen.
+RATE_LIMIT_RPS = float(os.getenv("AUDITRON_RATE_LIMIT_RPS", "20"))
+# Requests that may be sent back to back before the rate applies.
+RATE_LIMIT_BURST = float(os.getenv("AUDITRON_RATE_LIMIT_BURST", "20"))
+# Floor the adaptive rate never drops below.
+RATE_LIMIT_MIN_RPS = float(os.getenv("AUDITRON_RATE_LIMIT_MIN_RPS", "1"))
+# Attempts per API call, including the first one.
+MAX_ATTEMPTS = int(os.getenv("AUDITRON_MAX_ATTEMPTS", "6"))
+BACKOFF_BASE = float(os.getenv("AUDITRON_BACKOFF_BASE", "0.5"))
+BACKOFF_MAX = float(os.getenv("AUDITRON_BACKOFF_MAX", "20"))
+
+
+class AdaptiveTokenBucket:
+    """
+    Token bucket whose refill rate adapts to throttling (AIMD): it is halved on every
+    throttling response and grows back by a small step with each successful call.
+    """
+
+    def __init__(self, rate: float = RATE_LIMIT_RPS, capacity: float = RATE_LIMIT_BURST):
+        self.max_rate = rate
+        self.rate = rate
+        self.capacity = capacity
+        self._tokens = capacity
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self, now: float):
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def acquire(self):
+        """Blocks the calling worker thread until a token is available."""
+        while True:
+            with self._lock:
+                self._refill(time.monotonic())
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                wait = (1 - self._tokens) / self.rate
+            time.sleep(wait)
+
+    def on_throttle(self):
+        with self._lock:
+            self.rate = max(RATE_LIMIT_MIN_RPS, self.rate / 2)
+            # Drop queued burst capacity so waiting callers slow down straight away.
+            self._tokens = min(self._tokens, 0)
+
+    def on_success(self):
+        with self._lock:
+            if self.rate < self.max_rate:
+                self.rate = min(self.max_rate, self.rate + self.max_rate * 0.05)
+
+
+_buckets = TTLCache(max_size=4096, ttl=3600, refresh_on_access=True)
+
+
+def get_bucket(account: str, service: str) -> AdaptiveTokenBucket:
+    """The shared token bucket for an (account, service) pair."""
+    return _buckets.get_or_create((account, service), AdaptiveTokenBucket)
+
+
+def backoff_delay(attempt: int) -> float:
+    """Exponential backoff with jitter for the given (1-based) retry attempt."""
+    return random.uniform(0.5, 1.0) * min(BACKOFF_MAX, BACKOFF_BASE * (2 ** (attempt - 1)))
+
+
+# --- Per-Control Retry Accounting ---
+
+class RetryCounter:
+    def __init__(self):
+        self.retries = 0
+        self.throttled = 0
+        self._lock = threading.Lock()
+
+    def add(self, retries: int = 1, throttled: int = 0):
+        with self._lock:
+            self.retries += retries
+            self.throttled += throttled
+
+
+# Set per control run; copied into the worker threads that make the SDK calls.
+_retry_counter: contextvars.ContextVar[Optional[RetryCounter]] = contextvars.ContextVar("auditron_retry_counter", default=None)
+
+
+@contextmanager
+def track_retries() -> Iterator[RetryCounter]:
+    """Counts the retries made by SDK calls inside the block, including those made from offloaded threads."""
+    counter = RetryCounter()
+    token = _retry_counter.set(counter)
+    try:
+        yield counter
+    finally:
+        _retry_counter.reset(token)
+
+
+def record_retries(retries: int = 1, throttled: int = 0):
+    counter = _retry_counter.get()
+    if counter is not None and (retries or throttled):
+        counter.add(retries, throttled)
+
+
+def call_with_retries(account: str, service: str, func: Callable, *args,
+                      is_throttle: Callable[[Exception], bool] = lambda e: False, **kwargs):
+    """
+    Calls func under the (account, service) token bucket, retrying throttling errors with
+    backoff. For SDKs without their own retry hooks (e.g. google-cloud-storage).
+    """
+    bucket = get_bucket(account, service)
+    for attempt in range(1, MAX_ATTEMPTS + 1):
+        checkpoint()
+        bucket.acquire()
+        try:
+            result = func(*args, **kwargs)
+        except Exception as e:
+            if not is_throttle(e) or attempt == MAX_ATTEMPTS:
+                raise
+            bucket.on_throttle()
+            record_retries(1, 1)
+            time.sleep(backoff_delay(attempt))
+            continue
+        bucket.on_success()
+        return result
+
+
+# --- AWS (botocore event hooks) ---
+
+AWS_THROTTLE_CODES = {
+    "Throttling", "ThrottlingException", "ThrottledException", "RequestThrottledException",
+    "TooManyRequestsException", "ProvisionedThroughputExceededException", "TransactionInProgressException",
+    "RequestLimitExceeded", "BandwidthLimitExceeded", "LimitExceededException", "RequestThrottled",
+    "SlowDown", "PriorRequestNotComplete", "EC2ThrottledException",
+}
+
+
+def register_aws_rate_control(client, account: str):
+    """Attaches the shared token bucket and retry accounting to a botocore client."""
+    bucket = get_bucket(account, client.meta.service_model.service_name)
+
+    def before_send(**kwargs):
+        # Fires once per attempt, including botocore's own retries.
+        checkpoint()
+        bucket.acquire()
+
+    def needs_retry(response=None, **kwargs):
+        parsed = response[1] if response else {}
+        if parsed.get("Error", {}).get("Code") in AWS_THROTTLE_CODES:
+            bucket.on_throttle()
+            record_retries(0, 1)
+        # None leaves the retry decision to botocore's retry handler.
+        return None
+
+    def after_call(parsed=None, **kwargs):
+        parsed = parsed or {}
+        # Also fires for error responses; only successful calls let the rate recover.
+        if not parsed.get("Error"):
+            bucket.on_success()
+        record_retries(parsed.get("ResponseMetadata", {}).get("RetryAttempts", 0))
+
+    def after_call_error(exception=None, **kwargs):
+        response = getattr(exception, "response", None) or {}
+        record_retries(response.get("ResponseMetadata", {}).get("RetryAttempts", 0))
+
+    client.meta.events.register("before-send", before_send)
+    client.meta.events.register("needs-retry", needs_retry)
+    client.meta.events.register("after-call", after_call)
+    client.meta.events.register("after-call-error", after_call_error)
+
+
+# --- Azure (pipeline policy) ---
+
+def azure_rate_control_policy(account: str, service: str):
+    """Builds a per-retry pipeline policy that applies the token bucket to every attempt."""
+    from azure.core.pipeline.policies import HTTPPolicy
+
+    class RateControlPolicy(HTTPPolicy):
+        def send(self, request):
+            bucket = get_bucket(account, service)
+            # The retry policy resends the same PipelineRequest, so its context counts the attempts.
+            attempt = request.context.get("auditron_attempt", 0) + 1
+            request.context["auditron_attempt"] = attempt
+            if attempt > 1:
+                record_retries(1)
+            checkpoint()
+            bucket.acquire()
+            response = self.next.send(request)
+            if response.http_response.status_code in (429, 503):
+                bucket.on_throttle()
+                record_retries(0, 1)
+            else:
+                bucket.on_success()
+            return response
+
+    return RateControlPolicy()
+
+
+def is_gcp_throttle(error: Exception) -> bool:
+    from google.api_core import exceptions
+    return isinstance(error, (exceptions.TooManyRequests, exceptions.ServiceUnavailable))
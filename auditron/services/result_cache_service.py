@@ -0,0 +1,108 @@
+# services/result_cache_service.py
+import hashlib
+import os
+import re
+import time
+from typing import Hashable, List, NamedTuple, Optional
+from models import AuditOptions, AuditResult
+from services.cache_service import TTLCache
+from services.metrics_service import register_cache
+
+# --- Result Cache Configuration ---
+RESULT_CACHE_SIZE = int(os.getenv("AUDITRON_RESULT_CACHE_SIZE", "4096"))
+# Freshness of a cached result for controls that do not declare their own "cache_ttl".
+DEFAULT_RESULT_TTL = int(os.getenv("AUDITRON_RESULT_TTL", "300"))
+# How long past its TTL a result is kept for stale-while-revalidate and max_age requests.
+RESULT_STALE_TTL = int(os.getenv("AUDITRON_RESULT_STALE_TTL", "900"))
+
+_result_cache = TTLCache(max_size=RESULT_CACHE_SIZE, ttl=DEFAULT_RESULT_TTL + RESULT_STALE_TTL)
+register_cache("results", _result_cache)
+
+
+class CachedResult(NamedTuple):
+    result: AuditResult
+    collected_at: float
+
+
+class CacheLookup(NamedTuple):
+    result: Optional[AuditResult]
+    # True when a stale result was served and should be refreshed in the background.
+    revalidate: bool
+
+
+def _hash(*parts) -> str:
+    return hashlib.sha256(":".join(str(part) for part in parts).encode()).hexdigest()
+
+
+def account_identity(provider: str, credentials) -> str:
+    """
+    Identifies the cloud account a set of credentials audits, without keeping any secret. The secret is
+    part of the hash: results are shared across users, so public IDs alone must not unlock them.
+    """
+    if provider == "aws":
+        return _hash(credentials.access_key_id, credentials.secret_access_key, credentials.region)
+    if provider == "azure":
+        return _hash(credentials.tenant_id, credentials.subscription_id, credentials.client_id, credentials.client_secret)
+    if provider == "gcp":
+        info = credentials.service_account_json
+        return _hash(info.get("project_id"), info.get("client_email"), info.get("private_key_id"), info.get("private_key"))
+    return _hash(provider, credentials)
+
+
+def control_version(control_id: str, control: dict) -> str:
+    """A control's declared "version", or the -V<n> suffix of its ID."""
+    if control.get("version"):
+        return str(control["version"])
+    match = re.search(r"-V(\d+)$", control_id)
+    return match.group(1) if match else "1"
+
+
+def control_ttl(control: dict) -> int:
+    return control.get("cache_ttl", DEFAULT_RESULT_TTL)
+
+
+def result_cache_key(provider: str, credentials, control_id: str, control: dict, regions: Optional[List[str]] = None) -> Hashable:
+    # Multi-region results of regional controls hold different evidence than single-region ones, so their regions
+    # are part of the key; global controls (S3, IAM) gather the same evidence whatever regions were requested.
+    regional = regions and control.get("scope") == "regional"
+    return (provider, account_identity(provider, credentials), control_id, control_version(control_id, control),
+            tuple(regions) if regional else None)
+
+
+def _with_age(result: AuditResult, collected_at: float, cached: bool) -> AuditResult:
+    return result.model_copy(update={
+        "cached": cached,
+        "collected_at": collected_at,
+        "evidence_age_seconds": round(time.time() - collected_at, 3),
+    })
+
+
+def get_cached_result(key: Hashable, control: dict, options: AuditOptions) -> CacheLookup:
+    """
+    Looks up a cached result. It is served when younger than the request's max_age (or the control's
+    TTL). An older one is only served, flagged for revalidation, when stale_while_revalidate is set.
+    """
+    if options.force_refresh:
+        return CacheLookup(None, False)
+
+    # Only results actually served count as hits; one too old for the request is a miss.
+    entry: Optional[CachedResult] = _result_cache.get(key, count=False)
+    if entry is None:
+        _result_cache.count_lookup(hit=False)
+        return CacheLookup(None, False)
+
+    max_age = options.max_age if options.max_age is not None else control_ttl(control)
+    fresh = time.time() - entry.collected_at <= max_age
+    served = fresh or options.stale_while_revalidate
+    _result_cache.count_lookup(hit=served)
+    if not served:
+        return CacheLookup(None, False)
+    return CacheLookup(_with_age(entry.result, entry.collected_at, cached=True), not fresh)
+
+
+def store_result(key: Hashable, control: dict, result: AuditResult) -> AuditResult:
+    """Caches a freshly collected result (errors and timeouts are not cached) and returns it with its age metadata."""
+    collected_at = time.time()
+    if result.status not in ("ERROR", "TIMEOUT"):
+        _result_cache.set(key, CachedResult(result, collected_at), ttl=control_ttl(control) + RESULT_STALE_TTL)
+    return _with_age(result, collected_at, cached=False)
@@ -0,0 +1,12 @@
+# services/serialization_service.py
+from typing import Any
+from pydantic_core import to_json
+
+
+def dumps(obj: Any) -> bytes:
+    """
+    Encodes obj as compact JSON with pydantic-core's Rust serializer. Models and dataclasses nested
+    anywhere inside obj are written straight from their fields, without being dumped to dicts first;
+    values it does not know how to encode fall back to str().
+    """
+    return to_json(obj, fallback=str)
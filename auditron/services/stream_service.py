@@ -0,0 +1,46 @@
+# services/stream_service.py
+from typing import AsyncIterator, List, Optional
+from models import AuditOptions
+from services.audit_service_new import iter_audit_results
+from services.serialization_service import dumps
+from services.tracing_service import finish_trace, start_trace
+
+STREAM_MEDIA_TYPES = {
+    "ndjson": "application/x-ndjson",
+    "sse": "text/event-stream",
+}
+
+
+def format_event(event: dict, stream_format: str) -> bytes:
+    """Encodes one audit event as an NDJSON line or a Server-Sent Event."""
+    data = dumps(event)
+    if stream_format == "sse":
+        return b"event: " + event["event"].encode() + b"\ndata: " + data + b"\n\n"
+    return data + b"\n"
+
+
+async def stream_audit_events(provider: str, requested_controls: List[str], user_id: str,
+                              options: Optional[AuditOptions] = None, stream_format: str = "ndjson") -> AsyncIterator[bytes]:
+    """
+    Streams an audit as it runs: a "start" event, then a "result" and a "progress" event
+    for each control as soon as it finishes, and an "end" event once every control is done
+    (carrying the audit's span tree when debug_trace is set).
+    """
+    options = options or AuditOptions()
+    total = len(requested_controls)
+    yield format_event({"event": "start", "provider": provider, "total": total}, stream_format)
+
+    completed = 0
+    trace = start_trace("audit", options.debug_trace, provider=provider, controls=total, streamed=True)
+    try:
+        async for index, result in iter_audit_results(provider, requested_controls, user_id, options, trace=trace):
+            completed += 1
+            yield format_event({"event": "result", "index": index, "result": result}, stream_format)
+            yield format_event({"event": "progress", "completed": completed, "total": total}, stream_format)
+    finally:
+        finish_trace(trace)
+
+    end = {"event": "end", "provider": provider, "total": total}
+    if options.debug_trace and trace is not None:
+        end["trace"] = trace.to_dict()
+    yield format_event(end, stream_format)
@@ -1,73 +1,119 @@
 # services/supabase_service.py
 import os
-from supabase import create_client, Client
-from typing import Optional, Dict, Any
+import threading
+from typing import TYPE_CHECKING, Optional, Dict, Any
 import json
+from services.cache_service import TTLCache
+from services.metrics_service import register_cache, time_credential_fetch
+from services.tracing_service import traced
 
-def get_supabase_client() -> Client:
-    """Create and return Supabase client."""
-    url = os.getenv("SUPABASE_URL")
-    key = os.getenv("SUPABASE_SERVICE_ROLE_KEY")
-    
-    if not url or not key:
-        raise ValueError("SUPABASE_URL and SUPABASE_SERVICE_ROLE_KEY must be set in environment variables")
-    
-    return create_client(url, key)
-
-def get_user_credentials(user_id: str) -> Dict[str, Any]:
+if TYPE_CHECKING:
+    # The SDK itself is only imported on first use, by get_supabase_client().
+    from supabase import Client
+
+PROVIDERS = ("aws", "azure", "gcp")
+
+# --- Credential Cache Configuration ---
+# Kept short so credentials saved from the app are picked up quickly even without invalidation.
+CREDENTIAL_CACHE_TTL = int(os.getenv("AUDITRON_CREDENTIAL_CACHE_TTL", "30"))
+CREDENTIAL_CACHE_SIZE = int(os.getenv("AUDITRON_CREDENTIAL_CACHE_SIZE", "1024"))
+
+# Keyed by (user_id, provider); provider is None for lookups of all providers.
+_credential_cache = TTLCache(max_size=CREDENTIAL_CACHE_SIZE, ttl=CREDENTIAL_CACHE_TTL)
+register_cache("credentials", _credential_cache)
+
+_supabase_client: Optional['Client'] = None
+_supabase_client_lock = threading.Lock()
+
+
+def get_supabase_client() -> 'Client':
+    """Return the shared Supabase client, creating it (and importing the SDK) on first use."""
+    global _supabase_client
+    if _supabase_client is not None:
+        return _supabase_client
+
+    with _supabase_client_lock:
+        if _supabase_client is None:
+            url = os.getenv("SUPABASE_URL")
+            key = os.getenv("SUPABASE_SERVICE_ROLE_KEY")
+
+            if not url or not key:
+                raise ValueError("SUPABASE_URL and SUPABASE_SERVICE_ROLE_KEY must be set in environment variables")
+
+            from supabase import create_client
+            _supabase_client = create_client(url, key)
+    return _supabase_client
+
+
+def invalidate_user_credentials(user_id: str) -> int:
+    """Drop every cached credential lookup for a user, e.g. after they update their credentials."""
+    return _credential_cache.pop_matching(lambda key: key[0] == user_id)
+
+
+def _empty_credentials() -> Dict[str, Any]:
+    return {f'{provider}_credentials': None for provider in PROVIDERS}
+
+
+def _fetch_user_credentials(user_id: str, provider: Optional[str] = None) -> Dict[str, Any]:
+    """Query Supabase for the user's credentials, selecting only the requested provider's column."""
+    supabase = get_supabase_client()
+
+    providers = (provider,) if provider else PROVIDERS
+    columns = ",".join(f'{p}_credentials' for p in providers)
+
+    # Query credentials table for the user
+    response = supabase.table('credentials').select(columns).eq('user_id', user_id).execute()
+
+    credentials = _empty_credentials()
+    if not response.data:
+        return credentials
+
+    # Get the first (and should be only) credential record
+    cred_data = response.data[0]
+
+    # Parse AWS credentials
+    if cred_data.get('aws_credentials'):
+        credentials['aws_credentials'] = cred_data['aws_credentials']
+
+    # Parse Azure credentials
+    if cred_data.get('azure_credentials'):
+        credentials['azure_credentials'] = cred_data['azure_credentials']
+
+    # Parse GCP credentials
+    if cred_data.get('gcp_credentials'):
+        gcp_creds = cred_data['gcp_credentials']
+        # If it's stored as a string, parse it
+        if isinstance(gcp_creds.get('service_account_json'), str):
+            try:
+                gcp_creds['service_account_json'] = json.loads(gcp_creds['service_account_json'])
+            except json.JSONDecodeError:
+                print(f"Warning: Invalid JSON in GCP credentials for user {user_id}")
+                gcp_creds = None
+        credentials['gcp_credentials'] = gcp_creds
+
+    return credentials
+
+
+def get_user_credentials(user_id: str, provider: Optional[str] = None) -> Dict[str, Any]:
     """
-    Fetch user credentials from Supabase.
+    Fetch user credentials from Supabase, served from a short-lived in-memory cache when possible.
     Returns a dictionary with aws_credentials, azure_credentials, and gcp_credentials.
+    When provider is given, only that provider's credentials are fetched; the others are None.
     """
+    # A cached lookup of all providers also answers a single-provider request.
+    cache_keys = [(user_id, provider)] + ([(user_id, None)] if provider else [])
+    for cache_key in cache_keys:
+        cached = _credential_cache.get(cache_key)
+        if cached is not None:
+            return dict(cached)
+
     try:
-        supabase = get_supabase_client()
-                
-        # Query credentials table for the user
-        response = supabase.table('credentials').select('*').eq('user_id', user_id).execute()
-        
-        if not response.data:
-            return {
-                'aws_credentials': None,
-                'azure_credentials': None,
-                'gcp_credentials': None
-            }
-                    
-        # Get the first (and should be only) credential record
-        cred_data = response.data[0]
-        
-        # Parse the stored credentials
-        credentials = {
-            'aws_credentials': None,
-            'azure_credentials': None,
-            'gcp_credentials': None
-        }
-        
-        # Parse AWS credentials
-        if cred_data.get('aws_credentials'):
-            credentials['aws_credentials'] = cred_data['aws_credentials']
-        
-        # Parse Azure credentials
-        if cred_data.get('azure_credentials'):
-            credentials['azure_credentials'] = cred_data['azure_credentials']
-        
-        # Parse GCP credentials
-        if cred_data.get('gcp_credentials'):
-            gcp_creds = cred_data['gcp_credentials']
-            # If it's stored as a string, parse it
-            if isinstance(gcp_creds.get('service_account_json'), str):
-                try:
-                    gcp_creds['service_account_json'] = json.loads(gcp_creds['service_account_json'])
-                except json.JSONDecodeError:
-                    print(f"Warning: Invalid JSON in GCP credentials for user {user_id}")
-                    gcp_creds = None
-            credentials['gcp_credentials'] = gcp_creds
-        
-        return credentials
-        
+        with time_credential_fetch(provider), traced("supabase.get_user_credentials", provider=provider or "all"):
+            credentials = _fetch_user_credentials(user_id, provider)
     except Exception as e:
+        # Failed lookups are not cached, so the next request retries the database.
         print(f"Error fetching credentials for user {user_id}: {str(e)}")
-        return {
-            'aws_credentials': None,
-            'azure_credentials': None,
-            'gcp_credentials': None
-        }
+        return _empty_credentials()
+
+    _credential_cache.set((user_id, provider), credentials)
+    return dict(credentials)
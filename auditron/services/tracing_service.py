@@ -0,0 +1,231 @@
+# services/tracing_service.py
+import contextvars
+import json
+import os
+import random
+import threading
+import time
+import urllib.request
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from typing import Any, Dict, Iterator, List, Optional
+
+# --- Tracing Configuration ---
+# Where finished audit traces go: "none", "file" (JSON lines in AUDITRON_TRACE_FILE) or
+# "http" (each trace POSTed as JSON to AUDITRON_TRACE_COLLECTOR_URL).
+TRACE_EXPORT = os.getenv("AUDITRON_TRACE_EXPORT", "none")
+TRACE_FILE = os.getenv("AUDITRON_TRACE_FILE", "auditron_traces.jsonl")
+TRACE_COLLECTOR_URL = os.getenv("AUDITRON_TRACE_COLLECTOR_URL", "")
+# Fraction of audits traced and exported when TRACE_EXPORT is set (debug_trace requests are always traced).
+TRACE_SAMPLE_RATE = float(os.getenv("AUDITRON_TRACE_SAMPLE_RATE", "1.0"))
+# Spans kept per trace; further spans are only counted, so huge accounts cannot blow up memory.
+TRACE_MAX_SPANS = int(os.getenv("AUDITRON_TRACE_MAX_SPANS", "10000"))
+
+# Exports run off the event loop, one at a time so file writes never interleave.
+_export_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="auditron-trace-export")
+
+
+class _Trace:
+    """State shared by every span of one trace."""
+
+    def __init__(self):
+        self.trace_id = uuid.uuid4().hex
+        self.span_count = 0
+        self.dropped_spans = 0
+        self.lock = threading.Lock()
+
+
+class Span:
+    """A timed operation in an audit's span tree. Child spans may be added from worker threads."""
+
+    __slots__ = ("name", "span_id", "parent_id", "attributes", "children", "started_at", "_trace", "_started", "_duration")
+
+    def __init__(self, name: str, trace: _Trace, parent: Optional["Span"] = None, attributes: Optional[dict] = None):
+        self.name = name
+        self.span_id = uuid.uuid4().hex[:16]
+        self.parent_id = parent.span_id if parent else None
+        self.attributes = dict(attributes or {})
+        self.children: List[Span] = []
+        self.started_at = time.time()
+        self._trace = trace
+        self._started = time.perf_counter()
+        self._duration: Optional[float] = None
+
+    @property
+    def trace_id(self) -> str:
+        return self._trace.trace_id
+
+    def set(self, **attributes):
+        self.attributes.update(attributes)
+
+    def end(self, **attributes):
+        self.attributes.update(attributes)
+        if self._duration is None:
+            self._duration = time.perf_counter() - self._started
+
+    def child(self, name: str, attributes: Optional[dict] = None) -> Optional["Span"]:
+        with self._trace.lock:
+            if self._trace.span_count >= TRACE_MAX_SPANS:
+                self._trace.dropped_spans += 1
+                return None
+            self._trace.span_count += 1
+            span = Span(name, self._trace, self, attributes)
+            self.children.append(span)
+        return span
+
+    def to_dict(self) -> Dict[str, Any]:
+        with self._trace.lock:
+            children = list(self.children)
+        data = {
+            "name": self.name,
+            "span_id": self.span_id,
+            "parent_id": self.parent_id,
+            "started_at": self.started_at,
+            "duration_ms": None if self._duration is None else round(self._duration * 1000, 3),
+            "attributes": self.attributes,
+            "children": [child.to_dict() for child in children],
+        }
+        if self.parent_id is None:
+            data["trace_id"] = self.trace_id
+            data["dropped_spans"] = self._trace.dropped_spans
+        return data
+
+
+# The span new child spans attach to; copied into worker threads along with the rest of the context.
+_current_span: contextvars.ContextVar[Optional[Span]] = contextvars.ContextVar("auditron_current_span", default=None)
+
+
+def current_span() -> Optional[Span]:
+    return _current_span.get()
+
+
+def start_trace(name: str, debug: bool = False, **attributes) -> Optional[Span]:
+    """
+    Starts an audit-level span: a child of the active span when there is one, otherwise a new
+    trace root if exports are enabled (and the audit is sampled) or debug is requested.
+    Returns None when the audit is not traced. Pair with finish_trace().
+    """
+    parent = _current_span.get()
+    if parent is not None:
+        return parent.child(name, attributes)
+    if debug or (TRACE_EXPORT != "none" and random.random() < TRACE_SAMPLE_RATE):
+        trace = _Trace()
+        trace.span_count = 1
+        return Span(name, trace, None, attributes)
+    return None
+
+
+def start_span(name: str, **attributes) -> Optional[Span]:
+    """Starts a child of the active span, or returns None when nothing is being traced."""
+    parent = _current_span.get()
+    return parent.child(name, attributes) if parent is not None else None
+
+
+@contextmanager
+def use_span(span: Optional[Span]) -> Iterator[Optional[Span]]:
+    """Makes span the parent of spans started inside the block; None detaches the block from any trace."""
+    token = _current_span.set(span)
+    try:
+        yield span
+    finally:
+        _current_span.reset(token)
+
+
+@contextmanager
+def traced(name: str, **attributes) -> Iterator[Optional[Span]]:
+    """Runs the block in a child span of the active span; yields None when nothing is being traced."""
+    span = start_span(name, **attributes)
+    if span is None:
+        yield None
+        return
+    token = _current_span.set(span)
+    try:
+        yield span
+    except BaseException as e:
+        span.set(error=type(e).__name__)
+        raise
+    finally:
+        _current_span.reset(token)
+        span.end()
+
+
+def finish_trace(span: Optional[Span], **attributes):
+    """Ends an audit-level span; a trace root is also handed to the configured exporter."""
+    if span is None:
+        return
+    span.end(**attributes)
+    if span.parent_id is None and TRACE_EXPORT != "none":
+        _export_executor.submit(_export, span.to_dict())
+
+
+def _export(trace: Dict[str, Any]):
+    try:
+        payload = json.dumps(trace, default=str)
+        if TRACE_EXPORT == "file":
+            with open(TRACE_FILE, "a") as f:
+                f.write(payload + "\n")
+        elif TRACE_EXPORT == "http" and TRACE_COLLECTOR_URL:
+            request = urllib.request.Request(TRACE_COLLECTOR_URL, data=payload.encode(),
+                                             headers={"Content-Type": "application/json"}, method="POST")
+            urllib.request.urlopen(request, timeout=5).close()
+    except Exception as e:
+        print(f"Error exporting trace {trace.get('trace_id')}: {str(e)}")
+
+
+# --- SDK Hooks ---
+
+def register_aws_tracing(client):
+    """Records one span per botocore API call, with its retry attempts and outcome."""
+    service = client.meta.service_model.service_name
+
+    # before-parameter-build fires for every call; before-call is skipped when a stubbed response short-circuits it.
+    def before_call(model=None, context=None, **kwargs):
+        span = start_span(f"aws.{service}.{model.name}", service=service, operation=model.name)
+        if span is not None and context is not None:
+            context["auditron_span"] = span
+
+    def before_send(context=None, **kwargs):
+        span = (context or {}).get("auditron_span")
+        if span is not None:
+            span.set(attempts=span.attributes.get("attempts", 0) + 1)
+
+    def after_call(parsed=None, context=None, **kwargs):
+        span = (context or {}).get("auditron_span")
+        if span is not None:
+            error = (parsed or {}).get("Error", {}).get("Code")
+            span.end(**({"error": error} if error else {}))
+
+    def after_call_error(exception=None, context=None, **kwargs):
+        span = (context or {}).get("auditron_span")
+        if span is not None:
+            span.end(error=type(exception).__name__)
+
+    client.meta.events.register("before-parameter-build", before_call)
+    client.meta.events.register("before-send", before_send)
+    client.meta.events.register("after-call", after_call)
+    client.meta.events.register("after-call-error", after_call_error)
+
+
+def azure_tracing_policy(service: str):
+    """Builds a per-call pipeline policy recording one span per Azure management API call."""
+    from azure.core.pipeline.policies import SansIOHTTPPolicy
+
+    class TracingPolicy(SansIOHTTPPolicy):
+        def on_request(self, request):
+            http_request = request.http_request
+            span = start_span(f"azure.{service}", method=http_request.method, url=http_request.url.split("?")[0])
+            if span is not None:
+                request.context["auditron_span"] = span
+
+        def on_response(self, request, response):
+            span = request.context.get("auditron_span")
+            if span is not None:
+                span.end(status_code=response.http_response.status_code)
+
+        def on_exception(self, request):
+            span = request.context.get("auditron_span")
+            if span is not None:
+                span.end(error="exception")
+
+    return TracingPolicy()
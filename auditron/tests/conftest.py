@@ -0,0 +1,37 @@
+# tests/conftest.py
+import copy
+import os
+import sys
+import uuid
+
+import pytest
+
+# Tests import the app the way it runs, from the auditron directory (models, services.x, ...).
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks.control_benchmark import CREDENTIALS_DATA  # noqa: E402
+from benchmarks.fakes import CallRecorder, SyntheticAccount, fake_clouds  # noqa: E402
+
+
+@pytest.fixture
+def recorder():
+    return CallRecorder()
+
+
+@pytest.fixture
+def fake_account(recorder):
+    """A 20-resource synthetic account (every 4th resource non-compliant) behind every provider's clients."""
+    account = SyntheticAccount(20, non_compliant_every=4)
+    with fake_clouds(account, recorder):
+        yield account
+
+
+@pytest.fixture
+def credentials_data():
+    """The benchmark credentials, with account IDs unique to the test so cached results never leak between tests."""
+    data = copy.deepcopy(CREDENTIALS_DATA)
+    unique = uuid.uuid4().hex
+    data["aws_credentials"]["access_key_id"] = unique
+    data["azure_credentials"]["tenant_id"] = unique
+    data["gcp_credentials"]["service_account_json"]["project_id"] = unique
+    return data
@@ -0,0 +1,107 @@
+# tests/test_audit_service.py
+import asyncio
+from unittest import mock
+
+import pytest
+from pydantic import ValidationError
+
+import services.audit_service_new as audit_service
+from models import AuditOptions, AWSCredentials
+from benchmarks.fakes import CallRecorder, SyntheticAccount, fake_clouds
+from services.audit_service_new import resolve_regions, run_audit
+
+# Both RDS controls read aws:rds:db_instances, so the planner prefetches it.
+RDS_CONTROLS = ["AWS-RDS-PUBLIC-ACCESS-V1", "AWS-RDS-STORAGE-ENCRYPTION-V1", "AWS-S3-PUBLIC-ACCESS-V1"]
+
+
+def test_prefetches_stay_within_max_concurrency(fake_account, credentials_data):
+    in_flight = 0
+    peak = 0
+    execute_control = audit_service._execute_control
+    offload = audit_service.offload
+
+    async def tracked(coroutine):
+        nonlocal in_flight, peak
+        in_flight += 1
+        peak = max(peak, in_flight)
+        try:
+            await asyncio.sleep(0.01)
+            return await coroutine
+        finally:
+            in_flight -= 1
+
+    async def tracked_offload(function, *args):
+        # Inventory loads are prefetches; other offloads (credentials, SDK import) happen before any control runs.
+        if getattr(function, "__name__", None) == "get":
+            return await tracked(offload(function, *args))
+        return await offload(function, *args)
+
+    with mock.patch.object(audit_service, "_execute_control", lambda *args: tracked(execute_control(*args))), \
+            mock.patch.object(audit_service, "offload", tracked_offload):
+        response = asyncio.run(run_audit("aws", RDS_CONTROLS, "user", AuditOptions(max_concurrency=1), credentials_data))
+
+    assert [result.control_id for result in response.results] == RDS_CONTROLS
+    assert all(result.status in ("SUCCESS", "FAILURE") for result in response.results)
+    assert peak == 1
+
+
+def test_regions_are_deduplicated():
+    options = AuditOptions(regions=["us-east-1", "eu-west-1", "US-EAST-1 "])
+    assert options.regions == ["us-east-1", "eu-west-1"]
+    credentials = AWSCredentials(access_key_id="key", secret_access_key="secret", region="us-east-1")
+    assert asyncio.run(resolve_regions(credentials, options)) == ["us-east-1", "eu-west-1"]
+
+
+@pytest.mark.parametrize("regions", [["all", "us-east-1"], ["us-east-1", "not a region"], ["useast1"]])
+def test_invalid_regions_are_rejected(regions):
+    with pytest.raises(ValidationError):
+        AuditOptions(regions=regions)
+
+
+def test_default_deadlines_apply_to_interactive_audits_only(credentials_data, monkeypatch):
+    monkeypatch.setattr(audit_service, "CONTROL_TIMEOUT", 0.05)
+    monkeypatch.setattr(audit_service, "AUDIT_TIMEOUT", 0.05)
+    controls = ["AWS-S3-PUBLIC-ACCESS-V1"]
+
+    def audit(options, deadlines):
+        # 20 buckets at 10ms per API call outlast the 50ms defaults.
+        with fake_clouds(SyntheticAccount(20, non_compliant_every=4), CallRecorder(latency=0.01)):
+            return asyncio.run(run_audit("aws", controls, "user", options, credentials_data, deadlines=deadlines)).results[0]
+
+    assert audit(AuditOptions(force_refresh=True), deadlines=True).status == "TIMEOUT"
+    assert audit(AuditOptions(force_refresh=True), deadlines=False).status == "FAILURE"
+    # Timeouts the caller sets still apply to background runs.
+    assert audit(AuditOptions(force_refresh=True, control_timeout=0.05), deadlines=False).status == "TIMEOUT"
+
+
+def test_revalidations_are_bounded_and_share_the_audits_inventory(fake_account, credentials_data, recorder, monkeypatch):
+    monkeypatch.setattr(audit_service, "REVALIDATION_CONCURRENCY", 1)
+    controls = RDS_CONTROLS[:2]
+    in_flight = 0
+    peak = 0
+    execute_control = audit_service._execute_control
+
+    async def tracked(*args):
+        nonlocal in_flight, peak
+        in_flight += 1
+        peak = max(peak, in_flight)
+        try:
+            await asyncio.sleep(0.01)
+            return await execute_control(*args)
+        finally:
+            in_flight -= 1
+
+    async def audit_then_revalidate():
+        await run_audit("aws", controls, "user", AuditOptions(), credentials_data)
+        listings = recorder.calls["rds.describe_db_instances"]
+        with mock.patch.object(audit_service, "_execute_control", tracked):
+            stale = AuditOptions(max_age=0, stale_while_revalidate=True)
+            response = await run_audit("aws", controls, "user", stale, credentials_data)
+            await asyncio.gather(*list(audit_service._revalidations.values()))
+        return response, recorder.calls["rds.describe_db_instances"] - listings
+
+    response, listings = asyncio.run(audit_then_revalidate())
+    assert all(result.cached for result in response.results)
+    assert peak == 1
+    # Both refreshes read the instances from the inventory of the audit that triggered them.
+    assert listings == 1
@@ -0,0 +1,46 @@
+# tests/test_aws_service.py
+from unittest import mock
+
+import pytest
+from botocore.exceptions import ClientError
+
+from benchmarks.fakes import SyntheticAccount, fake_clouds
+from services.audit_service_new import provider_credentials
+from services.aws_service import check_iam_mfa_console
+
+
+@pytest.fixture
+def iam_account(recorder):
+    """Every 3rd user fails, so non-compliant users both with and without a console password are covered."""
+    account = SyntheticAccount(30, non_compliant_every=3)
+    with fake_clouds(account, recorder):
+        yield account
+
+
+def test_iam_mfa_engines_give_the_same_verdicts(iam_account, credentials_data, recorder):
+    credentials = provider_credentials("aws", credentials_data)
+
+    per_user = check_iam_mfa_console(credentials, engine="per_user")
+    assert recorder.calls["iam.get_login_profile"] == 30
+    report = check_iam_mfa_console(credentials, engine="credential_report")
+    assert recorder.calls["iam.get_credential_report"] == 1
+
+    assert per_user["status"] == "FAILURE"
+    assert per_user == report
+    # Users 0, 6, 12, ... have a console password and no MFA; 3, 9, ... have no password, so they pass.
+    assert [user["user_name"] for user in report["evidence"]["non_compliant_users"]] == [f"user-{i}" for i in range(0, 30, 6)]
+
+
+def test_iam_mfa_falls_back_to_per_user_calls_without_report_access(iam_account, credentials_data, recorder):
+    credentials = provider_credentials("aws", credentials_data)
+    per_user = check_iam_mfa_console(credentials, engine="per_user")
+    calls = recorder.calls["iam.get_login_profile"]
+
+    def generate_credential_report(**kwargs):
+        raise ClientError({"Error": {"Code": "AccessDenied", "Message": "Access denied"}}, "GenerateCredentialReport")
+
+    with mock.patch.object(iam_account, "aws_iam_generate_credential_report", generate_credential_report):
+        fallback = check_iam_mfa_console(credentials, engine="credential_report")
+
+    assert recorder.calls["iam.get_login_profile"] == calls + 30
+    assert fallback == per_user
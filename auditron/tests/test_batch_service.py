@@ -0,0 +1,45 @@
+# tests/test_batch_service.py
+import asyncio
+from unittest import mock
+
+import services.batch_service as batch_service
+from models import AuditOptions, BatchAuditItem
+from services.batch_service import iter_batch_audit
+
+CONTROLS = ["AWS-S3-PUBLIC-ACCESS-V1", "AWS-EBS-ENCRYPTION-V1"]
+
+
+def _collect(items):
+    async def run():
+        return [record async for record in iter_batch_audit(items, AuditOptions())]
+    return asyncio.run(run())
+
+
+def test_malformed_credentials_fail_only_their_own_unit(fake_account, credentials_data):
+    malformed = {"aws_credentials": {"access_key_id": "key", "secret_access_key": "secret"}}  # no region
+    stored = {"good": credentials_data, "bad": malformed}
+    items = [BatchAuditItem(user_id=user_id, controls=CONTROLS) for user_id in ("bad", "good")]
+
+    with mock.patch.object(batch_service, "get_user_credentials", lambda user_id, provider=None: stored[user_id]):
+        records = {record["user_id"]: record for record in _collect(items)}
+
+    assert set(records) == {"bad", "good"}
+    bad = records["bad"]["results"]
+    assert [result.control_id for result in bad] == CONTROLS
+    assert all(result.status == "ERROR" and result.evidence == {"error": "credential_fetch_failed"} for result in bad)
+    assert all(result.status == "FAILURE" for result in records["good"]["results"])
+
+
+def test_credential_lookup_errors_fail_only_their_own_unit(fake_account, credentials_data):
+    def get_user_credentials(user_id, provider=None):
+        if user_id == "down":
+            raise RuntimeError("Supabase unavailable")
+        return credentials_data
+
+    items = [BatchAuditItem(user_id=user_id, controls=CONTROLS) for user_id in ("down", "good")]
+    with mock.patch.object(batch_service, "get_user_credentials", get_user_credentials):
+        records = {record["user_id"]: record for record in _collect(items)}
+
+    assert {result.status for result in records["down"]["results"]} == {"ERROR"}
+    assert "Supabase unavailable" in records["down"]["results"][0].summary
+    assert all(result.status == "FAILURE" for result in records["good"]["results"])
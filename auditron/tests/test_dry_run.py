@@ -0,0 +1,51 @@
+# tests/test_dry_run.py
+import asyncio
+import threading
+import time
+from unittest import mock
+
+import services.dry_run_service as dry_run_service
+from models import AuditOptions
+from services.aws_service import AWS_RESOURCE_COUNTERS
+from services.dry_run_service import plan_audit_dry_run
+
+CONTROLS = ["AWS-S3-PUBLIC-ACCESS-V1", "AWS-EBS-ENCRYPTION-V1", "AWS-EBS-SNAPSHOT-PUBLIC-V1", "AWS-VPC-SG-RESTRICTED-SSH-V1"]
+
+
+def test_credential_errors_become_per_control_plan_errors(fake_account):
+    malformed = {"aws_credentials": {"access_key_id": "key", "secret_access_key": "secret"}}  # no region
+    plan = asyncio.run(plan_audit_dry_run("aws", CONTROLS + ["GCP-STORAGE-PUBLIC-V1"], "user", AuditOptions(), malformed))
+
+    assert [control.error for control in plan.controls] == ["credential_fetch_failed"] * len(CONTROLS) + ["unsupported_control"]
+    assert plan.estimated_calls == 0
+
+
+def test_resource_counts_respect_max_concurrency(fake_account, credentials_data):
+    in_flight = peak = 0
+    lock = threading.Lock()
+    offload = dry_run_service.offload
+
+    def slow(counter):
+        def count(credentials):
+            nonlocal in_flight, peak
+            with lock:
+                in_flight += 1
+                peak = max(peak, in_flight)
+            time.sleep(0.01)
+            with lock:
+                in_flight -= 1
+            return counter(credentials)
+        return count
+
+    async def tracked_offload(function, *args):
+        if function in AWS_RESOURCE_COUNTERS.values():
+            function = slow(function)
+        return await offload(function, *args)
+
+    options = AuditOptions(max_concurrency=1, regions=["us-east-1", "eu-west-1", "us-west-2"])
+    with mock.patch.object(dry_run_service, "offload", tracked_offload):
+        plan = asyncio.run(plan_audit_dry_run("aws", CONTROLS, "user", options, credentials_data))
+
+    assert all(control.error is None for control in plan.controls)
+    assert peak == 1
+    assert plan.regions == ["us-east-1", "eu-west-1", "us-west-2"]
@@ -0,0 +1,110 @@
+# tests/test_evidence_service.py
+import asyncio
+
+import pytest
+
+import services.evidence_service as evidence_service
+from models import AuditOptions
+from services.audit_service_new import run_audit
+from services.evidence_service import get_evidence_page
+
+S3_CONTROL = "AWS-S3-PUBLIC-ACCESS-V1"
+EBS_CONTROL = "AWS-EBS-ENCRYPTION-V1"
+
+
+def _audit(credentials_data, controls, **options):
+    return asyncio.run(run_audit("aws", controls, "user", AuditOptions(**options), credentials_data)).results
+
+
+def _page_all(evidence_id, status="all", limit=None):
+    findings, cursor, pages = [], None, 0
+    while True:
+        # A cursor carries its own status.
+        page = get_evidence_page(evidence_id, cursor=cursor, limit=limit, status=status)
+        findings += page.findings
+        pages += 1
+        cursor = page.next_cursor
+        if cursor is None:
+            return findings, pages
+
+
+def test_responses_carry_the_first_page_and_counts(fake_account, credentials_data, monkeypatch):
+    monkeypatch.setattr(evidence_service, "EVIDENCE_PAGE_SIZE", 2)
+    evidence = _audit(credentials_data, [S3_CONTROL])[0].evidence
+
+    # 20 buckets, every 4th non-compliant.
+    assert (evidence["non_compliant_count"], evidence["compliant_count"]) == (5, 15)
+    assert [finding["bucket_name"] for finding in evidence["non_compliant"]] == ["bucket-0", "bucket-4"]
+    assert evidence["evidence_id"] and evidence["next_cursor"]
+
+    page = get_evidence_page(evidence["evidence_id"], cursor=evidence["next_cursor"])
+    assert page.status == "non_compliant"
+    assert [finding["bucket_name"] for finding in page.findings] == ["bucket-8", "bucket-12"]
+
+
+def test_cursors_page_across_the_non_compliant_and_compliant_findings(fake_account, credentials_data):
+    evidence_id = _audit(credentials_data, [S3_CONTROL])[0].evidence["evidence_id"]
+
+    # Pages of 3 straddle the split after the 5 non-compliant findings.
+    findings, pages = _page_all(evidence_id, limit=3)
+    assert pages == 7
+    assert len(findings) == 20
+    assert all("reason" in finding for finding in findings[:5])
+    assert not any("reason" in finding for finding in findings[5:])
+    assert len({finding["bucket_name"] for finding in findings}) == 20
+
+    non_compliant, _ = _page_all(evidence_id, status="non_compliant", limit=3)
+    compliant, _ = _page_all(evidence_id, status="compliant", limit=3)
+    assert non_compliant == findings[:5]
+    assert compliant == findings[5:]
+    assert get_evidence_page(evidence_id, status="compliant", limit=100).total == 15
+
+
+def test_invalid_paging_requests(fake_account, credentials_data):
+    evidence_id = _audit(credentials_data, [S3_CONTROL])[0].evidence["evidence_id"]
+
+    for kwargs in ({"cursor": "not-a-cursor"}, {"status": "failing"}, {"limit": 0},
+                   {"limit": evidence_service.EVIDENCE_MAX_PAGE_SIZE + 1}):
+        with pytest.raises(ValueError):
+            get_evidence_page(evidence_id, **kwargs)
+    assert get_evidence_page("unknown") is None
+
+
+def test_multi_region_findings_are_tagged_with_their_region(fake_account, credentials_data):
+    evidence = _audit(credentials_data, [EBS_CONTROL], regions=["us-east-1", "eu-west-1"])[0].evidence
+
+    assert (evidence["non_compliant_count"], evidence["compliant_count"]) == (10, 30)
+    assert set(evidence["regions"]) == {"us-east-1", "eu-west-1"}
+    findings, _ = _page_all(evidence["evidence_id"], limit=7)
+    assert len(findings) == 40
+    for region in ("us-east-1", "eu-west-1"):
+        assert sum(finding["region"] == region for finding in findings) == 20
+
+
+def test_full_evidence_is_returned_inline(fake_account, credentials_data):
+    evidence = _audit(credentials_data, [S3_CONTROL], full_evidence=True)[0].evidence
+    assert "evidence_id" not in evidence
+    # FAILURE evidence counts the compliant resources without listing them.
+    assert evidence == {"compliant_count": 15, "non_compliant_buckets": evidence["non_compliant_buckets"]}
+    assert len(evidence["non_compliant_buckets"]) == 5
+
+
+def test_withheld_compliant_findings_are_paged_from_cached_results(fake_account, credentials_data):
+    first = _audit(credentials_data, [S3_CONTROL])[0]
+    cached = _audit(credentials_data, [S3_CONTROL])[0]
+
+    assert cached.cached is True
+    assert cached.evidence["compliant_count"] == 15
+    assert cached.evidence["evidence_id"] == first.evidence["evidence_id"]
+    findings, _ = _page_all(cached.evidence["evidence_id"], status="compliant")
+    assert len(findings) == 15
+
+
+def test_count_only_evidence_from_other_providers_is_paged(fake_account, credentials_data):
+    result = asyncio.run(run_audit("azure", ["AZURE-STORAGE-HTTPS-V1"], "user", AuditOptions(), credentials_data)).results[0]
+    evidence = result.evidence
+
+    assert result.status == "FAILURE"
+    assert "compliant" not in evidence
+    assert (evidence["non_compliant_count"], evidence["compliant_count"]) == (5, 15)
+    assert get_evidence_page(evidence["evidence_id"], status="compliant").total == 15
@@ -0,0 +1,39 @@
+# tests/test_inventory.py
+import pytest
+
+from services.deadline_service import DeadlineExceeded, checkpoint, control_deadline
+from services.inventory_service import ResourceInventory
+
+
+def test_a_readers_deadline_is_not_cached_for_other_readers():
+    inventory = ResourceInventory()
+    loads = []
+
+    def loader(credentials):
+        checkpoint()
+        loads.append(credentials)
+        return ["bucket-0"]
+
+    with control_deadline() as deadline:
+        deadline.expire()
+        with pytest.raises(DeadlineExceeded):
+            inventory.get("aws:s3:buckets", loader, None)
+
+    # Another control, within its own deadline, loads the collection itself.
+    assert inventory.get("aws:s3:buckets", loader, None) == ["bucket-0"]
+    assert inventory.get("aws:s3:buckets", loader, None) == ["bucket-0"]
+    assert len(loads) == 1
+
+
+def test_other_load_errors_are_shared():
+    inventory = ResourceInventory()
+    calls = []
+
+    def loader(credentials):
+        calls.append(credentials)
+        raise RuntimeError("Throttling")
+
+    for _ in range(2):
+        with pytest.raises(RuntimeError):
+            inventory.get("aws:s3:buckets", loader, None)
+    assert len(calls) == 1
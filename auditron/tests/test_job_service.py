@@ -0,0 +1,50 @@
+# tests/test_job_service.py
+import asyncio
+import os
+import subprocess
+import sys
+from unittest import mock
+
+import services.job_service as job_service
+from models import AuditOptions, AuditResponse
+from services.job_service import FAILED, RUNNING, SUCCEEDED, JobManager, JobStore
+
+
+def _exited_pid() -> int:
+    process = subprocess.Popen([sys.executable, "-c", "pass"])
+    process.wait()
+    return process.pid
+
+
+def test_restart_requeues_queued_jobs_and_fails_interrupted_ones(tmp_path):
+    store = JobStore(str(tmp_path / "jobs.sqlite3"))
+    interrupted = store.create("aws", ["AWS-S3-PUBLIC-ACCESS-V1"], "user", AuditOptions())
+    store.mark_running(interrupted)
+    store._connection.execute("UPDATE audit_jobs SET worker_pid = ? WHERE job_id = ?", (_exited_pid(), interrupted))
+    sibling = store.create("aws", ["AWS-S3-PUBLIC-ACCESS-V1"], "user", AuditOptions())
+    store.mark_running(sibling)
+    store._connection.execute("UPDATE audit_jobs SET worker_pid = ? WHERE job_id = ?", (os.getppid(), sibling))
+    queued = store.create("aws", ["AWS-S3-PUBLIC-ACCESS-V1"], "user", AuditOptions())
+
+    async def run_audit(provider, controls, user_id, options, deadlines=True):
+        assert deadlines is False
+        return AuditResponse(provider=provider, results=[])
+
+    async def restart():
+        manager = JobManager(store, workers=1)
+        await manager.start()
+        for _ in range(100):
+            if store.get(queued)["status"] == SUCCEEDED:
+                break
+            await asyncio.sleep(0.01)
+        for task in manager._worker_tasks:
+            task.cancel()
+
+    with mock.patch.object(job_service, "run_audit", run_audit):
+        asyncio.run(restart())
+
+    assert store.get(interrupted)["status"] == FAILED
+    assert "restart" in store.get(interrupted)["error"]
+    # A job running in a live worker process is not touched.
+    assert store.get(sibling)["status"] == RUNNING
+    assert store.get(queued)["status"] == SUCCEEDED
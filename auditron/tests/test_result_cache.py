@@ -0,0 +1,84 @@
+# tests/test_result_cache.py
+import asyncio
+import copy
+
+import pytest
+
+import services.result_cache_service as result_cache_service
+from models import AuditOptions, AuditResult
+from services.audit_service_new import provider_credentials, run_audit
+from services.result_cache_service import account_identity, get_cached_result, result_cache_key, store_result
+
+SECRETS = {
+    "aws": ("aws_credentials", lambda creds, secret: creds.update(secret_access_key=secret)),
+    "azure": ("azure_credentials", lambda creds, secret: creds.update(client_secret=secret)),
+    "gcp": ("gcp_credentials", lambda creds, secret: creds["service_account_json"].update(private_key_id=secret, private_key=secret)),
+}
+CONTROLS = {"aws": "AWS-S3-PUBLIC-ACCESS-V1", "azure": "AZURE-STORAGE-HTTPS-V1", "gcp": "GCP-STORAGE-PUBLIC-V1"}
+
+
+def _with_secret(credentials_data, provider, secret):
+    data = copy.deepcopy(credentials_data)
+    key, set_secret = SECRETS[provider]
+    set_secret(data[key], secret)
+    return data
+
+
+@pytest.mark.parametrize("provider", sorted(SECRETS))
+def test_account_identity_includes_the_secret(provider, credentials_data):
+    first = provider_credentials(provider, _with_secret(credentials_data, provider, "secret-1"))
+    second = provider_credentials(provider, _with_secret(credentials_data, provider, "secret-2"))
+    assert account_identity(provider, first) != account_identity(provider, second)
+    assert account_identity(provider, first) == account_identity(provider, copy.deepcopy(first))
+
+
+@pytest.mark.parametrize("provider", sorted(SECRETS))
+def test_credentials_differing_only_in_secret_do_not_share_cached_results(provider, credentials_data, fake_account, recorder):
+    control_id = CONTROLS[provider]
+
+    def audit(secret):
+        data = _with_secret(credentials_data, provider, secret)
+        return asyncio.run(run_audit(provider, [control_id], "user", AuditOptions(), data)).results[0]
+
+    owner = audit("right-secret")
+    calls = recorder.total
+    assert owner.cached is False
+
+    # Same public IDs, other secret: the audit must run against the cloud again, not reuse the owner's result.
+    other = audit("wrong-secret")
+    assert other.cached is False
+    assert recorder.total > calls
+
+    # The owner's own credentials still hit the cache.
+    assert audit("right-secret").cached is True
+
+
+def test_results_too_old_for_the_request_count_as_misses():
+    cache = result_cache_service._result_cache
+    control = {"cache_ttl": 300}
+    key = ("aws", "hit-accounting", "AWS-S3-PUBLIC-ACCESS-V1")
+    store_result(key, control, AuditResult(control_id="AWS-S3-PUBLIC-ACCESS-V1", status="SUCCESS", summary="ok", evidence={}))
+    hits, misses = cache.hits, cache.misses
+
+    assert get_cached_result(key, control, AuditOptions(max_age=0)).result is None
+    assert (cache.hits, cache.misses) == (hits, misses + 1)
+
+    assert get_cached_result(key, control, AuditOptions(max_age=0, stale_while_revalidate=True)).revalidate is True
+    assert get_cached_result(key, control, AuditOptions()).result is not None
+    assert (cache.hits, cache.misses) == (hits + 2, misses + 1)
+
+    assert get_cached_result(("aws", "no-such-account"), control, AuditOptions()).result is None
+    assert (cache.hits, cache.misses) == (hits + 2, misses + 2)
+
+
+def test_only_regional_controls_are_keyed_by_region(credentials_data):
+    credentials = provider_credentials("aws", credentials_data)
+    regional = {"scope": "regional"}
+    global_ = {"scope": "global"}
+
+    def key(control, regions):
+        return result_cache_key("aws", credentials, "AWS-CONTROL-V1", control, regions)
+
+    assert key(global_, ["us-east-1", "eu-west-1"]) == key(global_, None)
+    assert key(regional, ["us-east-1", "eu-west-1"]) != key(regional, None)
+    assert key(regional, ["us-east-1", "eu-west-1"]) != key(regional, ["us-east-1"])